@@ -0,0 +1,174 @@
+"""
+Admission control for LoveTrack+.
+
+RateLimiter is an in-process token bucket per (budget, key): each route
+spends from a named budget for the client's IP and, where the request
+names one, its auth_id, and is refused with 429 once any of them runs dry.
+
+AdmissionMiddleware sheds load before it reaches MongoDB: while too many
+/api requests are in flight, or a request has been waiting longer than a
+threshold for a pooled connection (as seen by PoolWaitMonitor), new
+requests get 503 with Retry-After instead of queueing behind the rest.
+
+Both are per process; with several workers the effective limits scale
+with the worker count.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+import json
+import threading
+import time
+
+from pymongo import monitoring
+
+from metrics import ADMISSION_REJECTIONS
+
+
+@dataclass(frozen=True)
+class RateBudget:
+    rate: float  # tokens refilled per second
+    burst: float  # bucket capacity
+
+
+class RateLimiter:
+    def __init__(self, budgets: Dict[str, RateBudget], max_keys: int = 100_000):
+        self.budgets = budgets
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[str, str], Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, budget_name: str, keys: Iterable[str], cost: float = 1.0) -> float:
+        """
+        Spend cost from every key's bucket, or from none of them. Returns 0 on
+        success, otherwise the seconds until the emptiest bucket could pay.
+        Costs above the burst are capped, so a large batch drains the bucket.
+        """
+        budget = self.budgets[budget_name]
+        cost = min(cost, budget.burst)
+        now = time.monotonic()
+
+        levels = []
+        for key in keys:
+            tokens, updated = self._buckets.pop((budget_name, key), (budget.burst, now))
+            levels.append(((budget_name, key), min(budget.burst, tokens + (now - updated) * budget.rate)))
+
+        shortfall = max((cost - tokens for _, tokens in levels), default=0.0)
+        spent = cost if shortfall <= 0 else 0.0
+        for bucket, tokens in levels:
+            self._buckets[bucket] = (tokens - spent, now)
+        # Buckets untouched the longest are full again by now, most likely
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return 0.0 if shortfall <= 0 else shortfall / budget.rate
+
+
+class PoolWaitMonitor(monitoring.ConnectionPoolListener):
+    """Tracks how long operations currently waiting for a pooled connection have waited"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Check-out start and end are reported on the thread doing the check-out
+        self._waiting: Dict[int, float] = {}
+
+    def longest_wait(self) -> float:
+        with self._lock:
+            if not self._waiting:
+                return 0.0
+            return time.monotonic() - min(self._waiting.values())
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._waiting[threading.get_ident()] = time.monotonic()
+
+    def _check_out_done(self):
+        with self._lock:
+            self._waiting.pop(threading.get_ident(), None)
+
+    def connection_checked_out(self, event):
+        self._check_out_done()
+
+    def connection_check_out_failed(self, event):
+        self._check_out_done()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware answering 503 while the process is overloaded"""
+
+    def __init__(
+        self,
+        app,
+        max_in_flight: int,
+        max_pool_wait: float,
+        pool_monitor: Optional[PoolWaitMonitor] = None,
+        retry_after: int = 1,
+        exempt_suffixes: Tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.pool_monitor = pool_monitor
+        self.retry_after = retry_after
+        self.exempt_suffixes = exempt_suffixes
+        self.in_flight = 0
+
+    def _overloaded(self) -> Optional[str]:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.pool_monitor and self.max_pool_wait and self.pool_monitor.longest_wait() > self.max_pool_wait:
+            return "pool_wait"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        # Only API requests are shed; ops endpoints and long-lived streams pass
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api") or path.endswith(self.exempt_suffixes):
+            await self.app(scope, receive, send)
+            return
+
+        reason = self._overloaded()
+        if reason:
+            ADMISSION_REJECTIONS.labels(reason).inc()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": json.dumps({"detail": "Server overloaded, retry later"}).encode(),
+            })
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
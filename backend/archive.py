@@ -0,0 +1,231 @@
+"""
+Cold archival of past events into per-couple, per-month buckets.
+
+With ARCHIVE_ENABLED, EventArchiver periodically moves each couple's
+events older than ARCHIVE_AFTER_DAYS out of `events` into
+`event_archive`, one document per couple and month:
+
+    {couple_id, month, events: [...event documents sorted by (date, id)]}
+
+so `events` and its indexes only hold the recent and upcoming months the
+app mostly shows. Every couple records an `archived_until` horizon: only
+events dated before it can be in the archive, so reads of later ranges
+never touch it. The horizon is advanced one run before the events behind
+it are moved, which leaves every worker's cached copy of the couple
+(CoupleCache ttl) time to see it first.
+
+Every worker runs an archiver, so a run takes a lease on each couple
+(`archive_lease` on the couple document) before archiving it, and skips
+couples another worker holds. A lease expires after `lease`, so a worker
+dying mid-run doesn't hold a couple back for longer.
+
+Reads before the horizon merge both tiers; a document present in both
+(left by an interrupted run, or restored and edited) is taken from
+`events`. Writes to an archived event restore it into `events` first,
+and the next run archives it again. Turning ARCHIVE_ENABLED off only
+stops the runs: archived events are still read and restored.
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import logging
+import uuid
+
+from pymongo import DeleteOne
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sort_key(event: Dict[str, Any]):
+    return event["date"], event["id"]
+
+
+def merge_tiers(hot: List[Dict[str, Any]], cold: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge (date, id) ordered events of both tiers, preferring hot copies"""
+    hot_ids = {event["id"] for event in hot}
+    return sorted(hot + [event for event in cold if event["id"] not in hot_ids], key=_sort_key)
+
+
+async def merge_streams(hot: AsyncIterator[Dict[str, Any]], cold: AsyncIterator[Dict[str, Any]]):
+    """Merge two (date, id) ordered event streams, dropping cold duplicates of hot events"""
+    hot_event = await anext(hot, None)
+    cold_event = await anext(cold, None)
+    while hot_event is not None or cold_event is not None:
+        if cold_event is None or (hot_event is not None and _sort_key(hot_event) <= _sort_key(cold_event)):
+            if cold_event is not None and cold_event["id"] == hot_event["id"]:
+                cold_event = await anext(cold, None)
+            yield hot_event
+            hot_event = await anext(hot, None)
+        else:
+            yield cold_event
+            cold_event = await anext(cold, None)
+
+
+def cold_events_pipeline(
+    couple_id: str,
+    event_query: Dict[str, Any],
+    archived_until: datetime,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Aggregation over the couple's buckets covering [date_from, date_to),
+    yielding their events matching event_query in (date, id) order
+    """
+    months: Dict[str, Any] = {"$lt": archived_until}
+    if date_from:
+        months["$gte"] = month_start(date_from)
+    if date_to:
+        months["$lt"] = min(date_to, archived_until)
+    pipeline = [
+        {"$match": {"couple_id": couple_id, "month": months}},
+        {"$sort": {"month": 1}},
+        {"$unwind": "$events"},
+        {"$replaceRoot": {"newRoot": "$events"}},
+    ]
+    if event_query:
+        pipeline.append({"$match": event_query})
+    pipeline.append({"$sort": {"date": 1, "id": 1}})
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    return pipeline
+
+
+async def find_archived_event(db, event_id: str) -> Optional[Dict[str, Any]]:
+    bucket = await db.event_archive.find_one(
+        {"events.id": event_id},
+        {"events": {"$elemMatch": {"id": event_id}}}
+    )
+    return bucket["events"][0] if bucket and bucket.get("events") else None
+
+
+async def restore_events(db, event_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Move archived events back into `events` so they can be written to.
+    Returns the restored events by id. The hot copy is written before the
+    archived one is removed, so an interruption only leaves a duplicate.
+    """
+    if not event_ids:
+        return {}
+    wanted = set(event_ids)
+    restored = {}
+    async for bucket in db.event_archive.find({"events.id": {"$in": event_ids}}):
+        events = [event for event in bucket["events"] if event["id"] in wanted]
+        for event in events:
+            await db.events.update_one({"id": event["id"]}, {"$setOnInsert": event}, upsert=True)
+            restored[event["id"]] = event
+        await db.event_archive.update_one(
+            {"_id": bucket["_id"]},
+            {"$pull": {"events": {"id": {"$in": [event["id"] for event in events]}}}}
+        )
+    return restored
+
+
+class EventArchiver:
+    def __init__(
+        self,
+        db,
+        archive_after: timedelta,
+        interval: timedelta = timedelta(hours=6),
+        lease: timedelta = timedelta(minutes=15),
+    ):
+        self.db = db
+        self.archive_after = archive_after
+        self.interval = interval
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+
+    async def archive(self) -> int:
+        """Archive events behind each couple's horizon, then advance the horizons"""
+        cutoff = month_start(datetime.utcnow() - self.archive_after)
+        archived = 0
+        async for couple in self.db.couples.find({}, {"id": 1}):
+            owner = str(uuid.uuid4())
+            leased = await self._acquire(couple["id"], owner)
+            if leased is None:
+                continue
+            try:
+                horizon = leased.get("archived_until")
+                if horizon:
+                    archived += await self.archive_couple(couple["id"], horizon)
+                if horizon is None or horizon < cutoff:
+                    await self.db.couples.update_one({"id": couple["id"]}, {"$set": {"archived_until": cutoff}})
+            finally:
+                await self.db.couples.update_one(
+                    {"id": couple["id"], "archive_lease.owner": owner},
+                    {"$unset": {"archive_lease": ""}}
+                )
+        if archived:
+            logger.info(f"Archived {archived} events")
+        return archived
+
+    async def _acquire(self, couple_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Lease a couple for archiving, returning its horizon, or None while another run holds it"""
+        now = datetime.utcnow()
+        return await self.db.couples.find_one_and_update(
+            {"id": couple_id, "$or": [{"archive_lease": None}, {"archive_lease.expires": {"$lt": now}}]},
+            {"$set": {"archive_lease": {"owner": owner, "expires": now + self.lease}}},
+            projection={"archived_until": 1}
+        )
+
+    async def archive_couple(self, couple_id: str, horizon: datetime) -> int:
+        # Served by the couple_id_date_id index. Recurring series and their
+        # overrides stay hot, as reads expand them from `events` alone.
+        events = await self.db.events.find(
+            {"couple_id": couple_id, "date": {"$lt": horizon}, "recurrence": None, "recurrence_id": None}
+        ).sort([("date", 1), ("id", 1)]).to_list(None)
+        if not events:
+            return 0
+
+        for month, month_events in groupby(events, key=lambda event: month_start(event["date"])):
+            month_events = [{key: value for key, value in event.items() if key != "_id"} for event in month_events]
+            bucket = {"couple_id": couple_id, "month": month}
+            # Drop copies an interrupted run left behind, then append in order
+            await self.db.event_archive.update_one(
+                bucket,
+                {"$pull": {"events": {"id": {"$in": [event["id"] for event in month_events]}}}},
+                upsert=True
+            )
+            await self.db.event_archive.update_one(
+                bucket,
+                {"$push": {"events": {"$each": month_events, "$sort": {"date": 1, "id": 1}}}}
+            )
+
+        # An event edited meanwhile keeps its newer hot copy, which reads prefer
+        result = await self.db.events.bulk_write(
+            [DeleteOne({"id": event["id"], "updated_at": event["updated_at"]}) for event in events],
+            ordered=False
+        )
+        return result.deleted_count
+
+    async def is_archived(self, event_id: str) -> bool:
+        return await self.db.event_archive.find_one({"events.id": event_id}, {"_id": 1}) is not None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.archive()
+            except Exception:
+                logger.exception("Event archival failed")
+            await asyncio.sleep(self.interval.total_seconds())
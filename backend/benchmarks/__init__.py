@@ -0,0 +1,19 @@
+"""
+Benchmarks for the LoveTrack+ backend; see each module for how to run it.
+
+Benchmarks that drive the app in-process point it at BENCH_DB_NAME, never
+at the database named by DB_NAME (which may be the real one when the
+deployment's environment is exported), and only ever drop that database.
+"""
+BENCH_DB_NAME = "lovetrack_bench"
+
+
+def use_bench_database(server) -> None:
+    """Point the app's lifespan at the benchmark database"""
+    server.db_name = BENCH_DB_NAME
+
+
+async def drop_bench_database(client, name: str) -> None:
+    if name != BENCH_DB_NAME:
+        raise RuntimeError(f"Refusing to drop {name!r}: benchmarks only drop {BENCH_DB_NAME!r}")
+    await client.drop_database(name)
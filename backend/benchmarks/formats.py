@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of the response formats negotiated by negotiation.py.
+
+Encodes synthetic stored event documents as a get_events response in each
+format a client can negotiate, JSON or MessagePack, each as is, gzipped
+and brotli-compressed, with the levels the middleware uses by default.
+Prints the payload size of each and the median time to encode it
+(serializing, then compressing). MessagePack is transcoded from the JSON
+body as the middleware does it; "msgpack (direct)" packs the documents
+without JSON, formatting datetimes in a Python callback, for comparison.
+No database is needed, and the formats are checked to decode to the same
+events first.
+
+    cd backend && python -m benchmarks.formats
+"""
+import statistics
+import time
+import zlib
+
+import msgpack
+import orjson
+
+import server
+from benchmarks.serialization import make_events
+from negotiation import transcode
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def gzip_compress(body: bytes) -> bytes:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def brotli_compress(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def pack_directly(events) -> bytes:
+    documents = [server.event_serializer.to_dict(event) for event in events]
+    return msgpack.packb(documents, default=lambda value: value.isoformat())
+
+
+def encoders(events):
+    serializer = server.event_serializer
+    formats = {
+        "json": lambda: serializer.dumps_many(events),
+        "msgpack": lambda: transcode(serializer.dumps_many(events)),
+        "msgpack (direct)": lambda: pack_directly(events),
+    }
+    codings = {"": lambda body: body, "+gzip": gzip_compress}
+    if brotli is not None:
+        codings["+br"] = brotli_compress
+    for name, encode in formats.items():
+        for suffix, compress in codings.items():
+            yield name + suffix, lambda encode=encode, compress=compress: compress(encode())
+
+
+def timed(encode, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    if brotli is None:
+        print("Brotli is not installed, skipping the brotli formats")
+    for count in (100, 1_000, 10_000):
+        events = make_events(count)
+        body = server.event_serializer.dumps_many(events)
+        assert msgpack.unpackb(transcode(body)) == msgpack.unpackb(pack_directly(events)) == orjson.loads(body), \
+            "formats differ"
+        repeat = 20 if count <= 1_000 else 5
+        json_size = len(body)
+        print(f"\n{count} events")
+        print(f"{'format':>22} {'bytes':>10} {'vs json':>8} {'encode ms':>10}")
+        for name, encode in encoders(events):
+            size = len(encode())
+            print(f"{name:>22} {size:>10} {size / json_size:>7.1%} {timed(encode, repeat) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Concurrent load test and latency benchmark for the LoveTrack+ API.
+
+Many async clients run a weighted mix of realistic sessions against the
+app in-process (default; uses the throwaway benchmark database on
+MONGO_URL, see benchmarks/__init__.py), the app in-process over an
+in-memory mongomock database (--in-memory, no mongod needed), or a
+running server (--url, e.g. a local uvicorn + mongod):
+
+    onboarding  create two users, a couple, and join it
+    browse      open the dashboard and page through calendar months
+    edit        create, reschedule and delete events
+
+Throughput and p50/p95/p99 latency are reported per route. Results can be
+stored as a baseline and later runs compared against it; a run whose p95
+regresses (or throughput drops) by more than --tolerance exits non-zero.
+Runs are only compared with a baseline of the same target, clients, mix
+and --sessions, which fixes the work each client does so runs are
+comparable regardless of how fast they go. The committed
+baselines/load-in-memory.json covers the app's own request handling on
+the write and single-event routes. The list and calendar reads are left
+out of in-memory comparisons, and so is throughput: under concurrency
+their latency is mongomock blocking the event loop (a p95 of a second),
+which would hide any regression of the app's own. Those are compared
+against a baseline recorded against mongod with --save-baseline on the
+reference machine.
+
+    cd backend && python -m benchmarks.load --clients 50 --duration 30
+    cd backend && python -m benchmarks.load --in-memory --clients 10 --sessions 25
+    cd backend && python -m benchmarks.load --save-baseline
+"""
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+from benchmarks import drop_bench_database, use_bench_database
+
+BASELINES = Path(__file__).parent / "baselines"
+DEFAULT_MIX = "onboarding=1,browse=6,edit=3"
+# p95 changes smaller than this are jitter, however large relatively
+MIN_REGRESSION_MS = 5.0
+# A run is only compared with a baseline recorded with the same settings
+BASELINE_SETTINGS = ("target", "clients", "mix", "sessions")
+# Routes whose --in-memory latency measures mongomock, not the app
+IN_MEMORY_UNCOMPARED = ("GET /couples/{couple_id}", "GET /events", "GET /events (month page)")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """Collects per-route latencies and failures"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+            return None
+        return response
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies.get(route, [])
+            routes[route] = {
+                "requests": len(samples),
+                "errors": self.errors.get(route, 0),
+                "rps": len(samples) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            }
+        return routes
+
+
+class Session:
+    """One simulated client with its own user and couple"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.couple_id: Optional[str] = None
+        self.event_ids: List[str] = []
+
+    async def call(self, route, method, path, **kwargs):
+        return await self.recorder.call(self.client, route, method, path, **kwargs)
+
+    async def onboarding(self):
+        creator, partner = str(uuid.uuid4()), str(uuid.uuid4())
+        await self.call("POST /users", "POST", "/users", json={"auth_id": creator, "fcm_token": f"token-{creator}"})
+        await self.call("POST /users", "POST", "/users", json={"auth_id": partner})
+        start_date = datetime.utcnow() - timedelta(days=self.rng.randint(30, 2000))
+        response = await self.call("POST /couples", "POST", "/couples",
+                                   json={"created_by": creator, "start_date": start_date.isoformat()})
+        if response is None:
+            return
+        couple = response.json()
+        await self.call("POST /couples/join", "POST", "/couples/join",
+                        json={"auth_id": partner, "code": couple["pairing_code"]})
+        await self.call("PUT /users/{auth_id}/token", "PUT", f"/users/{partner}/token",
+                        json={"token": f"token-{partner}"})
+        self.couple_id = couple["id"]
+
+        # Seed a history so browsing has something to page through
+        now = datetime.utcnow()
+        for _ in range(self.rng.randint(20, 60)):
+            await self.create_event(now + timedelta(days=self.rng.randint(-365, 180)))
+
+    async def create_event(self, date: datetime):
+        response = await self.call("POST /events", "POST", "/events", json={
+            "couple_id": self.couple_id,
+            "title": self.rng.choice(["Dinner", "Movie night", "Anniversary", "Trip", "Concert"]),
+            "description": "Load test event",
+            "date": date.isoformat(),
+            "location": self.rng.choice([None, "Home", "Downtown"]),
+        })
+        if response is not None:
+            self.event_ids.append(response.json()["id"])
+
+    async def browse(self):
+        await self.call("GET /couples/{couple_id}", "GET", f"/couples/{self.couple_id}")
+        await self.call("GET /events", "GET", "/events", params={"couple_id": self.couple_id})
+
+        # Calendar: a few consecutive months, page by page
+        month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month -= timedelta(days=31 * self.rng.randint(0, 6))
+        for _ in range(3):
+            month = month.replace(day=1)
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            cursor = None
+            while True:
+                params = {"couple_id": self.couple_id, "from": month.isoformat(),
+                          "to": next_month.isoformat(), "limit": 20}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await self.call("GET /events (month page)", "GET", "/events", params=params)
+                cursor = response.headers.get("X-Next-Cursor") if response is not None else None
+                if not cursor:
+                    break
+            month = next_month
+
+        if self.event_ids:
+            event_id = self.rng.choice(self.event_ids)
+            await self.call("GET /events/{event_id}", "GET", f"/events/{event_id}")
+
+    async def edit(self):
+        await self.create_event(datetime.utcnow() + timedelta(days=self.rng.randint(1, 90)))
+        if self.event_ids:
+            event_id = self.rng.choice(self.event_ids)
+            await self.call("PUT /events/{event_id}", "PUT", f"/events/{event_id}", json={
+                "date": (datetime.utcnow() + timedelta(days=self.rng.randint(1, 90))).isoformat(),
+            })
+        if len(self.event_ids) > 10:
+            event_id = self.event_ids.pop(self.rng.randrange(len(self.event_ids)))
+            await self.call("DELETE /events/{event_id}", "DELETE", f"/events/{event_id}")
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("onboarding", "browse", "edit"):
+            raise ValueError(f"Unknown scenario {name!r}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+async def run_client(client, recorder, mix, deadline, seed, sessions=None):
+    rng = random.Random(seed)
+    session = Session(client, recorder, rng)
+    await session.onboarding()
+    if session.couple_id is None:
+        return
+    names, weights = zip(*mix.items())
+    done = 0
+    while time.monotonic() < deadline and (sessions is None or done < sessions):
+        done += 1
+        scenario = rng.choices(names, weights)[0]
+        if scenario == "onboarding":
+            # A fresh couple, as if another pair of users signed up
+            session = Session(client, recorder, rng)
+            await session.onboarding()
+            if session.couple_id is None:
+                return
+        else:
+            await getattr(session, scenario)()
+
+
+@asynccontextmanager
+async def target(url: Optional[str], max_connections: int, in_memory: bool = False):
+    """Yield an HTTP client for either a remote server or the in-process app"""
+    limits = httpx.Limits(max_connections=max_connections)
+    if url:
+        async with httpx.AsyncClient(base_url=url.rstrip("/") + "/api", limits=limits, timeout=30) as client:
+            yield client
+        return
+
+    import server
+
+    use_bench_database(server)
+    server.REMINDERS_ENABLED = False
+    # Every simulated client shares one address in-process
+    server.RATE_LIMITS_ENABLED = False
+    if in_memory:
+        from mongomock_motor import AsyncMongoMockClient
+
+        memory = AsyncMongoMockClient()
+        server.AsyncIOMotorClient = lambda *args, **kwargs: memory
+        server.LIVE_UPDATES_SOURCE = "local"
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench/api", timeout=30) as client:
+                yield client
+    finally:
+        if not in_memory:
+            # The lifespan closes the client on exit, so drop with a fresh one
+            from motor.motor_asyncio import AsyncIOMotorClient
+            cleanup = AsyncIOMotorClient(server.mongo_url)
+            await drop_bench_database(cleanup, server.db_name)
+            cleanup.close()
+
+
+def target_name(args) -> str:
+    return args.url or ("in-memory" if args.in_memory else "in-process")
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, uncompared: Tuple[str, ...] = ()) -> List[str]:
+    """Regressions against the baseline; with uncompared routes, throughput isn't compared either"""
+    regressions = []
+    for route, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous or route in uncompared:
+            continue
+        slower = current["p95_ms"] - previous["p95_ms"]
+        if previous["p95_ms"] and slower > previous["p95_ms"] * tolerance and slower > MIN_REGRESSION_MS:
+            regressions.append(f"{route}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+    if uncompared:
+        return regressions
+    if baseline.get("throughput") and results["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput']:.1f} -> {results['throughput']:.1f} req/s")
+    return regressions
+
+
+def print_results(results: Dict) -> None:
+    print(f"\n{'route':<28} {'reqs':>7} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, stats in results["routes"].items():
+        print(f"{route:<28} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+    print(f"\nTotal: {results['requests']} requests in {results['elapsed']:.1f}s "
+          f"({results['throughput']:.1f} req/s) with {results['clients']} clients")
+
+
+async def main(args) -> int:
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    async with target(args.url, args.clients, args.in_memory) as client:
+        started = time.monotonic()
+        # A fixed workload runs to completion
+        deadline = math.inf if args.sessions else started + args.duration
+        await asyncio.gather(*(
+            run_client(client, recorder, mix, deadline, args.seed + i, args.sessions) for i in range(args.clients)
+        ))
+        elapsed = time.monotonic() - started
+
+    routes = recorder.summary(elapsed)
+    total = sum(stats["requests"] for stats in routes.values())
+    results = {
+        "recorded_at": datetime.utcnow().isoformat(),
+        "target": target_name(args),
+        "clients": args.clients,
+        "mix": args.mix,
+        "sessions": args.sessions,
+        "elapsed": elapsed,
+        "requests": total,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+    print_results(results)
+
+    baseline_path = Path(args.baseline or BASELINES / ("load-in-memory.json" if args.in_memory else "load.json"))
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        mismatched = [
+            f"{setting} {baseline.get(setting)}" for setting in BASELINE_SETTINGS
+            if baseline.get(setting) != results[setting]
+        ]
+        if mismatched:
+            print(f"\n⚠️  {baseline_path} was recorded with {', '.join(mismatched)}; not comparing")
+            return 2
+        uncompared = IN_MEMORY_UNCOMPARED if args.in_memory else ()
+        if uncompared:
+            print(f"\nNot compared in memory (mongomock-bound): {', '.join(uncompared)}, throughput")
+        regressions = compare(results, baseline, args.tolerance, uncompared)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    else:
+        print(f"\n⚠️  No baseline at {baseline_path}; record one with --save-baseline")
+    return 1 if any(stats["errors"] for stats in routes.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Base URL of a running server; default drives the app in-process")
+    parser.add_argument("--in-memory", action="store_true", help="Drive the app in-process over mongomock")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent simulated clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run after onboarding starts")
+    parser.add_argument("--sessions", type=int, help="Sessions per client, instead of running for --duration")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="Baseline JSON file (default baselines/load[-in-memory].json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
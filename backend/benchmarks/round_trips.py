@@ -0,0 +1,190 @@
+"""
+Count MongoDB round trips per mutating route.
+
+Drives the app in-process and counts the commands each request sends,
+either against the MongoDB in MONGO_URL (the benchmark database, see
+benchmarks/__init__.py) through a pymongo CommandListener, or with
+--in-memory against mongomock, counting the collection calls the app
+makes (each one command, except bulk writes mixing operation types).
+BEFORE holds the counts of the write paths before they were collapsed
+into single round trips, read off that code, for comparison.
+
+Token updates are written behind (see token_buffer.py): the request
+sends nothing, and buffered updates are written with one bulk write per
+batch, counted as a row of its own.
+
+    cd backend && python -m benchmarks.round_trips
+    cd backend && python -m benchmarks.round_trips --in-memory
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import uuid
+
+import httpx
+from pymongo import monitoring
+
+from benchmarks import drop_bench_database, use_bench_database
+
+# Round trips per route before the single-round-trip write paths
+BEFORE = {
+    "POST /users (new)": 3,
+    "POST /users (existing)": 1,
+    "PUT /users/{auth_id}/token": 1,
+    "POST /couples": 3,
+    "POST /couples/join": 3,
+    "POST /events": 2,
+    "PUT /events/{event_id}": 3,
+    "DELETE /events/{event_id}": 1,
+}
+
+# Command sent by each collection method, for --in-memory
+_COMMANDS = {
+    "find": "find",
+    "find_one": "find",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "bulk_write": "bulkWrite",
+}
+_COLLECTIONS = ("users", "couples", "events", "event_archive", "event_tombstones")
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        self.commands.clear()
+
+
+class CountingCollection:
+    """Counts the commands a collection's methods send"""
+
+    def __init__(self, collection, counter: CommandCounter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        command = _COMMANDS.get(name)
+        if command is None:
+            return attribute
+        if name in ("find", "aggregate"):
+            def cursor(*args, **kwargs):
+                self._counter.commands[command] += 1
+                return attribute(*args, **kwargs)
+            return cursor
+
+        async def call(*args, **kwargs):
+            self._counter.commands[command] += 1
+            return await attribute(*args, **kwargs)
+        return call
+
+
+class CountingDatabase:
+    def __init__(self, database, counter: CommandCounter):
+        self._database = database
+        self._counter = counter
+
+    def __getattr__(self, name):
+        if name in _COLLECTIONS:
+            return CountingCollection(getattr(self._database, name), self._counter)
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self._counter)
+
+
+async def measure(server, counter: CommandCounter):
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+
+        async def call(route, method, path, **kwargs):
+            counter.reset()
+            response = await client.request(method, path, **kwargs)
+            response.raise_for_status()
+            results[route] = dict(counter.commands)
+            return response.json()
+
+        creator, partner = str(uuid.uuid4()), str(uuid.uuid4())
+        await call("POST /users (new)", "POST", "/users", json={"auth_id": creator})
+        await call("POST /users (existing)", "POST", "/users", json={"auth_id": creator})
+        await client.post("/users", json={"auth_id": partner})
+        await call("PUT /users/{auth_id}/token", "PUT", f"/users/{creator}/token", json={"token": "bench"})
+        if server.token_buffer.running:
+            counter.reset()
+            await server.token_buffer.flush()
+            results["token buffer flush (per batch)"] = dict(counter.commands)
+
+        start_date = (datetime.utcnow() - timedelta(days=30)).isoformat()
+        couple = await call("POST /couples", "POST", "/couples",
+                            json={"created_by": creator, "start_date": start_date})
+        await call("POST /couples/join", "POST", "/couples/join",
+                   json={"auth_id": partner, "code": couple["pairing_code"]})
+
+        event = await call("POST /events", "POST", "/events", json={
+            "couple_id": couple["id"],
+            "title": "Benchmark dinner",
+            "date": (datetime.utcnow() + timedelta(days=7)).isoformat(),
+        })
+        await call("PUT /events/{event_id}", "PUT", f"/events/{event['id']}", json={"title": "Moved dinner"})
+        await call("DELETE /events/{event_id}", "DELETE", f"/events/{event['id']}")
+    return results
+
+
+async def main(args):
+    counter = CommandCounter()
+    import server
+
+    use_bench_database(server)
+    server.REMINDERS_ENABLED = False
+    server.RATE_LIMITS_ENABLED = False
+    if args.in_memory:
+        from mongomock_motor import AsyncMongoMockClient
+
+        memory = AsyncMongoMockClient()
+        storage_database = server.storage_database
+        server.AsyncIOMotorClient = lambda *args, **kwargs: memory
+        server.storage_database = lambda *args: CountingDatabase(storage_database(*args), counter)
+        server.LIVE_UPDATES_SOURCE = "local"
+    else:
+        # Only clients created afterwards, like the lifespan's, report to it
+        monitoring.register(counter)
+
+    async with server.app.router.lifespan_context(server.app):
+        try:
+            results = await measure(server, counter)
+        finally:
+            if not args.in_memory:
+                await drop_bench_database(server.client, server.db_name)
+
+    print(f"{'route':<32} {'before':>6} {'after':>6}  commands")
+    for route, commands in results.items():
+        detail = ", ".join(f"{name}={n}" for name, n in commands.items())
+        print(f"{route:<32} {BEFORE.get(route, '-'):>6} {sum(commands.values()):>6}  {detail}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--in-memory", action="store_true", help="Count calls against mongomock instead of mongod")
+    asyncio.run(main(parser.parse_args()))
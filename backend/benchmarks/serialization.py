@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of the get_events response path.
+
+Compares, on synthetic stored event documents, the regular path (a pydantic
+Event per document, then FastAPI's response_model validation and the
+stdlib JSON encoder) with the FAST_SERIALIZATION path (FastSerializer +
+orjson). No database is needed. The outputs of both paths are checked to
+be identical before timing.
+
+    cd backend && python -m benchmarks.serialization
+"""
+from datetime import datetime, timedelta
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import server
+
+
+def make_events(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    couple_id = str(uuid.uuid4())
+    now = datetime.utcnow().replace(microsecond=0)
+    events = []
+    for i in range(count):
+        created = now - timedelta(days=rng.randint(0, 1000), milliseconds=rng.randint(0, 999))
+        events.append({
+            "_id": i,
+            "id": str(uuid.uuid4()),
+            "couple_id": couple_id,
+            "title": rng.choice(["Dinner", "Movie night", "Anniversary 💕", "Trip"]),
+            "description": rng.choice([None, "A fairly long description of the plans " * 4]),
+            "date": created + timedelta(days=rng.randint(0, 60)),
+            "location": rng.choice([None, "Home", "Café de Flore"]),
+            "reminder_time": rng.choice([None, created + timedelta(days=1)]),
+            "created_at": created,
+            "updated_at": created,
+        })
+    return events
+
+
+def route_field(path: str):
+    for route in server.app.routes:
+        if getattr(route, "path", None) == path and "GET" in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+async def regular_path(events, field) -> bytes:
+    content = await serialize_response(field=field, response_content=[server.Event(**event) for event in events])
+    return JSONResponse(content).body
+
+
+async def fast_path(events, field) -> bytes:
+    return server.event_serializer.dumps_many(events)
+
+
+async def timed(path, events, field, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await path(events, field)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+async def main():
+    field = route_field("/api/events")
+    print(f"{'events':>7} {'regular ms':>11} {'fast ms':>9} {'speedup':>8}")
+    for count in (1_000, 10_000):
+        events = make_events(count)
+        assert await regular_path(events, field) == await fast_path(events, field), "outputs differ"
+        repeat = 20 if count <= 1_000 else 5
+        regular = await timed(regular_path, events, field, repeat)
+        fast = await timed(fast_path, events, field, repeat)
+        print(f"{count:>7} {regular * 1000:>11.1f} {fast * 1000:>9.1f} {regular / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+Storage footprint of the objectid and compact storage layouts.
+
+Seeds the same synthetic couples, users and events into two throwaway
+databases on MONGO_URL, one per layout, creates each layout's declared
+indexes, and compares collStats: data size, index size per index, and
+their sum as an estimate of the working set a server has to keep hot.
+
+    cd backend && python -m benchmarks.storage --couples 2000 --events 50
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import asyncio
+import os
+import random
+import uuid
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from storage import COMPACT_COLLECTIONS, LAYOUTS, storage_database
+
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+BATCH_SIZE = 1000
+
+
+def make_documents(couples: int, events_per_couple: int, seed: int = 1) -> Dict[str, List[dict]]:
+    """Documents shaped as the API stores them, in the objectid layout"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    documents = {"users": [], "couples": [], "events": []}
+    for _ in range(couples):
+        couple_id = str(uuid.uuid4())
+        members = [uuid.uuid4().hex[:28] for _ in range(2)]
+        start_date = now - timedelta(days=rng.randint(30, 2000))
+        documents["couples"].append({
+            "id": couple_id,
+            "created_by": members[0],
+            "members": members,
+            "start_date": start_date,
+            "created_at": start_date,
+            "version": 2,
+            "events_version": events_per_couple,
+        })
+        for auth_id in members:
+            documents["users"].append({
+                "id": str(uuid.uuid4()),
+                "auth_id": auth_id,
+                "couple_id": couple_id,
+                "created_at": start_date,
+                "fcm_token": f"token-{uuid.uuid4().hex}",
+            })
+        for _ in range(events_per_couple):
+            created = now - timedelta(days=rng.randint(0, 1000))
+            documents["events"].append({
+                "id": str(uuid.uuid4()),
+                "couple_id": couple_id,
+                "title": rng.choice(["Dinner", "Movie night", "Anniversary", "Trip", "Concert"]),
+                "description": rng.choice([None, "Table for two at eight"]),
+                "date": created + timedelta(days=rng.randint(0, 60)),
+                "location": rng.choice([None, "Home", "Downtown"]),
+                "reminder_time": rng.choice([None, created + timedelta(days=1)]),
+                "created_at": created,
+                "updated_at": created,
+            })
+    return documents
+
+
+async def seed(db, documents: Dict[str, List[dict]]) -> None:
+    for name, docs in documents.items():
+        for start in range(0, len(docs), BATCH_SIZE):
+            # Copies, as the objectid layout's insert adds an _id to each
+            await db[name].insert_many([dict(doc) for doc in docs[start:start + BATCH_SIZE]])
+
+
+async def footprint(db) -> Dict[str, dict]:
+    stats = {}
+    for name in COMPACT_COLLECTIONS:
+        collection_stats = await db.command("collStats", name)
+        stats[name] = {
+            "count": collection_stats["count"],
+            "size": collection_stats["size"],
+            "avg_obj_size": collection_stats.get("avgObjSize", 0),
+            "storage_size": collection_stats["storageSize"],
+            "index_sizes": dict(collection_stats["indexSizes"]),
+            "total_index_size": collection_stats["totalIndexSize"],
+        }
+    return stats
+
+
+def print_comparison(results: Dict[str, Dict[str, dict]]) -> None:
+    print(f"\n{'collection':<10} {'layout':<9} {'avg doc B':>10} {'data KB':>10} {'index KB':>10} {'working set KB':>15}")
+    totals = {layout: 0 for layout in results}
+    for name in COMPACT_COLLECTIONS:
+        for layout, stats in results.items():
+            collection = stats[name]
+            working_set = collection["size"] + collection["total_index_size"]
+            totals[layout] += working_set
+            print(f"{name:<10} {layout:<9} {collection['avg_obj_size']:>10.0f} {collection['size'] / 1024:>10.0f} "
+                  f"{collection['total_index_size'] / 1024:>10.0f} {working_set / 1024:>15.0f}")
+            for index_name, size in collection["index_sizes"].items():
+                print(f"{'':<21} {index_name:<30} {size / 1024:>8.0f} KB")
+    before, after = totals["objectid"], totals["compact"]
+    print(f"\nWorking set (data + indexes): {before / 1024:.0f} KB -> {after / 1024:.0f} KB "
+          f"({(1 - after / before) * 100 if before else 0:.1f}% smaller)")
+
+
+async def main(args) -> None:
+    documents = make_documents(args.couples, args.events, args.seed)
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    results = {}
+    try:
+        for layout in LAYOUTS:
+            name = f"lovetrack_bench_layout_{layout}"
+            await client.drop_database(name)
+            db = storage_database(client[name], layout)
+            await ensure_indexes(db, layout=layout)
+            await seed(db, documents)
+            results[layout] = await footprint(db)
+            if not args.keep:
+                await client.drop_database(name)
+    finally:
+        client.close()
+    print_comparison(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--couples", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=50, help="Events per couple")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="Keep the databases for inspection")
+    asyncio.run(main(parser.parse_args()))
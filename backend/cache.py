@@ -0,0 +1,118 @@
+"""
+In-process read cache for per-couple query results.
+
+Entries are grouped under the couple they belong to, so a write only has
+to invalidate one couple id to drop every cached read for that couple.
+Couples are evicted least-recently-used once max_couples is reached, and
+every entry expires after ttl seconds so other worker processes (which
+don't see this process' invalidations) converge quickly.
+
+A load that started before an invalidation may finish after it with data
+predating the write. Callers take generation() before loading and pass
+it to set(), which drops results of loads an invalidation overtook.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import time
+
+_MISSING = object()
+
+
+class CoupleCache:
+    """Bounded LRU + TTL cache of read results, keyed by couple id"""
+
+    def __init__(self, max_couples: int = 1024, ttl: float = 30.0, max_entries_per_couple: int = 16):
+        self.max_couples = max_couples
+        self.ttl = ttl
+        self.max_entries_per_couple = max_entries_per_couple
+        self._couples: "OrderedDict[str, OrderedDict[Hashable, Tuple[float, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Invalidation clock: the tick of each couple's last invalidation,
+        # bounded like the entries; forgotten couples count as invalidated
+        # at the newest tick forgotten
+        self._clock = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten_tick = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_couples > 0 and self.ttl > 0
+
+    def get(self, couple_id: str, key: Hashable, default: Any = None) -> Any:
+        entries = self._couples.get(couple_id)
+        value = _MISSING
+        if entries is not None and key in entries:
+            expires_at, cached = entries[key]
+            if expires_at > time.monotonic():
+                value = cached
+                entries.move_to_end(key)
+                self._couples.move_to_end(couple_id)
+            else:
+                del entries[key]
+                self.expirations += 1
+
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def generation(self) -> int:
+        """Token to pass to set() for a value loaded from now on"""
+        return self._clock
+
+    def set(self, couple_id: str, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        if generation is not None and self._invalidated.get(couple_id, self._forgotten_tick) > generation:
+            # Loaded (at least partly) before the couple's last write
+            return
+        entries = self._couples.get(couple_id)
+        if entries is None:
+            entries = self._couples[couple_id] = OrderedDict()
+            while len(self._couples) > self.max_couples:
+                self._couples.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._couples.move_to_end(couple_id)
+
+        entries[key] = (time.monotonic() + self.ttl, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries_per_couple:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, couple_id: Optional[str]) -> None:
+        if couple_id is None:
+            return
+        self._clock += 1
+        self._invalidated[couple_id] = self._clock
+        self._invalidated.move_to_end(couple_id)
+        while len(self._invalidated) > max(self.max_couples, 1):
+            _, tick = self._invalidated.popitem(last=False)
+            self._forgotten_tick = max(self._forgotten_tick, tick)
+        if self._couples.pop(couple_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._couples.clear()
+        self._clock += 1
+        self._invalidated.clear()
+        self._forgotten_tick = self._clock
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "couples": len(self._couples),
+            "entries": sum(len(entries) for entries in self._couples.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,297 @@
+"""
+Declarative MongoDB index definitions for LoveTrack+.
+
+Every query issued by server.py should be served by one of the indexes
+declared in INDEXES. ensure_indexes() runs from the FastAPI lifespan and
+reconciles the declared set against what exists in the database, creating
+missing indexes and reporting drift (conflicting or unmanaged indexes).
+
+Run this module directly to reconcile and check query plans by hand:
+
+    python indexes.py            # reconcile and print the drift report
+    python indexes.py --explain  # also explain() every route query
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List
+import logging
+
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from recurrence import SERIES_FILTER
+from search import SEARCH_WEIGHTS
+from storage import COMPACT_COLLECTIONS, storage_database
+
+logger = logging.getLogger(__name__)
+
+# Options that make two indexes on the same keys behave differently
+_COMPARED_OPTIONS = (
+    "unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights", "default_language",
+)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("auth_id", ASCENDING)], name="auth_id_unique", unique=True),
+    ],
+    "couples": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Pairing codes only exist until the partner joins, so the index only
+        # covers couples that are still waiting to be paired.
+        IndexModel(
+            [("pairing_code", ASCENDING)],
+            name="pairing_code_partial",
+            partialFilterExpression={"pairing_code": {"$exists": True}},
+        ),
+    ],
+    "events": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Serves get_events' (date, id) keyset ordering within a couple
+        IndexModel(
+            [("couple_id", ASCENDING), ("date", ASCENDING), ("id", ASCENDING)],
+            name="couple_id_date_id",
+        ),
+        # Reminder refills range-scan upcoming reminder times; most events
+        # have none, and a range on a date implies this filter
+        IndexModel(
+            [("reminder_time", ASCENDING)],
+            name="reminder_time_partial",
+            partialFilterExpression={"reminder_time": {"$gt": datetime(1970, 1, 1)}},
+        ),
+        # Delta sync reads a couple's events changed since a sync token
+        IndexModel([("couple_id", ASCENDING), ("updated_at", ASCENDING)], name="couple_id_updated_at"),
+        # Recurring series: masters of a couple still running in a range,
+        # and all series still running for reminder refills; few events
+        # are masters, so both only cover those
+        IndexModel(
+            [("couple_id", ASCENDING), ("recurrence_end", ASCENDING)],
+            name="couple_id_recurrence_end_series",
+            partialFilterExpression=SERIES_FILTER,
+        ),
+        IndexModel([("recurrence_end", ASCENDING)], name="recurrence_end_series", partialFilterExpression=SERIES_FILTER),
+        # Overrides of edited occurrences, by series and scheduled date
+        IndexModel(
+            [("recurrence_id", ASCENDING), ("original_date", ASCENDING)],
+            name="recurrence_id_original_date_partial",
+            partialFilterExpression={"recurrence_id": {"$type": "string"}},
+        ),
+        # Event search; the couple_id prefix keeps a $text query within the
+        # couple's own entries, and is required by every query using it
+        IndexModel(
+            [("couple_id", ASCENDING)] + [(name, TEXT) for name in SEARCH_WEIGHTS],
+            name="couple_id_text",
+            weights=SEARCH_WEIGHTS,
+            default_language="english",
+        ),
+    ],
+    # Cold tier: one bucket per couple and month; events are found by id
+    # when read or restored for a write
+    "event_archive": [
+        IndexModel([("couple_id", ASCENDING), ("month", ASCENDING)], name="couple_id_month_unique", unique=True),
+        IndexModel([("events.id", ASCENDING)], name="events_id"),
+    ],
+    "event_tombstones": [
+        IndexModel([("couple_id", ASCENDING), ("deleted_at", ASCENDING)], name="couple_id_deleted_at"),
+        # Compaction deletes everything past the retention window
+        IndexModel([("deleted_at", ASCENDING)], name="deleted_at"),
+    ],
+}
+
+
+def declared_indexes(layout: str = "objectid") -> Dict[str, List[IndexModel]]:
+    """
+    INDEXES as they apply to a storage layout. In the compact layout the
+    UUID is the _id, so the built-in _id_ index replaces id_unique and
+    compound keys end in _id instead of id.
+    """
+    if layout != "compact":
+        return INDEXES
+    declared = {}
+    for collection_name, models in INDEXES.items():
+        if collection_name not in COMPACT_COLLECTIONS:
+            declared[collection_name] = models
+            continue
+        declared[collection_name] = []
+        for model in models:
+            options = dict(model.document)
+            keys = [("_id" if key == "id" else key, direction) for key, direction in options.pop("key").items()]
+            if keys != [("_id", ASCENDING)]:
+                declared[collection_name].append(IndexModel(keys, **options))
+    return declared
+
+
+@dataclass
+class IndexReport:
+    """Result of reconciling one collection against its declared indexes"""
+    collection: str
+    created: List[str] = field(default_factory=list)
+    conflicting: List[str] = field(default_factory=list)
+    unmanaged: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def has_drift(self) -> bool:
+        return bool(self.conflicting or self.unmanaged or self.errors)
+
+
+def _spec(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize an index document so declared and existing indexes compare equal"""
+    keys = []
+    for key, direction in dict(document["key"]).items():
+        if key == "_fts" or direction == TEXT:
+            # MongoDB reports a text index's fields as _fts/_ftsx; either
+            # way the indexed fields are the keys of its weights
+            text_keys = [(name, TEXT) for name in sorted(document.get("weights", {key: 1}))]
+            if text_keys[0] not in keys:
+                keys.extend(text_keys)
+        elif key != "_ftsx":
+            keys.append((key, int(direction)))
+    spec = {"key": keys}
+    for option in _COMPARED_OPTIONS:
+        if document.get(option) not in (None, False):
+            spec[option] = document[option]
+    return spec
+
+
+async def ensure_indexes(db, rebuild: bool = False, layout: str = "objectid") -> List[IndexReport]:
+    """
+    Create missing indexes and report drift for every declared collection.
+
+    Indexes with a declared name but different keys or options are reported
+    as conflicting; they are only dropped and recreated when rebuild is set.
+    Indexes not declared here (other than _id_) are reported, never dropped.
+    """
+    reports = []
+    for collection_name, models in declared_indexes(layout).items():
+        collection = db[collection_name]
+        report = IndexReport(collection=collection_name)
+        existing = await collection.index_information()
+        declared_names = set()
+
+        for model in models:
+            document = model.document
+            name = document["name"]
+            declared_names.add(name)
+
+            if name in existing:
+                if _spec(existing[name]) == _spec(document):
+                    continue
+                report.conflicting.append(name)
+                if not rebuild:
+                    logger.warning(f"Index {collection_name}.{name} differs from its declaration")
+                    continue
+                await collection.drop_index(name)
+
+            try:
+                await collection.create_indexes([model])
+                report.created.append(name)
+            except OperationFailure as e:
+                # e.g. duplicate keys blocking a unique index; startup carries on
+                report.errors[name] = str(e)
+                logger.error(f"Could not create index {collection_name}.{name}: {e}")
+
+        report.unmanaged = sorted(set(existing) - declared_names - {"_id_"})
+        for name in report.unmanaged:
+            logger.warning(f"Unmanaged index {collection_name}.{name}")
+        if report.created:
+            logger.info(f"Created indexes on {collection_name}: {', '.join(report.created)}")
+        reports.append(report)
+    return reports
+
+
+def route_queries() -> Dict[str, List[Dict[str, Any]]]:
+    """Representative filters and sorts for the queries issued by each route"""
+    return {
+        "users": [{"filter": {"auth_id": "probe"}}],
+        "couples": [
+            {"filter": {"id": "probe"}},
+            {"filter": {"pairing_code": "000000"}},
+        ],
+        "events": [
+            {"filter": {"id": "probe"}},
+            {"filter": {"couple_id": "probe"}, "sort": [("date", ASCENDING), ("id", ASCENDING)]},
+            {"filter": {
+                "couple_id": "probe",
+                "date": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 2, 1)},
+            }},
+            {"filter": {
+                "reminder_time": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 1, 2)},
+                "recurrence": None,
+                "$or": [{"reminder_claim": None}, {"reminder_claim_expires": {"$lt": datetime(2024, 1, 1)}}],
+            }},
+            {"filter": {"couple_id": "probe", "updated_at": {"$gt": datetime(2024, 1, 1)}}},
+            {"filter": {"couple_id": "probe", "$text": {"$search": "probe"}}},
+            {"filter": {**SERIES_FILTER, "couple_id": "probe", "date": {"$lt": datetime(2024, 2, 1)}}},
+            {"filter": {**SERIES_FILTER, "recurrence_end": {"$gte": datetime(2024, 1, 1)}}},
+            {"filter": {"recurrence_id": {"$type": "string", "$in": ["probe"]},
+                        "original_date": {"$gte": datetime(2024, 1, 1)}}},
+        ],
+        "event_archive": [
+            {"filter": {"couple_id": "probe", "month": {"$lt": datetime(2024, 1, 1)}}},
+            {"filter": {"events.id": "probe"}},
+        ],
+        "event_tombstones": [
+            {"filter": {"couple_id": "probe", "deleted_at": {"$gt": datetime(2024, 1, 1)}}},
+            {"filter": {"deleted_at": {"$lt": datetime(2024, 1, 1)}}},
+        ],
+    }
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage")]
+    for child in ("inputStage", "outerStage", "innerStage"):
+        if child in plan:
+            stages.extend(_plan_stages(plan[child]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return [stage for stage in stages if stage]
+
+
+async def explain_route_queries(db) -> List[Dict[str, Any]]:
+    """Explain every route query and record the stages of its winning plan"""
+    results = []
+    for collection_name, queries in route_queries().items():
+        for query in queries:
+            cursor = db[collection_name].find(query["filter"])
+            if query.get("sort"):
+                cursor = cursor.sort(query["sort"])
+            explanation = await cursor.explain()
+            stages = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+            results.append({
+                "collection": collection_name,
+                "filter": query["filter"],
+                "stages": stages,
+                "uses_index": "IXSCAN" in stages and "COLLSCAN" not in stages,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    import sys
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main() -> int:
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+        layout = os.environ.get('STORAGE_LAYOUT', 'objectid')
+        db = storage_database(client[os.environ.get('DB_NAME', 'lovetrack')], layout)
+        failed = False
+        for report in await ensure_indexes(db, rebuild="--rebuild" in sys.argv, layout=layout):
+            print(report)
+            failed = failed or bool(report.errors)
+        if "--explain" in sys.argv:
+            for result in await explain_route_queries(db):
+                status = "✅" if result["uses_index"] else "❌"
+                print(f"{status} {result['collection']} {result['filter']}: {' -> '.join(result['stages'])}")
+                failed = failed or not result["uses_index"]
+        client.close()
+        return 1 if failed else 0
+
+    sys.exit(asyncio.run(main()))
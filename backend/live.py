@@ -0,0 +1,246 @@
+"""
+Live event updates for LoveTrack+, delivered as Server-Sent Events.
+
+LiveUpdates fans event changes out to the SSE connections subscribed to
+each couple. Changes come from one of two sources:
+
+    changestream  a single change stream on `events`, shared by every
+                  connection of this process (needs a replica set)
+    local         in-process pub/sub fed by the write routes, used when
+                  change streams are unavailable; only changes made by
+                  this process are seen, so run a single worker with it
+
+Every message carries an id. A reconnecting client sends it back as
+Last-Event-ID and is replayed whatever it missed from a short per-couple
+history; if that is no longer available it gets a `reset` event and
+should refetch. Each connection has a bounded queue: a client that falls
+too far behind also gets `reset` and is disconnected instead of letting
+its backlog grow.
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, Set
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Server error code for change streams on a standalone server
+_CHANGE_STREAMS_UNSUPPORTED = 40573
+
+_CHANGE_TYPES = {"insert": "created", "replace": "updated", "update": "updated", "delete": "deleted"}
+
+
+@dataclass
+class LiveMessage:
+    id: str
+    event: str  # created, updated, deleted or reset
+    data: str  # JSON
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n"
+
+
+def _reset() -> LiveMessage:
+    # An empty id clears the client's Last-Event-ID, so it reconnects fresh
+    return LiveMessage("", "reset", "{}")
+
+
+@dataclass(eq=False)
+class Subscription:
+    couple_id: str
+    queue: asyncio.Queue
+    overflowed: bool = False
+
+
+@dataclass
+class _CoupleChannel:
+    subscribers: Set[Subscription] = field(default_factory=set)
+    history: Deque[LiveMessage] = field(default_factory=deque)
+
+
+class LiveUpdates:
+    def __init__(
+        self,
+        encode_event: Callable[[dict], str],
+        queue_size: int = 100,
+        history_size: int = 50,
+        max_idle_channels: int = 1024,
+        keepalive: float = 15.0,
+    ):
+        self.encode_event = encode_event
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.max_idle_channels = max_idle_channels
+        self.keepalive = keepalive
+        self.source: Optional[str] = None
+        self._channels: "OrderedDict[str, _CoupleChannel]" = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._boot = uuid.uuid4().hex[:8]
+        self._task: Optional[asyncio.Task] = None
+        # Tells deletes that moved an event into the archive from real ones
+        self.is_archived: Optional[Callable[[str], Awaitable[bool]]] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    async def start(self, db, mode: str = "auto") -> None:
+        """Open the shared change stream, or fall back to local pub/sub"""
+        if mode not in ("auto", "changestream", "local"):
+            raise ValueError(f"Unknown live update source {mode!r}")
+        if mode != "local":
+            try:
+                stream = await self._open_stream(db)
+            except OperationFailure as e:
+                if mode == "changestream" or e.code != _CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                logger.info("Change streams unavailable, using in-process live updates")
+            else:
+                self.source = "changestream"
+                self._task = asyncio.create_task(self._watch(db, stream))
+                return
+        self.source = "local"
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _open_stream(self, db, resume_after=None):
+        # Pre-images let deletes say which couple they belonged to; enabling
+        # them needs MongoDB 6+, without them deletes can't be routed
+        try:
+            await db.command("collMod", "events", changeStreamPreAndPostImages={"enabled": True})
+        except OperationFailure:
+            pass
+        stream = db.events.watch(
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=resume_after
+        )
+        # Run the aggregate now so an unsupported deployment fails here
+        change = await stream.try_next()
+        if change is not None:
+            await self._on_change(change)
+        return stream
+
+    async def _watch(self, db, stream) -> None:
+        while True:
+            try:
+                async with stream:
+                    async for change in stream:
+                        await self._on_change(change)
+            except PyMongoError as e:
+                logger.warning(f"Live update change stream interrupted: {e}")
+            # Resume the shared stream where it stopped
+            resume_token = stream.resume_token
+            while True:
+                await asyncio.sleep(1)
+                try:
+                    stream = await self._open_stream(db, resume_after=resume_token)
+                    break
+                except PyMongoError as e:
+                    logger.warning(f"Could not resume live update change stream: {e}")
+
+    async def _on_change(self, change: dict) -> None:
+        kind = _CHANGE_TYPES.get(change["operationType"])
+        if kind is None:
+            return
+        document = change.get("fullDocument") or change.get("fullDocumentBeforeChange")
+        if not document:
+            logger.debug(f"Dropping {change['operationType']} change without its document")
+            return
+        message_id = change["_id"]["_data"]
+        if kind == "deleted":
+            if self.is_archived and await self.is_archived(document["id"]):
+                return
+            self._publish(document["couple_id"], LiveMessage(message_id, kind, json.dumps({"id": document["id"]})))
+        else:
+            self._publish(document["couple_id"], LiveMessage(message_id, kind, self.encode_event(document)))
+
+    def publish_local(self, couple_id: str, kind: str, event_id: str, document: Optional[dict] = None) -> None:
+        """
+        Feed a change from a write route; ignored when a change stream is the
+        source. Without the document (deletes, bulk updates) only the id is sent.
+        """
+        if self.source != "local":
+            return
+        data = self.encode_event(document) if document is not None else json.dumps({"id": event_id})
+        message_id = f"{self._boot}-{next(self._sequence)}"
+        self._publish(couple_id, LiveMessage(message_id, kind, data))
+
+    def _channel(self, couple_id: str) -> _CoupleChannel:
+        channel = self._channels.get(couple_id)
+        if channel is None:
+            channel = self._channels[couple_id] = _CoupleChannel(history=deque(maxlen=self.history_size))
+            # Forget the history of couples nobody is listening to, oldest first
+            if len(self._channels) > self.max_idle_channels:
+                for idle_id in [key for key, value in self._channels.items() if not value.subscribers]:
+                    if len(self._channels) <= self.max_idle_channels:
+                        break
+                    del self._channels[idle_id]
+        self._channels.move_to_end(couple_id)
+        return channel
+
+    def _publish(self, couple_id: str, message: LiveMessage) -> None:
+        channel = self._channel(couple_id)
+        channel.history.append(message)
+        for subscription in list(channel.subscribers):
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind: tell the client to refetch instead of
+                # buffering without bound
+                subscription.overflowed = True
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(_reset())
+
+    def subscribe(self, couple_id: str, last_event_id: Optional[str] = None) -> Subscription:
+        channel = self._channel(couple_id)
+        subscription = Subscription(couple_id, asyncio.Queue(maxsize=self.queue_size + 1))
+        if last_event_id:
+            ids = [message.id for message in channel.history]
+            if last_event_id in ids:
+                missed = list(channel.history)[ids.index(last_event_id) + 1:]
+            else:
+                missed = [_reset()]
+            for message in missed[-self.queue_size:]:
+                subscription.queue.put_nowait(message)
+        channel.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        channel = self._channels.get(subscription.couple_id)
+        if channel is not None:
+            channel.subscribers.discard(subscription)
+
+    async def stream(self, couple_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE body for one connection; waiting clients cost only a queue"""
+        subscription = self.subscribe(couple_id, last_event_id)
+        try:
+            yield f"retry: 3000\n: connected via {self.source}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield message.encode()
+                if message.event == "reset":
+                    return
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,171 @@
+"""
+Prometheus metrics for LoveTrack+.
+
+MetricsMiddleware records per-route request latency, status counts and
+in-flight requests; MongoCommandMetrics is a pymongo CommandListener
+recording per-collection, per-command durations and document counts.
+render_metrics() produces the Prometheus text exposition served at
+/metrics. Routes are labelled by their path template, never the raw
+path, so label cardinality stays bounded.
+
+When PROMETHEUS_MULTIPROC_DIR is set (multi-worker deployments), metrics
+are aggregated across worker processes by prometheus_client.
+"""
+from typing import Any, Dict, Tuple
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP responses by route and status code",
+    ["method", "route", "status"],
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency by collection and command",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_DOCUMENTS = Counter(
+    "mongodb_command_documents_total",
+    "Documents returned or written by MongoDB commands",
+    ["collection", "command"],
+)
+MONGO_FAILURES = Counter(
+    "mongodb_command_failures_total",
+    "Failed MongoDB commands",
+    ["collection", "command"],
+)
+COALESCED_READS = Counter(
+    "read_coalesced_total",
+    "Reads that joined an identical in-flight query instead of issuing their own",
+    ["kind"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "http_admission_rejections_total",
+    "Requests refused by rate limiting or load shedding",
+    ["reason"],
+)
+TOKEN_UPDATES = Counter(
+    "fcm_token_updates_total",
+    "FCM token updates accepted into the write-behind buffer",
+)
+TOKEN_WRITES = Counter(
+    "fcm_token_writes_total",
+    "FCM token updates written to MongoDB after coalescing",
+)
+TOKEN_BUFFER_PENDING = Gauge(
+    "fcm_token_buffer_pending",
+    "FCM token updates waiting in the write-behind buffer",
+    multiprocess_mode="livesum",
+)
+
+# Commands whose first argument is not the collection name
+_COLLECTION_ARGUMENT = {"getMore": "collection"}
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses pass through untouched"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            route_label = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route_label).observe(elapsed)
+            REQUESTS.labels(scope["method"], route_label, str(status)).inc()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the duration and document count of every MongoDB command"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    def started(self, event):
+        argument = _COLLECTION_ARGUMENT.get(event.command_name, event.command_name)
+        collection = event.command.get(argument)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is None:
+            return
+        MONGO_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+        documents = _document_count(event.reply)
+        if documents:
+            MONGO_DOCUMENTS.labels(*labels).inc(documents)
+
+    def failed(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is None:
+            return
+        MONGO_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(*labels).inc()
+
+
+def _document_count(reply) -> int:
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if "n" in reply:
+        return reply["n"]
+    if "value" in reply:
+        # findAndModify
+        return 1 if reply["value"] is not None else 0
+    return 0
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return the exposition body and its content type"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
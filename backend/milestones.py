@@ -0,0 +1,58 @@
+"""
+Relationship duration and milestone arithmetic for the dashboard.
+
+Durations follow the frontend's date-fns intervalToDuration: whole years
+and months are counted by calendar, the remainder in days. All datetimes
+are naive UTC, as stored.
+"""
+from calendar import monthrange
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+# Day counts celebrated as milestones once reached
+DAY_MILESTONE_STEP = 100
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Add calendar months, clamping the day to the end of shorter months"""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, monthrange(year, month)[1]))
+
+
+def relationship_stats(start_date: datetime, now: datetime) -> Dict[str, Any]:
+    """Days together, the calendar duration and the next milestones"""
+    elapsed = max(now, start_date)
+
+    # Whole months by calendar, then the remaining days
+    total_months = (elapsed.year - start_date.year) * 12 + elapsed.month - start_date.month
+    if add_months(start_date, total_months) > elapsed:
+        total_months -= 1
+    days = (elapsed - add_months(start_date, total_months)).days
+
+    days_together = (elapsed - start_date).days
+    years = total_months // 12
+
+    next_day_count = (days_together // DAY_MILESTONE_STEP + 1) * DAY_MILESTONE_STEP
+    next_anniversary = add_months(start_date, 12 * (years + 1))
+    milestones: List[Dict[str, Any]] = [
+        {
+            "label": f"{next_day_count} days",
+            "date": start_date + timedelta(days=next_day_count),
+        },
+        {
+            "label": f"{years + 1} year{'s' if years else ''}",
+            "date": next_anniversary,
+        },
+    ]
+    for milestone in milestones:
+        milestone["days_until"] = max((milestone["date"] - now).days, 0)
+    milestones.sort(key=lambda milestone: milestone["date"])
+
+    return {
+        "days_together": days_together,
+        "years": years,
+        "months": total_months % 12,
+        "days": days,
+        "next_milestones": milestones,
+    }
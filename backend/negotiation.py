@@ -0,0 +1,270 @@
+"""
+Response compression and MessagePack content negotiation for /api.
+
+ContentNegotiationMiddleware handles both for every /api route:
+
+- Request bodies sent as application/msgpack are decoded and handed to
+  the routes as JSON, so every write route accepts either format.
+  MessagePack timestamps arrive as ISO 8601 strings, like JSON ones.
+- Responses are sent as MessagePack when the Accept header asks for
+  application/msgpack at least as strongly as for JSON. Routes keep
+  producing JSON and the middleware transcodes it: orjson decodes faster
+  than msgpack could call back into Python for each datetime, and
+  timestamps stay ISO 8601 strings, so both formats carry the same data
+  (see benchmarks/formats.py). Streamed responses (the NDJSON export,
+  event streams) keep their format.
+- Bodies of at least minimum_size bytes are compressed with brotli or
+  gzip, whichever the client accepts and prefers, brotli on ties when
+  the Brotli package is installed. Streamed responses are compressed
+  chunk by chunk and flushed after each chunk, except event streams,
+  whose messages must reach clients as they are sent.
+
+Transformed responses get a weak ETag, since their bytes differ from the
+identity JSON representation, and a Vary header for the negotiated
+request headers.
+"""
+from typing import Callable, Optional
+import zlib
+
+import msgpack
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+_COMPRESSIBLE_TYPES = ("application/json", MSGPACK_MEDIA_TYPE, "application/x-ndjson", "text/")
+_UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def _quality(header: Optional[str]) -> dict:
+    """Map each value of an Accept-style header to its q-value"""
+    qualities = {}
+    for part in (header or "").split(","):
+        value, *params = [item.strip() for item in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        qualities[value.lower()] = q
+    return qualities
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """Whether Accept asks for MessagePack at least as strongly as for JSON"""
+    qualities = _quality(accept)
+    msgpack_q = max((qualities.get(media_type, 0.0) for media_type in _MSGPACK_MEDIA_TYPES), default=0.0)
+    json_q = max(qualities.get(media_type, 0.0) for media_type in ("application/json", "application/*", "*/*"))
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The content coding to compress with, or None for identity"""
+    qualities = _quality(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    candidates = [("br", qualities.get("br", wildcard))] if brotli is not None else []
+    candidates.append(("gzip", qualities.get("gzip", wildcard)))
+    coding, q = max(candidates, key=lambda candidate: candidate[1])
+    return coding if q > 0 else None
+
+
+def transcode(body: bytes) -> bytes:
+    """A JSON body as MessagePack"""
+    return msgpack.packb(orjson.loads(body))
+
+
+def _media_type(headers: MutableHeaders) -> str:
+    return headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+class _Compressor:
+    """Incremental gzip or brotli compression of one response body"""
+
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._gzip = None
+        else:
+            self._brotli = None
+            self._gzip = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress data and flush it, so the client can decode it right away"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._gzip.compress(data) + self._gzip.flush()
+
+
+class ContentNegotiationMiddleware:
+    """Pure ASGI middleware, so streamed responses stay streamed"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        prefix: str = "/api",
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if headers.get("content-type", "").split(";")[0].strip().lower() in _MSGPACK_MEDIA_TYPES:
+            decoded = await _decode_request(scope, receive)
+            if decoded is None:
+                await _bad_request(send)
+                return
+            receive = decoded
+
+        response_format = "msgpack" if prefers_msgpack(headers.get("accept")) else "json"
+        encoder = _ResponseEncoder(self, send, response_format, choose_encoding(headers.get("accept-encoding")))
+        await self.app(scope, receive, encoder.send)
+
+
+async def _decode_request(scope, receive) -> Optional[Callable]:
+    """
+    Re-present a MessagePack request body as JSON, returning the receive
+    callable delivering it, or None if it isn't valid MessagePack. The
+    headers are rewritten in the scope itself: outer middleware reads what
+    the router stores there, like the matched route.
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    try:
+        body = orjson.dumps(msgpack.unpackb(b"".join(chunks), timestamp=3))
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return None
+
+    scope["headers"] = list(scope["headers"])
+    headers = MutableHeaders(scope=scope)
+    headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+    delivered = False
+
+    async def receive_json():
+        nonlocal delivered
+        if delivered:
+            return await receive()
+        delivered = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive_json
+
+
+async def _bad_request(send) -> None:
+    body = orjson.dumps({"detail": "Invalid MessagePack body"})
+    await send({
+        "type": "http.response.start",
+        "status": 400,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class _ResponseEncoder:
+    """Transcodes and compresses one response on its way out"""
+
+    def __init__(self, middleware: ContentNegotiationMiddleware, send, response_format: str, coding: Optional[str]):
+        self.middleware = middleware
+        self._send = send
+        self.response_format = response_format
+        self.coding = coding
+        self._start = None
+        self._compressor: Optional[_Compressor] = None
+        self._started = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Held until the first body chunk tells whether the body is whole
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._started:
+            if message["type"] == "http.response.body" and self._compressor is not None:
+                body = message.get("body", b"")
+                if message.get("more_body", False):
+                    message = {**message, "body": self._compressor.chunk(body)}
+                else:
+                    message = {**message, "body": self._compressor.finish(body)}
+            await self._send(message)
+            return
+
+        self._started = True
+        headers = MutableHeaders(raw=self._start["headers"])
+        body = message.get("body", b"")
+        status = self._start["status"]
+        media_type = _media_type(headers)
+        transformable = status not in (204, 304) and "content-encoding" not in headers
+
+        if not message.get("more_body", False):
+            if media_type == "application/json" or media_type == MSGPACK_MEDIA_TYPE:
+                headers.add_vary_header("Accept")
+            original = body
+            if transformable and media_type == "application/json" and self.response_format == "msgpack" and body:
+                body = transcode(body)
+                headers["content-type"] = MSGPACK_MEDIA_TYPE
+            if transformable and self._compressible(media_type):
+                headers.add_vary_header("Accept-Encoding")
+                if self.coding and len(body) >= self.middleware.minimum_size:
+                    body = self._new_compressor().finish(body)
+                    headers["content-encoding"] = self.coding
+            if body is not original:
+                # HEAD responses and untouched bodies keep their Content-Length
+                headers["content-length"] = str(len(body))
+                self._weaken_etag(headers)
+            await self._send(self._start)
+            await self._send({**message, "body": body})
+            return
+
+        if transformable and self._compressible(media_type):
+            headers.add_vary_header("Accept-Encoding")
+            if self.coding:
+                self._compressor = self._new_compressor()
+                headers["content-encoding"] = self.coding
+                del headers["content-length"]
+                self._weaken_etag(headers)
+                body = self._compressor.chunk(body)
+        await self._send(self._start)
+        await self._send({**message, "body": body})
+
+    def _compressible(self, media_type: str) -> bool:
+        return media_type.startswith(_COMPRESSIBLE_TYPES) and not media_type.startswith(_UNCOMPRESSED_TYPES)
+
+    def _new_compressor(self) -> _Compressor:
+        return _Compressor(self.coding, self.middleware.gzip_level, self.middleware.brotli_quality)
+
+    @staticmethod
+    def _weaken_etag(headers: MutableHeaders) -> None:
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
@@ -0,0 +1,341 @@
+"""
+Recurring events: a series is stored once and expanded on read.
+
+A series master is an event document with a `recurrence` rule, RRULE
+style:
+
+    {freq: daily|weekly|monthly|yearly, interval, count, until, tz, exdates}
+
+Its date is the first occurrence and the rule repeats it every `interval`
+days, weeks, months or years of wall-clock time in `tz`, so a weekly 19:00
+date night stays at 19:00 across DST changes. Monthly and yearly rules skip
+months without the start day (e.g. the 31st, or Feb 29), as RFC 5545 does.
+Masters also store `recurrence_end`, the date of the last occurrence (None
+for open-ended series), which is what reads filter and index on.
+
+Occurrences only exist in responses. Each gets a stable id made of the
+master's id and its scheduled date, plus recurrence_id and original_date,
+and is computed only within the requested window: reads cost the same
+however far a series runs. Per-occurrence exceptions are kept on the
+series:
+
+    - a cancelled occurrence's date is added to the rule's exdates
+    - an edited occurrence is stored as an override, an ordinary event
+      document with the occurrence's id, recurrence_id and original_date,
+      found by its own (possibly moved) date and replacing the occurrence
+
+Reminders of occurrences are offset from their dates like the master's is
+from its first one. Masters record the last occurrence they sent a
+reminder for in `reminders_sent_until`, which is also what workers claim.
+"""
+from datetime import MAXYEAR, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Longest series a count may describe (its end is computed on write)
+RECURRENCE_COUNT_MAX = 10000
+
+# Occurrences expanded per series for reads with neither an end date nor
+# a limit, which open-ended series would otherwise never finish
+RECURRENCE_EXPANSION_MAX = 1000
+
+# Matches series masters; the partial indexes over them filter on the same
+SERIES_FILTER = {"recurrence": {"$type": "object"}}
+
+
+def overrides_query(master_ids: List[str]) -> Dict[str, Any]:
+    # The $type matches the partial index over overrides
+    return {"recurrence_id": {"$type": "string", "$in": master_ids}}
+
+_OCCURRENCE_DATE_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def occurrence_id(master_id: str, date: datetime) -> str:
+    stamp = date.strftime(_OCCURRENCE_DATE_FORMAT)
+    if date.microsecond:
+        stamp += f".{date.microsecond:06d}"
+    return f"{master_id}_{stamp}"
+
+
+def parse_occurrence_id(event_id: str) -> Optional[Tuple[str, datetime]]:
+    """Split an occurrence id into its master id and date, if it is one"""
+    master_id, _, stamp = event_id.rpartition("_")
+    if not master_id:
+        return None
+    for date_format in (_OCCURRENCE_DATE_FORMAT, _OCCURRENCE_DATE_FORMAT + ".%f"):
+        try:
+            return master_id, datetime.strptime(stamp, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def _to_local(value: datetime, zone: ZoneInfo) -> datetime:
+    return value.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+
+def _to_utc(wall: datetime, zone: ZoneInfo) -> datetime:
+    return wall.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _nth(start: datetime, freq: str, steps: int) -> Optional[datetime]:
+    """
+    The wall time `steps` periods after start, or None where that day
+    doesn't exist. Raises OverflowError past the last representable date.
+    """
+    if freq == "daily":
+        return start + timedelta(days=steps)
+    if freq == "weekly":
+        return start + timedelta(weeks=steps)
+    months = start.month - 1 + (steps if freq == "monthly" else steps * 12)
+    year = start.year + months // 12
+    if year > MAXYEAR:
+        raise OverflowError(f"year {year} is out of range")
+    try:
+        return start.replace(year=year, month=months % 12 + 1)
+    except ValueError:
+        return None
+
+
+def _first_step(start: datetime, freq: str, interval: int, after: datetime) -> int:
+    """A step index at or shortly before the first occurrence at or after `after`"""
+    if after <= start:
+        return 0
+    if freq in ("daily", "weekly"):
+        period = interval * (1 if freq == "daily" else 7) * 86400
+        steps = int((after - start).total_seconds() // period)
+    else:
+        months = (after.year - start.year) * 12 + after.month - start.month
+        steps = months // (interval * (1 if freq == "monthly" else 12))
+    # Back off one step for the DST shift between the UTC and wall clocks
+    return max(steps - 1, 0)
+
+
+def occurrence_dates(
+    date: datetime,
+    recurrence: Dict[str, Any],
+    window_start: Optional[datetime] = None,
+    window_end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    series_end: Optional[datetime] = None,
+) -> Iterator[datetime]:
+    """
+    Dates (naive UTC) of a series starting at `date` within
+    [window_start, window_end), ignoring exdates. The expansion starts at
+    the window rather than the series' start. series_end, when known, is
+    the last occurrence; without it a count is walked from the start.
+    """
+    zone = ZoneInfo(recurrence.get("tz") or "UTC")
+    freq, interval = recurrence["freq"], recurrence.get("interval") or 1
+    until = recurrence.get("until")
+    count = recurrence.get("count")
+    if series_end is not None:
+        until, count = series_end, None
+    # Counting occurrences means walking them from the first one
+    seek = window_start if count is None else None
+
+    try:
+        start = _to_local(date, zone)
+        step = _first_step(start, freq, interval, _to_local(seek, zone)) if seek else 0
+    except OverflowError:
+        # Wall times past the last representable date have no occurrences
+        return
+    produced = 0
+    while limit is None or produced < limit:
+        try:
+            wall = _nth(start, freq, step * interval)
+            occurrence = _to_utc(wall, zone) if wall is not None else None
+        except OverflowError:
+            return
+        step += 1
+        if occurrence is None:
+            continue
+        if until is not None and occurrence > until:
+            return
+        if window_end is not None and occurrence >= window_end:
+            return
+        if count is not None:
+            if count <= 0:
+                return
+            count -= 1
+        if window_start is not None and occurrence < window_start:
+            continue
+        produced += 1
+        yield occurrence
+
+
+def _last_occurrence(date: datetime, recurrence: Dict[str, Any], window_start: Optional[datetime] = None):
+    last = None
+    for last in occurrence_dates(date, recurrence, window_start):
+        pass
+    return last
+
+
+def series_end(date: datetime, recurrence: Optional[Dict[str, Any]]) -> Optional[datetime]:
+    """Date of a series' last occurrence, None for open-ended series"""
+    if not recurrence:
+        return None
+    if recurrence.get("count") is not None:
+        return _last_occurrence(date, recurrence)
+    until = recurrence.get("until")
+    if until is None:
+        return None
+    # Seek close to until rather than walking a long series from its start;
+    # yearly Feb 29 series can go eight years between occurrences
+    interval = recurrence.get("interval") or 1
+    if recurrence["freq"] in ("daily", "weekly"):
+        lookback = timedelta(weeks=2 * interval)
+    else:
+        lookback = timedelta(days=366 * 8)
+    window_start = max(date, until - lookback)
+    return _last_occurrence(date, recurrence, window_start) or _last_occurrence(date, recurrence)
+
+
+def is_occurrence(master: Dict[str, Any], date: datetime) -> bool:
+    """Whether a series is scheduled at date and the occurrence wasn't cancelled"""
+    recurrence = master["recurrence"]
+    if date in recurrence.get("exdates", []):
+        return False
+    window_end = date + timedelta(microseconds=1)
+    return any(
+        occurrence == date
+        for occurrence in occurrence_dates(
+            master["date"], recurrence, date, window_end, 1, master.get("recurrence_end")
+        )
+    )
+
+
+def make_occurrence(master: Dict[str, Any], date: datetime) -> Dict[str, Any]:
+    """The event document of one occurrence of a series"""
+    occurrence = {
+        key: value for key, value in master.items()
+        if key not in ("_id", "recurrence", "recurrence_end", "reminder_claim", "reminders_sent_until")
+    }
+    occurrence["id"] = occurrence_id(master["id"], date)
+    occurrence["date"] = date
+    occurrence["recurrence"] = None
+    occurrence["recurrence_id"] = master["id"]
+    occurrence["original_date"] = date
+    if master.get("reminder_time") is not None:
+        occurrence["reminder_time"] = date - (master["date"] - master["reminder_time"])
+    return occurrence
+
+
+def expand_series(
+    masters: List[Dict[str, Any]],
+    overridden: set,
+    window_start: Optional[datetime],
+    window_end: Optional[datetime],
+    limit: Optional[int],
+    after: Optional[Tuple[datetime, str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Occurrences of the given series within the window in (date, id) order,
+    without cancelled or overridden ones, and only those sorting after
+    `after` when paging. At most `limit` per series are computed.
+    """
+    per_series = limit
+    if per_series is None and window_end is None:
+        per_series = RECURRENCE_EXPANSION_MAX
+    occurrences = []
+    for master in masters:
+        exdates = set(master["recurrence"].get("exdates", []))
+        produced = 0
+        dates = occurrence_dates(
+            master["date"], master["recurrence"], window_start, window_end, None, master.get("recurrence_end")
+        )
+        for date in dates:
+            if per_series is not None and produced >= per_series:
+                break
+            event_id = occurrence_id(master["id"], date)
+            if date in exdates or event_id in overridden:
+                continue
+            if after is not None and (date, event_id) <= after:
+                continue
+            occurrences.append(make_occurrence(master, date))
+            produced += 1
+    occurrences.sort(key=lambda event: (event["date"], event["id"]))
+    return occurrences[:limit] if limit is not None else occurrences
+
+
+def series_query(couple_id: str, date_from: Optional[datetime], date_to: Optional[datetime]) -> Dict[str, Any]:
+    """Masters of a couple's series with occurrences that may fall in [date_from, date_to)"""
+    query: Dict[str, Any] = {"couple_id": couple_id, **SERIES_FILTER}
+    if date_to is not None:
+        query["date"] = {"$lt": date_to}
+    if date_from is not None:
+        query["$or"] = [{"recurrence_end": None}, {"recurrence_end": {"$gte": date_from}}]
+    return query
+
+
+async def load_occurrences(
+    db,
+    couple_id: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, str]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """A couple's occurrences in [date_from, date_to), in (date, id) order"""
+    masters = await db.events.find(series_query(couple_id, date_from, date_to)).to_list(None)
+    if not masters:
+        return []
+    window_start = date_from
+    if after is not None and (window_start is None or after[0] > window_start):
+        window_start = after[0]
+    # Overrides replace their occurrence wherever they were moved to
+    original_dates: Dict[str, Any] = {}
+    if window_start:
+        original_dates["$gte"] = window_start
+    if date_to:
+        original_dates["$lt"] = date_to
+    override_query = overrides_query([master["id"] for master in masters])
+    if original_dates:
+        override_query["original_date"] = original_dates
+    overridden = {override["id"] async for override in db.events.find(override_query, {"id": 1})}
+
+    occurrences = expand_series(masters, overridden, window_start, date_to, limit, after)
+    if projection:
+        names = [name for name, included in projection.items() if included and name != "_id"]
+        occurrences = [{name: event[name] for name in names if name in event} for event in occurrences]
+    return occurrences
+
+
+async def has_series(db, couple_id: str, date_from: Optional[datetime], date_to: Optional[datetime]) -> bool:
+    return await db.events.find_one(series_query(couple_id, date_from, date_to), {"_id": 1}) is not None
+
+
+async def find_occurrence(db, event_id: str) -> Optional[Dict[str, Any]]:
+    """The occurrence an id names, if its series still schedules it"""
+    parsed = parse_occurrence_id(event_id)
+    if parsed is None:
+        return None
+    master_id, date = parsed
+    master = await db.events.find_one({"id": master_id, **SERIES_FILTER})
+    if master is None or not is_occurrence(master, date):
+        return None
+    return make_occurrence(master, date)
+
+
+def due_reminders(
+    master: Dict[str, Any],
+    window_start: datetime,
+    window_end: datetime,
+) -> List[Tuple[str, datetime]]:
+    """(occurrence id, reminder time) of a series' reminders within the window not sent yet"""
+    if master.get("reminder_time") is None:
+        return []
+    offset = master["date"] - master["reminder_time"]
+    sent_until = master.get("reminders_sent_until")
+    exdates = set(master["recurrence"].get("exdates", []))
+    reminders = []
+    dates = occurrence_dates(
+        master["date"], master["recurrence"], window_start + offset, window_end + offset,
+        None, master.get("recurrence_end")
+    )
+    for date in dates:
+        if date in exdates or (sent_until is not None and date <= sent_until):
+            continue
+        reminders.append((occurrence_id(master["id"], date), date - offset))
+    return reminders
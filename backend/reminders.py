@@ -0,0 +1,387 @@
+"""
+Event reminder dispatch for LoveTrack+.
+
+ReminderDispatcher keeps an in-memory due queue of the reminders falling
+within the next `horizon`, bucketed by minute. create_event/update_event
+schedule into it directly and a periodic refill from MongoDB picks up
+anything further out (or written by another worker). A single asyncio task
+sleeps until the earliest reminder is due and then dispatches every due
+event in one batch:
+
+    1. claim the due events (update_many), so only one worker sends each
+    2. read the claimed events back
+    3. fetch the couples' members with one $in query
+    4. fetch every member's fcm_token with one $in query
+    5. mark the claims sent (update_many)
+
+A claim expires after claim_timeout unless it was marked sent, so the
+reminders of a worker dying mid-dispatch are retaken by the next refill.
+
+Occurrences of recurring series (see recurrence.py) are queued under their
+occurrence ids, computed from the series within the horizon, and claimed
+through the series' reminders_sent_until instead of a reminder_claim.
+
+Push delivery goes through a PushSender: FCMPushSender in production,
+LoggingPushSender by default and FakePushSender for tests.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import heapq
+import logging
+import uuid
+
+from recurrence import SERIES_FILTER, due_reminders, is_occurrence, make_occurrence, occurrence_id, parse_occurrence_id
+
+logger = logging.getLogger(__name__)
+
+
+def utc_naive(value: datetime) -> datetime:
+    """Normalize to the naive UTC datetimes MongoDB hands back"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _minute(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp() // 60)
+
+
+def _claimable(now: datetime) -> Dict[str, Any]:
+    """Matches reminders that are unclaimed, or whose claim expired unsent"""
+    return {"$or": [{"reminder_claim": None}, {"reminder_claim_expires": {"$lt": now}}]}
+
+
+class ReminderQueue:
+    """Due queue of event reminders, indexed by minute bucket"""
+
+    def __init__(self):
+        self._buckets: Dict[int, Dict[str, datetime]] = {}
+        self._bucket_heap: List[int] = []
+        self._bucket_of: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._bucket_of)
+
+    def schedule(self, event_id: str, when: datetime) -> None:
+        self.cancel(event_id)
+        when = utc_naive(when)
+        bucket = _minute(when)
+        if bucket not in self._buckets:
+            self._buckets[bucket] = {}
+            heapq.heappush(self._bucket_heap, bucket)
+        self._buckets[bucket][event_id] = when
+        self._bucket_of[event_id] = bucket
+
+    def cancel(self, event_id: str) -> None:
+        bucket = self._bucket_of.pop(event_id, None)
+        if bucket is not None:
+            del self._buckets[bucket][event_id]
+            if not self._buckets[bucket]:
+                # The heap entry is dropped lazily by _first_bucket
+                del self._buckets[bucket]
+
+    def _first_bucket(self) -> Optional[int]:
+        while self._bucket_heap and self._bucket_heap[0] not in self._buckets:
+            heapq.heappop(self._bucket_heap)
+        return self._bucket_heap[0] if self._bucket_heap else None
+
+    def next_due(self) -> Optional[datetime]:
+        bucket = self._first_bucket()
+        return min(self._buckets[bucket].values()) if bucket is not None else None
+
+    def pop_due(self, now: datetime) -> List[str]:
+        """Remove and return the ids of every reminder due at or before now"""
+        now = utc_naive(now)
+        due = []
+        while True:
+            bucket = self._first_bucket()
+            if bucket is None or bucket > _minute(now):
+                return due
+            entries = self._buckets[bucket]
+            for event_id, when in list(entries.items()):
+                if when <= now:
+                    due.append(event_id)
+                    self.cancel(event_id)
+            if bucket in self._buckets:
+                # Only reminders later in the current minute are left
+                return due
+
+
+class PushSender:
+    """Delivers one notification to a set of device tokens"""
+
+    async def send(self, tokens: List[str], title: str, body: str, data: Dict[str, str]) -> int:
+        """Send the notification and return how many tokens it reached"""
+        raise NotImplementedError
+
+
+class LoggingPushSender(PushSender):
+    async def send(self, tokens, title, body, data):
+        logger.info(f"Reminder for event {data.get('eventId')} to {len(tokens)} device(s): {body}")
+        return len(tokens)
+
+
+class FakePushSender(PushSender):
+    """Records notifications instead of sending them"""
+
+    def __init__(self):
+        self.sent: List[Dict[str, Any]] = []
+
+    async def send(self, tokens, title, body, data):
+        self.sent.append({"tokens": list(tokens), "title": title, "body": body, "data": dict(data)})
+        return len(tokens)
+
+
+class FCMPushSender(PushSender):
+    """Sends through Firebase Cloud Messaging; needs firebase-admin installed"""
+
+    def __init__(self):
+        try:
+            import firebase_admin
+            from firebase_admin import messaging
+        except ImportError as e:
+            raise RuntimeError("FCMPushSender requires the firebase-admin package") from e
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app()
+        self._messaging = messaging
+
+    async def send(self, tokens, title, body, data):
+        message = self._messaging.MulticastMessage(
+            notification=self._messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=tokens
+        )
+        response = await asyncio.to_thread(self._messaging.send_each_for_multicast, message)
+        return response.success_count
+
+
+def create_push_sender(name: str) -> PushSender:
+    senders = {"log": LoggingPushSender, "fake": FakePushSender, "fcm": FCMPushSender}
+    if name not in senders:
+        raise ValueError(f"Unknown push sender {name!r}, expected one of {', '.join(senders)}")
+    return senders[name]()
+
+
+class ReminderDispatcher:
+    """Sends event reminders from a background task at second-level precision"""
+
+    def __init__(
+        self,
+        db,
+        sender: PushSender,
+        horizon: timedelta = timedelta(hours=1),
+        grace: timedelta = timedelta(minutes=15),
+        claim_timeout: timedelta = timedelta(minutes=1),
+    ):
+        self.db = db
+        self.sender = sender
+        self.horizon = horizon
+        # Reminders missed (e.g. while no worker was running) are still sent
+        # if they are at most this late
+        self.grace = grace
+        self.claim_timeout = claim_timeout
+        self.queue = ReminderQueue()
+        self.sent = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._next_refill = datetime.min
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        await self.refill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, event_id: str, reminder_time: Optional[datetime]) -> None:
+        """Queue (or requeue) an event's reminder; later ones are left to refill"""
+        if not self.running:
+            return
+        if reminder_time is None:
+            self.queue.cancel(event_id)
+            return
+        reminder_time = utc_naive(reminder_time)
+        now = datetime.utcnow()
+        if now - self.grace <= reminder_time < now + self.horizon:
+            self.queue.schedule(event_id, reminder_time)
+            self._wake.set()
+        else:
+            self.queue.cancel(event_id)
+
+    def schedule_series(self, master: Dict[str, Any]) -> None:
+        """
+        Queue the reminders of a series' occurrences within the horizon.
+        Reminders queued for occurrences the series no longer has are
+        dropped when they come due.
+        """
+        if not self.running:
+            return
+        now = datetime.utcnow()
+        reminders = due_reminders(master, now - self.grace, now + self.horizon)
+        for event_id, reminder_time in reminders:
+            self.queue.schedule(event_id, reminder_time)
+        if reminders:
+            self._wake.set()
+
+    def cancel(self, event_id: str) -> None:
+        self.queue.cancel(event_id)
+
+    async def refill(self) -> None:
+        """Load the unsent reminders that fall within the horizon"""
+        now = datetime.utcnow()
+        cursor = self.db.events.find(
+            {
+                "reminder_time": {"$gte": now - self.grace, "$lt": now + self.horizon},
+                "recurrence": None,
+                **_claimable(now)
+            },
+            {"id": 1, "reminder_time": 1}
+        )
+        async for event in cursor:
+            self.queue.schedule(event["id"], event["reminder_time"])
+        # Series still running, whose occurrences may have reminders due
+        series = self.db.events.find(
+            {
+                **SERIES_FILTER,
+                "reminder_time": {"$lt": now + self.horizon},
+                "$or": [{"recurrence_end": None}, {"recurrence_end": {"$gte": now - self.grace}}]
+            },
+            {"id": 1, "date": 1, "reminder_time": 1, "recurrence": 1, "recurrence_end": 1, "reminders_sent_until": 1}
+        )
+        async for master in series:
+            for event_id, reminder_time in due_reminders(master, now - self.grace, now + self.horizon):
+                self.queue.schedule(event_id, reminder_time)
+        # Refill at half the horizon so nothing is ever more than half a
+        # horizon away from being queued
+        self._next_refill = now + self.horizon / 2
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            wake_at = self._next_refill
+            next_due = self.queue.next_due()
+            if next_due is not None:
+                wake_at = min(wake_at, next_due)
+
+            timeout = max((wake_at - now).total_seconds(), 0)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                if datetime.utcnow() >= self._next_refill:
+                    await self.refill()
+                due = self.queue.pop_due(datetime.utcnow())
+                if due:
+                    await self.dispatch(due)
+            except Exception:
+                logger.exception("Reminder dispatch failed")
+
+    async def dispatch(self, event_ids: List[str]) -> int:
+        """Send the reminders of the given events, if still due and unsent"""
+        now = datetime.utcnow()
+        claim = str(uuid.uuid4())
+
+        # Claim first: another worker, a moved reminder or a deleted event
+        # all simply fail to match
+        await self.db.events.update_many(
+            {"id": {"$in": event_ids}, "reminder_time": {"$lte": now}, "recurrence": None, **_claimable(now)},
+            {"$set": {"reminder_claim": claim, "reminder_claim_expires": now + self.claim_timeout}}
+        )
+        claimed = {"id": {"$in": event_ids}, "reminder_claim": claim}
+        events = await self.db.events.find(claimed, {"id": 1, "couple_id": 1, "title": 1, "date": 1}).to_list(None)
+        has_claims = bool(events)
+        events += await self.claim_occurrences(event_ids, now)
+        if not events:
+            return 0
+
+        couple_ids = list({event["couple_id"] for event in events})
+        couples = await self.db.couples.find(
+            {"id": {"$in": couple_ids}},
+            {"id": 1, "members": 1}
+        ).to_list(None)
+        members = {couple["id"]: couple.get("members", []) for couple in couples}
+
+        all_members = list({member for couple_members in members.values() for member in couple_members})
+        users = await self.db.users.find(
+            {"auth_id": {"$in": all_members}, "fcm_token": {"$ne": None}},
+            {"auth_id": 1, "fcm_token": 1}
+        ).to_list(None)
+        tokens = {user["auth_id"]: user["fcm_token"] for user in users}
+
+        sent = 0
+        for event in events:
+            couple_tokens = [tokens[member] for member in members.get(event["couple_id"], []) if member in tokens]
+            if not couple_tokens:
+                logger.info(f"No FCM tokens found for couple {event['couple_id']}")
+                continue
+
+            title = event.get("title") or "Event Reminder"
+            body = f'Your event "{title}" is coming up at {event["date"].strftime("%H:%M")} UTC.'
+            try:
+                await self.sender.send(couple_tokens, title, body, {
+                    "eventId": event["id"],
+                    "coupleId": event["couple_id"],
+                    "url": f"/calendar/{event['id']}"
+                })
+                sent += 1
+            except Exception:
+                logger.exception(f"Could not send reminder for event {event['id']}")
+
+        if has_claims:
+            await self.db.events.update_many(claimed, {"$set": {"reminder_claim_expires": None}})
+        self.sent += sent
+        return sent
+
+    async def claim_occurrences(self, event_ids: List[str], now: datetime) -> List[Dict[str, Any]]:
+        """Claim the due reminders of series occurrences among event_ids, returning the occurrences"""
+        occurrences = sorted(
+            (parsed for parsed in map(parse_occurrence_id, event_ids) if parsed),
+            key=lambda parsed: parsed[1]
+        )
+        if not occurrences:
+            return []
+        masters = {
+            master["id"]: master
+            async for master in self.db.events.find(
+                {"id": {"$in": list({master_id for master_id, _ in occurrences})}, **SERIES_FILTER},
+                {"id": 1, "couple_id": 1, "title": 1, "date": 1, "reminder_time": 1,
+                 "recurrence": 1, "recurrence_end": 1}
+            )
+        }
+        # Edited occurrences are stored as overrides with their own reminders
+        overridden = {
+            event["id"]
+            async for event in self.db.events.find({"id": {"$in": event_ids}, "recurrence_id": {"$ne": None}}, {"id": 1})
+        }
+
+        claimed = []
+        for master_id, date in occurrences:
+            master = masters.get(master_id)
+            if master is None or master.get("reminder_time") is None:
+                continue
+            if occurrence_id(master_id, date) in overridden or not is_occurrence(master, date):
+                continue
+            if date - (master["date"] - master["reminder_time"]) > now:
+                continue
+            # Occurrences are claimed in date order, so the mark only moves forward
+            result = await self.db.events.update_one(
+                {"id": master_id, "$or": [{"reminders_sent_until": None}, {"reminders_sent_until": {"$lt": date}}]},
+                {"$set": {"reminders_sent_until": date}}
+            )
+            if result.modified_count:
+                claimed.append(make_occurrence(master, date))
+        return claimed
@@ -0,0 +1,132 @@
+"""
+Full-text search over a couple's event titles, descriptions and locations.
+
+Two backends rank a couple's events for a query, most relevant first:
+
+    text     a MongoDB $text query on the events couple_id_text index,
+             ranked by textScore
+    trigram  an in-memory trigram index of the couple's events, for
+             stand-ins without text search (mongomock in tests, local
+             development)
+
+SEARCH_BACKEND=auto probes the database at startup, and falls back to the
+trigram index when $text isn't available then or fails later (mongomock
+only rejects it once a collection has documents). Both weight a match in the
+title over one in the location over one in the description, and break
+ties by date, newest first, so pages of a result are stable.
+
+The trigram index holds one couple's events and is cached like other
+per-couple reads, so it is rebuilt after the couple's next event write.
+Archived events (see archive.py) are not searched.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import re
+import unicodedata
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "text", "trigram")
+
+# Relevance of a match in each searchable field, shared by both backends
+SEARCH_WEIGHTS = {"title": 10, "location": 3, "description": 1}
+
+# Share of a query word's trigrams a field must contain for it to match
+TRIGRAM_THRESHOLD = 0.5
+
+# Raised by databases that can't answer a $text query (no text index, or
+# a stand-in without text search)
+TEXT_SEARCH_ERRORS = (OperationFailure, NotImplementedError)
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Casefold and strip accents, so "Café" and "cafe" compare equal"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def words(text: Optional[str]) -> List[str]:
+    return _WORD.findall(normalize(text)) if text else []
+
+
+def trigrams(word: str) -> Set[str]:
+    # Padded like pg_trgm, so word starts weigh more than their middles
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _rank_key(score: float, event: Dict[str, Any]) -> Tuple:
+    return -score, -event["date"].timestamp(), event["id"]
+
+
+class TrigramIndex:
+    """Trigram postings of one couple's events"""
+
+    def __init__(self, events: Iterable[Dict[str, Any]]):
+        self.events: List[Dict[str, Any]] = []
+        # trigram -> (event position, field) pairs containing it
+        self.postings: Dict[str, Set[Tuple[int, str]]] = {}
+        for position, event in enumerate(events):
+            self.events.append(event)
+            for field in SEARCH_WEIGHTS:
+                for word in words(event.get(field)):
+                    for trigram in trigrams(word):
+                        self.postings.setdefault(trigram, set()).add((position, field))
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """Events matching any word of the query, most relevant first"""
+        scores: Dict[int, float] = {}
+        for word in dict.fromkeys(words(query)):
+            wanted = trigrams(word)
+            shared: Dict[Tuple[int, str], int] = {}
+            for trigram in wanted:
+                for posting in self.postings.get(trigram, ()):
+                    shared[posting] = shared.get(posting, 0) + 1
+            # A word scores once per event, for its best matching field
+            best: Dict[int, float] = {}
+            for (position, field), count in shared.items():
+                similarity = count / len(wanted)
+                if similarity >= TRIGRAM_THRESHOLD:
+                    best[position] = max(best.get(position, 0), SEARCH_WEIGHTS[field] * similarity)
+            for position, score in best.items():
+                scores[position] = scores.get(position, 0) + score
+        ranked = sorted(scores.items(), key=lambda item: _rank_key(item[1], self.events[item[0]]))
+        return [self.events[position] for position, _ in ranked]
+
+
+async def text_search_available(db) -> bool:
+    """Whether the database answers $text queries on events"""
+    try:
+        await db.events.find_one({"couple_id": "probe", "$text": {"$search": "probe"}})
+        return True
+    except TEXT_SEARCH_ERRORS as e:
+        logger.warning(f"Text search unavailable, searching with the trigram index: {e}")
+        return False
+
+
+async def text_search(
+    db,
+    couple_id: str,
+    query: str,
+    skip: int,
+    limit: int,
+    projection: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """One page of a $text search, served by the couple_id_text index"""
+    projection = {**(projection or {}), "score": {"$meta": "textScore"}}
+    events = await db.events.find(
+        {"couple_id": couple_id, "$text": {"$search": query}},
+        projection
+    ).sort([("score", {"$meta": "textScore"}), ("date", -1), ("id", 1)]).skip(skip).limit(limit).to_list(limit)
+    for event in events:
+        event.pop("score", None)
+    return events
+
+
+async def build_trigram_index(db, couple_id: str) -> TrigramIndex:
+    # Whole documents, so a page of results needs no second query
+    return TrigramIndex(await db.events.find({"couple_id": couple_id}).to_list(None))
@@ -0,0 +1,84 @@
+"""
+Fast JSON serialization of stored documents.
+
+The regular read path builds a pydantic model per document, which FastAPI
+then validates again against response_model and serializes through the
+stdlib json encoder. FastSerializer skips both: the field layout of a
+model is resolved once, and each stored document is projected onto it and
+encoded with orjson, producing the same JSON the regular path produces.
+
+Documents are trusted as stored (they were validated when written), so
+this is only used for reads, and only when FAST_SERIALIZATION is enabled.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, create_model
+
+_REQUIRED = object()
+
+
+class FastSerializer:
+    """Precompiled document-to-JSON serializer for one response model"""
+
+    def __init__(self, model: type[BaseModel]):
+        self.model = model
+        self._names = tuple(model.model_fields)
+        self._fields: List[Tuple[str, Any, Any]] = []
+        for name, field in model.model_fields.items():
+            if field.default_factory is not None:
+                self._fields.append((name, _REQUIRED, field.default_factory))
+            elif field.is_required():
+                self._fields.append((name, _REQUIRED, None))
+            else:
+                self._fields.append((name, field.default, None))
+
+    def to_dict(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Project a stored document onto the model's fields, in model order"""
+        try:
+            # Documents written by the API carry every field
+            return {name: document[name] for name in self._names}
+        except KeyError:
+            pass
+        
+        result = {}
+        for name, default, factory in self._fields:
+            if name in document:
+                result[name] = document[name]
+            elif factory is not None:
+                result[name] = factory()
+            elif default is _REQUIRED:
+                raise KeyError(f"{self.model.__name__} document is missing {name!r}")
+            else:
+                result[name] = default
+        return result
+
+    def dumps(self, document: Dict[str, Any]) -> bytes:
+        return orjson.dumps(self.to_dict(document))
+
+    def dumps_many(self, documents: Iterable[Dict[str, Any]]) -> bytes:
+        return orjson.dumps([self.to_dict(document) for document in documents])
+
+
+@lru_cache(maxsize=256)
+def partial_serializer(model: type[BaseModel], names: Tuple[str, ...]) -> FastSerializer:
+    """Serializer for a partial model restricted to the given fields of model"""
+    partial = create_model(
+        f"Partial{model.__name__}",
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in names}
+    )
+    return FastSerializer(partial)
+
+
+def json_response(body: bytes, response: Response) -> Response:
+    """
+    Wrap pre-encoded JSON in a response, keeping headers already set on the
+    route's injected Response (FastAPI drops them when a Response is returned)
+    """
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=dict(response.headers)
+    )
@@ -1,14 +1,44 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+import bson
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from typing import List, Literal, Optional, Dict, Any, Tuple, Hashable, Callable, Awaitable
 import os
+import asyncio
 import logging
 from pathlib import Path
 import uuid
-from datetime import datetime
+import base64
+import hashlib
+import json
+import math
+from contextlib import asynccontextmanager
+from datetime import MAXYEAR, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from admission import AdmissionMiddleware, PoolWaitMonitor, RateBudget, RateLimiter
+from archive import EventArchiver, cold_events_pipeline, find_archived_event, merge_streams, merge_tiers, restore_events
+from cache import CoupleCache
+from indexes import ensure_indexes
+from live import LiveUpdates
+from metrics import ADMISSION_REJECTIONS, MetricsMiddleware, MongoCommandMetrics, render_metrics
+from milestones import relationship_stats
+from negotiation import ContentNegotiationMiddleware
+from recurrence import (
+    RECURRENCE_COUNT_MAX, find_occurrence, has_series, load_occurrences, overrides_query, series_end
+)
+from reminders import ReminderDispatcher, create_push_sender, utc_naive
+from search import TEXT_SEARCH_ERRORS, build_trigram_index, text_search, text_search_available
+from serializers import FastSerializer, json_response, partial_serializer
+from singleflight import SingleFlight
+from storage import storage_database
+from tombstones import TombstoneCompactor, record_tombstones
+from token_buffer import TokenWriteBuffer
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -21,27 +51,206 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
+# MongoDB connection; the client is created by the app lifespan, in each
+# worker process, so no connection pool is ever shared across a fork
 mongo_url = os.environ.get('MONGO_URL')
 db_name = os.environ.get('DB_NAME', 'lovetrack')
+client: Optional[AsyncIOMotorClient] = None
+db = None
 
-logger.info(f"Connecting to MongoDB at {mongo_url}")
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Pool sizing and timeouts, passed to the client when set
+MONGO_CLIENT_SETTINGS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+}
 
-# Create the main app and API router
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+# How long /readyz waits for MongoDB to answer a ping
+READINESS_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT', '2'))
+
+# objectid (default) or compact: UUIDs stored as binary _id (see storage.py)
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'objectid').lower()
+
+# Upper bound for a single page of GET /api/events
+EVENTS_PAGE_MAX = 1000
+
+# How far past today GET /api/events expands open-ended series when the
+# request has neither `to` nor `limit`; stored events aren't bounded by it
+SERIES_HORIZON_DAYS = int(os.environ.get('SERIES_HORIZON_DAYS', '365'))
+
+# Titles listed per day by the calendar month summary
+CALENDAR_DAY_TITLES = 3
 
-# Enable CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Upcoming events returned by the dashboard by default, and at most
+DASHBOARD_UPCOMING_DEFAULT = 3
+DASHBOARD_UPCOMING_MAX = 50
+
+# Upper bound for the number of items in one batch request
+EVENTS_BATCH_MAX = 1000
+
+# Event search: text (MongoDB $text), trigram (in-memory index) or auto,
+# which uses text search where the database has it; see search.py
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto').lower()
+SEARCH_PAGE_DEFAULT = 20
+SEARCH_PAGE_MAX = 100
+SEARCH_QUERY_MAX_LENGTH = 200
+search_backend = SEARCH_BACKEND
+
+# Read cache for get_couple/get_events, invalidated by the write routes
+read_flight = SingleFlight()
+read_cache = CoupleCache(
+    max_couples=int(os.environ.get('READ_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('READ_CACHE_TTL', '30'))
 )
 
+# Serialize reads straight from the stored documents with orjson instead
+# of building and re-validating pydantic models (same output schema)
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', 'false').lower() == 'true'
+
+# Documents fetched per cursor batch (and per response chunk) by the export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+# Reminder dispatcher, fed by the event write routes; created by the lifespan
+REMINDERS_ENABLED = os.environ.get('REMINDERS_ENABLED', 'true').lower() == 'true'
+reminder_dispatcher: Optional[ReminderDispatcher] = None
+
+# Per-client rate limits, spent per IP and per auth_id where the request
+# has one. Joining is tight enough to make guessing pairing codes hopeless.
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', 'true').lower() == 'true'
+rate_limiter = RateLimiter({
+    "users:write": RateBudget(rate=1, burst=10),
+    "couples:create": RateBudget(rate=0.05, burst=5),
+    "couples:join": RateBudget(rate=0.1, burst=5),
+    "events:write": RateBudget(rate=10, burst=100),
+})
+
+# Load shedding: /api requests get 503 while this many are in flight, or
+# while a request has waited this long for a pooled MongoDB connection
+# (0 disables either check)
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', '256'))
+MAX_POOL_WAIT_MS = int(os.environ.get('MAX_POOL_WAIT_MS', '500'))
+pool_wait_monitor = PoolWaitMonitor()
+
+# Delta sync: tombstones of deleted events are kept this long, and sync
+# tokens older than that get a full resync. Tokens are backed off by the
+# clock skew tolerated between workers stamping updated_at.
+TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('TOMBSTONE_RETENTION_DAYS', '30')))
+SYNC_CLOCK_SKEW = timedelta(seconds=float(os.environ.get('SYNC_CLOCK_SKEW_SECONDS', '5')))
+tombstone_compactor: Optional[TombstoneCompactor] = None
+
+# Cold archival: events older than this are moved into per-couple month
+# buckets in event_archive, and reads merge both tiers (see archive.py)
+ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+ARCHIVE_AFTER = timedelta(days=int(os.environ.get('ARCHIVE_AFTER_DAYS', '90')))
+event_archiver: Optional[EventArchiver] = None
+
+# /api responses of at least this many bytes are compressed with brotli or
+# gzip, and clients may exchange MessagePack instead of JSON; see negotiation.py
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+# FCM token updates are written behind, coalescing the updates arriving
+# within this window into one bulk write (0 writes each one through)
+TOKEN_WRITE_WINDOW_MS = int(os.environ.get('TOKEN_WRITE_WINDOW_MS', '1000'))
+TOKEN_WRITE_BUFFER_SIZE = int(os.environ.get('TOKEN_WRITE_BUFFER_SIZE', '10000'))
+token_buffer: Optional[TokenWriteBuffer] = None
+
+# Live updates over SSE: a shared change stream when the deployment has one
+# (auto, changestream) or in-process pub/sub fed by the write routes (local)
+LIVE_UPDATES_SOURCE = os.environ.get('LIVE_UPDATES_SOURCE', 'auto').lower()
+
+# Worker processes started by `python server.py`. The read cache, rate
+# limits and local live updates are per process, so more than one trades
+# their consistency for throughput (see multi_worker_caveats)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+live_updates = LiveUpdates(
+    encode_event=lambda document: event_serializer.dumps(document).decode(),
+    queue_size=int(os.environ.get('LIVE_UPDATES_QUEUE_SIZE', '100')),
+    history_size=int(os.environ.get('LIVE_UPDATES_HISTORY_SIZE', '50'))
+)
+
+def mongo_client_options() -> Dict[str, Any]:
+    options = {}
+    for env_name, option in MONGO_CLIENT_SETTINGS.items():
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = int(value)
+    return options
+
+async def warm_pool(connections: int):
+    """Open connections up front so the first requests don't pay for handshakes"""
+    await asyncio.gather(*(db.command("ping") for _ in range(max(connections, 1))))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, reminder_dispatcher, tombstone_compactor, event_archiver, search_backend, token_buffer
+    app.state.ready = False
+    
+    options = mongo_client_options()
+    logger.info(f"Connecting to MongoDB at {mongo_url}")
+    client = AsyncIOMotorClient(
+        mongo_url,
+        event_listeners=[MongoCommandMetrics(), pool_wait_monitor],
+        **options
+    )
+    db = storage_database(client[db_name], STORAGE_LAYOUT)
+    await warm_pool(options.get('minPoolSize', 1))
+    
+    # Reconcile declared indexes before serving traffic
+    rebuild = os.environ.get('MONGO_INDEX_REBUILD', '').lower() == 'true'
+    app.state.index_reports = await ensure_indexes(db, rebuild=rebuild, layout=STORAGE_LAYOUT)
+    search_backend = SEARCH_BACKEND
+    if search_backend == "auto":
+        search_backend = "text" if await text_search_available(db) else "trigram"
+    
+    reminder_dispatcher = ReminderDispatcher(
+        db,
+        create_push_sender(os.environ.get('PUSH_SENDER', 'log')),
+        horizon=timedelta(minutes=int(os.environ.get('REMINDER_HORIZON_MINUTES', '60')))
+    )
+    if REMINDERS_ENABLED:
+        await reminder_dispatcher.start()
+    event_archiver = EventArchiver(db, ARCHIVE_AFTER)
+    if ARCHIVE_ENABLED:
+        await event_archiver.start()
+        # Moving events into the archive deletes them from events
+        live_updates.is_archived = event_archiver.is_archived
+    await live_updates.start(db, LIVE_UPDATES_SOURCE)
+    if live_updates.source == "local" and WEB_CONCURRENCY > 1:
+        logger.error(
+            f"Live updates fell back to in-process pub/sub with {WEB_CONCURRENCY} workers: "
+            "SSE clients only see writes made by their own worker. Use a replica set or WEB_CONCURRENCY=1"
+        )
+    tombstone_compactor = TombstoneCompactor(db, TOMBSTONE_RETENTION)
+    await tombstone_compactor.start()
+    token_buffer = TokenWriteBuffer(db, TOKEN_WRITE_WINDOW_MS / 1000, TOKEN_WRITE_BUFFER_SIZE)
+    if TOKEN_WRITE_WINDOW_MS > 0:
+        await token_buffer.start()
+    
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    
+    # Writes the buffered token updates
+    await token_buffer.stop()
+    await tombstone_compactor.stop()
+    await live_updates.stop()
+    await event_archiver.stop()
+    await reminder_dispatcher.stop()
+    client.close()
+    logger.info("Closed MongoDB connection")
+
+# API routes live on api_router; create_app() assembles the application
+api_router = APIRouter(prefix="/api")
+
+# Operational endpoints, outside /api so nginx doesn't publish them
+ops_router = APIRouter(include_in_schema=False)
+
 # Define models
 class Couple(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -67,6 +276,30 @@ class UserCreate(BaseModel):
     auth_id: str
     fcm_token: Optional[str] = None
 
+class Recurrence(BaseModel):
+    # RRULE-style repetition of an event from its date (see recurrence.py)
+    freq: Literal["daily", "weekly", "monthly", "yearly"]
+    interval: int = Field(1, ge=1, le=1000)
+    count: Optional[int] = Field(None, ge=1, le=RECURRENCE_COUNT_MAX)
+    until: Optional[datetime] = None
+    tz: str = "UTC"  # Time zone keeping occurrences at the same local time
+    exdates: List[datetime] = []  # Dates of cancelled occurrences
+
+    @field_validator("tz")
+    @classmethod
+    def known_zone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError("Unknown time zone")
+        return value
+
+    @model_validator(mode="after")
+    def count_or_until(self):
+        if self.count is not None and self.until is not None:
+            raise ValueError("Set either count or until, not both")
+        return self
+
 class Event(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     couple_id: str
@@ -77,6 +310,9 @@ class Event(BaseModel):
     reminder_time: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    recurrence: Optional[Recurrence] = None
+    recurrence_id: Optional[str] = None  # Series of an occurrence or override
+    original_date: Optional[datetime] = None  # Scheduled date of an occurrence
 
 class EventCreate(BaseModel):
     couple_id: str
@@ -85,6 +321,13 @@ class EventCreate(BaseModel):
     date: datetime
     location: Optional[str] = None
     reminder_time: Optional[datetime] = None
+    recurrence: Optional[Recurrence] = None
+
+    @model_validator(mode="after")
+    def recurrence_after_date(self):
+        if self.recurrence and self.recurrence.until and utc_naive(self.recurrence.until) < utc_naive(self.date):
+            raise ValueError("Recurrence ends before the event's date")
+        return self
 
 class EventUpdate(BaseModel):
     title: Optional[str] = None
@@ -92,6 +335,261 @@ class EventUpdate(BaseModel):
     date: Optional[datetime] = None
     location: Optional[str] = None
     reminder_time: Optional[datetime] = None
+    recurrence: Optional[Recurrence] = None
+
+couple_serializer = FastSerializer(Couple)
+event_serializer = FastSerializer(Event)
+
+class EventBatchUpdate(EventUpdate):
+    id: str
+
+class EventBatch(BaseModel):
+    # Items are validated one by one so a bad item only fails itself
+    events: List[Dict[str, Any]] = Field(..., max_length=EVENTS_BATCH_MAX)
+    ordered: bool = False
+
+class EventBatchDelete(BaseModel):
+    ids: List[str] = Field(..., max_length=EVENTS_BATCH_MAX)
+    ordered: bool = False
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: int
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    results: List[BatchItemResult]
+
+class CalendarDay(BaseModel):
+    date: str  # Local day, YYYY-MM-DD
+    count: int
+    titles: List[str]  # Titles of the day's first events
+
+class CalendarMonth(BaseModel):
+    year: int
+    month: int
+    tz: str
+    days: List[CalendarDay]
+
+class Milestone(BaseModel):
+    label: str
+    date: datetime
+    days_until: int
+
+class RelationshipStats(BaseModel):
+    days_together: int
+    years: int
+    months: int
+    days: int
+    next_milestones: List[Milestone]  # Soonest first
+
+class Dashboard(BaseModel):
+    couple: Couple
+    upcoming_events: List[Event]
+    stats: RelationshipStats
+
+class EventChanges(BaseModel):
+    # With full set, events is the couple's whole history and replaces
+    # whatever the client holds; otherwise apply events and deleted ids.
+    # Recurring series are synced as stored: masters and overrides.
+    events: List[Event]
+    deleted: List[str]
+    sync_token: str
+    full: bool = False
+
+def as_stored(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Round-trip a document through BSON locally, so a response built from a
+    just-written model matches what reading it back from MongoDB would give
+    (naive UTC datetimes with millisecond precision) without the extra query.
+    """
+    return bson.decode(bson.encode(document))
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong, opaque ETag from the values a representation depends on"""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:24]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ prefixed tags match too
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+def rate_limit(request: Request, budget: str, *keys: str, cost: float = 1):
+    """Spend from a rate budget for the client's IP and the given keys, or answer 429"""
+    if not RATE_LIMITS_ENABLED:
+        return
+    client_host = request.client.host if request.client else "-"
+    retry_after = rate_limiter.acquire(budget, (f"ip:{client_host}", *keys), cost)
+    if retry_after:
+        ADMISSION_REJECTIONS.labels("rate_limit").inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+async def cached_read(couple_id: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Read through the cache. Concurrent misses for the same couple and key
+    share a single load (and query) instead of each issuing their own.
+    A load overtaken by a write to the couple isn't cached.
+    """
+    value = read_cache.get(couple_id, key)
+    if value is None:
+        generation = read_cache.generation()
+
+        async def load_and_cache():
+            loaded = await load()
+            if loaded is not None:
+                read_cache.set(couple_id, key, loaded, generation)
+            return loaded
+        value = await read_flight.do(couple_id, key, load_and_cache)
+    return value
+
+def invalidate_reads(couple_id: str):
+    """Drop a couple's cached reads and detach its in-flight ones"""
+    read_cache.invalidate(couple_id)
+    read_flight.forget(couple_id)
+
+async def find_couple(
+    couple_id: str,
+    projection: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Get a couple document through the read cache. With a projection a cache
+    miss only reads those fields, and the partial document isn't cached.
+    """
+    if projection:
+        couple = read_cache.get(couple_id, "couple")
+        if couple is None:
+            couple = await db.couples.find_one({"id": couple_id}, projection)
+        return couple
+    return await cached_read(couple_id, "couple", lambda: db.couples.find_one({"id": couple_id}))
+
+def parse_fields(fields: Optional[str], model) -> Optional[Tuple[str, ...]]:
+    """Parse a comma-separated fields= parameter; id is always included"""
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(["id"] + [name.strip() for name in fields.split(",") if name.strip()]))
+    unknown = [name for name in names if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def field_projection(names: Tuple[str, ...], *required: str) -> Dict[str, Any]:
+    """Mongo projection for the requested fields plus any the route needs itself"""
+    projection = {name: 1 for name in names + required}
+    projection["_id"] = 0
+    return projection
+
+def partial_response(model, names: Tuple[str, ...], content, response: Response, many: bool = False) -> Response:
+    """Serialize documents restricted to the requested fields"""
+    serializer = partial_serializer(model, names)
+    if FAST_SERIALIZATION:
+        body = serializer.dumps_many(content) if many else serializer.dumps(content)
+        return json_response(body, response)
+    if many:
+        data = [serializer.model(**document).model_dump(mode="json") for document in content]
+    else:
+        data = serializer.model(**content).model_dump(mode="json")
+    return JSONResponse(data, headers=dict(response.headers))
+
+async def events_changed(*couple_ids: str):
+    """
+    Record that couples' events changed: bump each couple's events_version,
+    which event-list ETags are derived from, and drop its cached reads.
+    Must run after the event write so a reader never pairs the new version
+    with the old events.
+    """
+    if not couple_ids:
+        return
+    await db.couples.update_many(
+        {"id": {"$in": list(couple_ids)}},
+        {"$inc": {"events_version": 1}}
+    )
+    for couple_id in couple_ids:
+        invalidate_reads(couple_id)
+
+def series_fields(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fields stored on a series master next to its event fields, derived from
+    its date and rule; empty for other events. Raises ValueError for a rule
+    ending before the series starts.
+    """
+    if not document.get("recurrence"):
+        return {}
+    stored = as_stored({"date": document["date"], "recurrence": document["recurrence"]})
+    until = stored["recurrence"].get("until")
+    if until is not None and until < stored["date"]:
+        raise ValueError("Recurrence ends before the event's date")
+    return {"recurrence_end": series_end(stored["date"], stored["recurrence"])}
+
+def series_update_fields(current: Dict[str, Any], update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Series fields to store along an update of an event's date or recurrence"""
+    if "recurrence" in update_data and current.get("recurrence_id"):
+        raise ValueError("Occurrences of a series can't recur themselves")
+    return series_fields({
+        "date": update_data.get("date", current["date"]),
+        "recurrence": update_data.get("recurrence", current.get("recurrence")),
+    })
+
+def schedule_reminders(event: Dict[str, Any]):
+    """Queue an event's reminder, or its occurrences' for a series"""
+    if event.get("recurrence"):
+        reminder_dispatcher.schedule_series(event)
+    else:
+        reminder_dispatcher.schedule(event["id"], event.get("reminder_time"))
+
+async def series_deleted(events: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Keep series consistent after events were deleted: a deleted override
+    or occurrence is cancelled in its series, and a deleted series takes
+    its overrides along. Returns the couple ids of the deleted overrides.
+    """
+    now = datetime.utcnow()
+    cancellations = [
+        UpdateOne(
+            {"id": event["recurrence_id"]},
+            {"$addToSet": {"recurrence.exdates": event["original_date"]}, "$set": {"updated_at": now}}
+        )
+        for event in events if event.get("recurrence_id")
+    ]
+    if cancellations:
+        await db.events.bulk_write(cancellations, ordered=False)
+    
+    master_ids = [event["id"] for event in events if event.get("recurrence")]
+    if not master_ids:
+        return {}
+    query = overrides_query(master_ids)
+    overrides = await db.events.find(query, {"id": 1, "couple_id": 1}).to_list(None)
+    if overrides:
+        await db.events.delete_many(query)
+    return {override["id"]: override["couple_id"] for override in overrides}
+
+def event_update_fields(event_update: EventUpdate) -> Dict[str, Any]:
+    """Build the $set document for an event update from the provided fields"""
+    update_data = {
+        "updated_at": datetime.utcnow()
+    }
+    
+    # Add only fields that are provided
+    for field, value in event_update.model_dump(exclude_unset=True, exclude={"id"}).items():
+        if value is not None:
+            update_data[field] = value
+    
+    # A new reminder time makes the reminder due again
+    if "reminder_time" in update_data:
+        update_data["reminder_claim"] = None
+        update_data["reminder_claim_expires"] = None
+    
+    return update_data
 
 # API routes
 @api_router.get("/")
@@ -99,25 +597,38 @@ async def root():
     return {"message": "LoveTrack+ API is running"}
 
 @api_router.post("/users", response_model=User)
-async def create_user(user: UserCreate):
-    # Check if user already exists
-    existing_user = await db.users.find_one({"auth_id": user.auth_id})
-    if existing_user:
-        return User(**existing_user)
+async def create_user(user: UserCreate, request: Request):
+    rate_limit(request, "users:write", f"auth:{user.auth_id}")
     
-    # Create new user
     new_user = User(
         auth_id=user.auth_id,
         fcm_token=user.fcm_token
     )
     
-    result = await db.users.insert_one(new_user.dict())
-    created_user = await db.users.find_one({"_id": result.inserted_id})
+    # Upsert so an existing user is returned unchanged and a new one is
+    # created, either way in a single round trip
+    try:
+        stored_user = await db.users.find_one_and_update(
+            {"auth_id": user.auth_id},
+            {"$setOnInsert": new_user.dict()},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request registered the same auth_id first
+        stored_user = await db.users.find_one({"auth_id": user.auth_id})
     
-    return User(**created_user)
+    return User(**stored_user)
 
 @api_router.put("/users/{auth_id}/token")
-async def update_fcm_token(auth_id: str, token: str = Body(..., embed=True)):
+async def update_fcm_token(auth_id: str, request: Request, token: str = Body(..., embed=True)):
+    rate_limit(request, "users:write", f"auth:{auth_id}")
+    
+    if token_buffer.running:
+        # Written with the next batch; an unknown auth_id is only dropped then
+        await token_buffer.put(auth_id, token)
+        return {"success": True}
+    
     result = await db.users.update_one(
         {"auth_id": auth_id},
         {"$set": {"fcm_token": token}}
@@ -129,7 +640,9 @@ async def update_fcm_token(auth_id: str, token: str = Body(..., embed=True)):
     return {"success": True}
 
 @api_router.post("/couples", response_model=Couple)
-async def create_couple(couple: CoupleCreate):
+async def create_couple(couple: CoupleCreate, request: Request):
+    rate_limit(request, "couples:create", f"auth:{couple.created_by}")
+    
     # Generate a random 6-digit code
     from random import randint
     pairing_code = str(randint(100000, 999999))
@@ -147,42 +660,57 @@ async def create_couple(couple: CoupleCreate):
         pairing_expires=pairing_expires
     )
     
-    result = await db.couples.insert_one(new_couple.dict())
-    created_couple = await db.couples.find_one({"_id": result.inserted_id})
+    created_couple = new_couple.dict()
+    await db.couples.insert_one(created_couple)
     
     # Update the user with the couple ID
     await db.users.update_one(
         {"auth_id": couple.created_by},
-        {"$set": {"couple_id": created_couple["id"]}}
+        {"$set": {"couple_id": new_couple.id}}
     )
+    invalidate_reads(new_couple.id)
     
-    return Couple(**created_couple)
+    return Couple(**as_stored(created_couple))
 
 @api_router.post("/couples/join")
-async def join_couple(auth_id: str = Body(...), code: str = Body(...)):
-    # Find couple with matching code
-    couple = await db.couples.find_one({"pairing_code": code})
-    
-    if not couple:
-        raise HTTPException(status_code=404, detail="Invalid code or couple not found")
+async def join_couple(request: Request, auth_id: str = Body(...), code: str = Body(...)):
+    rate_limit(request, "couples:join", f"auth:{auth_id}")
     
-    # Check if code is expired
-    if couple.get("pairing_expires") and couple["pairing_expires"] < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Pairing code has expired")
-    
-    # Check if user is already a member
-    if auth_id in couple["members"]:
-        return {"success": True, "couple_id": str(couple["_id"])}
-    
-    # Add user to members list
-    await db.couples.update_one(
-        {"_id": couple["_id"]},
+    # Claim the code in one round trip: only an unexpired code that the user
+    # has not already used matches
+    couple = await db.couples.find_one_and_update(
+        {
+            "pairing_code": code,
+            "members": {"$ne": auth_id},
+            "$or": [
+                {"pairing_expires": None},
+                {"pairing_expires": {"$gte": datetime.utcnow()}}
+            ]
+        },
         {
             "$addToSet": {"members": auth_id},
-            "$unset": {"pairing_code": "", "pairing_expires": ""}
-        }
+            "$unset": {"pairing_code": "", "pairing_expires": ""},
+            "$inc": {"version": 1}
+        },
+        projection={"id": 1}
     )
     
+    if not couple:
+        # Only a failed claim pays for a second read to explain why
+        couple = await db.couples.find_one({"pairing_code": code})
+        
+        if not couple:
+            raise HTTPException(status_code=404, detail="Invalid code or couple not found")
+        
+        # Check if code is expired
+        if couple.get("pairing_expires") and couple["pairing_expires"] < datetime.utcnow():
+            raise HTTPException(status_code=400, detail="Pairing code has expired")
+        
+        # Otherwise the user is already a member
+        return {"success": True, "couple_id": couple["id"]}
+    
+    invalidate_reads(couple["id"])
+    
     # Update the user with the couple ID
     await db.users.update_one(
         {"auth_id": auth_id},
@@ -192,86 +720,862 @@ async def join_couple(auth_id: str = Body(...), code: str = Body(...)):
     return {"success": True, "couple_id": couple["id"]}
 
 @api_router.get("/couples/{couple_id}", response_model=Couple)
-async def get_couple(couple_id: str):
-    couple = await db.couples.find_one({"id": couple_id})
+async def get_couple(
+    couple_id: str,
+    response: Response,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    names = parse_fields(fields, Couple)
+    couple = await find_couple(couple_id, field_projection(names, "version") if names else None)
     
     if not couple:
         raise HTTPException(status_code=404, detail="Couple not found")
     
+    # The couple document's version is bumped by every write that changes it
+    etag = make_etag(couple_id, couple.get("version", 0), names)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
+    if names:
+        return partial_response(Couple, names, couple, response)
+    if FAST_SERIALIZATION:
+        return json_response(couple_serializer.dumps(couple), response)
     return Couple(**couple)
 
+def month_bounds(year: int, month: int, tz: ZoneInfo):
+    """UTC bounds (naive, as stored) of a calendar month in the given time zone"""
+    start = datetime(year, month, 1, tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+    if year == MAXYEAR and month == 12:
+        # The last month there is runs to the last representable date
+        return start, datetime.max
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=tz)
+    return start, end.astimezone(timezone.utc).replace(tzinfo=None)
+
+def calendar_days(events: List[Dict[str, Any]], zone: ZoneInfo) -> List[Dict[str, Any]]:
+    """Group (date, id) ordered events by local day, as the calendar aggregation does"""
+    days: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        day = event["date"].replace(tzinfo=timezone.utc).astimezone(zone).strftime("%Y-%m-%d")
+        entry = days.setdefault(day, {"date": day, "count": 0, "titles": []})
+        entry["count"] += 1
+        if len(entry["titles"]) < CALENDAR_DAY_TITLES:
+            entry["titles"].append(event["title"])
+    return sorted(days.values(), key=lambda entry: entry["date"])
+
+@api_router.get("/couples/{couple_id}/calendar", response_model=CalendarMonth)
+async def get_calendar_month(
+    couple_id: str,
+    response: Response,
+    year: int = Query(..., ge=1970, le=9999),
+    month: int = Query(..., ge=1, le=12),
+    tz: str = "UTC",
+    if_none_match: Optional[str] = Header(None)
+):
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Unknown time zone")
+    
+    cache_key = ("calendar", year, month, tz)
+    etag = None
+    couple = await find_couple(couple_id)
+    if couple:
+        etag = make_etag(couple_id, couple.get("events_version", 0), *cache_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    # One aggregation over the couple_id_date_id index range of the month,
+    # grouped by local day
+    start, end = month_bounds(year, month, zone)
+    archived_until = couple.get("archived_until") if couple else None
+    pipeline = [
+        {"$match": {"couple_id": couple_id, "date": {"$gte": start, "$lt": end}}},
+        {"$sort": {"date": 1, "id": 1}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date", "timezone": tz}},
+            "count": {"$sum": 1},
+            "titles": {"$push": "$title"}
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "date": "$_id",
+            "count": 1,
+            "titles": {"$slice": ["$titles", CALENDAR_DAY_TITLES]}
+        }}
+    ]
+    
+    async def load_days():
+        archived = archived_until and start < archived_until
+        if archived or await has_series(db, couple_id, start, end):
+            # Months reaching into the archive merge both tiers, and months
+            # with recurring series expand them, in Python instead
+            events, _ = await load_events(
+                couple_id, start, end, None, None,
+                {"_id": 0, "id": 1, "date": 1, "title": 1},
+                archived_until
+            )
+            return calendar_days(events, zone)
+        return await db.events.aggregate(pipeline).to_list(None)
+    
+    days = await cached_read(couple_id, cache_key, load_days)
+    
+    if etag:
+        response.headers["ETag"] = etag
+    return CalendarMonth(year=year, month=month, tz=tz, days=[CalendarDay(**day) for day in days])
+
+@api_router.get("/couples/{couple_id}/dashboard", response_model=Dashboard)
+async def get_dashboard(
+    couple_id: str,
+    upcoming: int = Query(DASHBOARD_UPCOMING_DEFAULT, ge=1, le=DASHBOARD_UPCOMING_MAX)
+):
+    now = datetime.utcnow()
+    
+    # The couple and the next events are independent, so fetch them
+    # concurrently; upcoming events are a couple_id_date_id range scan,
+    # plus the next occurrences of recurring series
+    couple, (upcoming_events, _) = await asyncio.gather(
+        find_couple(couple_id),
+        load_events(couple_id, now, None, upcoming, None)
+    )
+    
+    if not couple:
+        raise HTTPException(status_code=404, detail="Couple not found")
+    
+    return Dashboard(
+        couple=Couple(**couple),
+        upcoming_events=[Event(**event) for event in upcoming_events],
+        stats=RelationshipStats(**relationship_stats(couple["start_date"], now))
+    )
+
+@api_router.get("/couples/{couple_id}/events/export")
+async def export_events(couple_id: str):
+    couple = await find_couple(couple_id)
+    archived_until = couple.get("archived_until") if couple else None
+    
+    async def stream_events():
+        # Stream NDJSON straight off the cursor, one chunk per batch, so
+        # memory stays flat however long the couple's history is
+        cursor = db.events.find(
+            {"couple_id": couple_id},
+            batch_size=EXPORT_BATCH_SIZE
+        ).sort([("date", 1), ("id", 1)])
+        if archived_until:
+            cold = db.event_archive.aggregate(
+                cold_events_pipeline(couple_id, {}, archived_until),
+                batchSize=EXPORT_BATCH_SIZE
+            )
+            cursor = merge_streams(cursor, cold)
+        
+        lines = []
+        async for event in cursor:
+            lines.append(Event(**event).model_dump_json() + "\n")
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+    
+    return StreamingResponse(
+        stream_events(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="events-{couple_id}.ndjson"'}
+    )
+
+@api_router.get("/couples/{couple_id}/events/stream")
+async def stream_event_changes(couple_id: str, last_event_id: Optional[str] = Header(None)):
+    # Server-Sent Events: created/updated/deleted as they happen; a client
+    # reconnecting with Last-Event-ID is replayed what it missed
+    return StreamingResponse(
+        live_updates.stream(couple_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.post("/events", response_model=Event)
-async def create_event(event: EventCreate):
+async def create_event(event: EventCreate, request: Request):
+    rate_limit(request, "events:write")
+    
     new_event = Event(
         couple_id=event.couple_id,
         title=event.title,
         description=event.description,
         date=event.date,
         location=event.location,
-        reminder_time=event.reminder_time
+        reminder_time=event.reminder_time,
+        recurrence=event.recurrence
     )
     
-    result = await db.events.insert_one(new_event.dict())
-    created_event = await db.events.find_one({"_id": result.inserted_id})
+    created_event = new_event.dict()
+    created_event.update(series_fields(created_event))
+    await db.events.insert_one(created_event)
+    created_event = as_stored(created_event)
+    await events_changed(new_event.couple_id)
+    schedule_reminders(created_event)
+    live_updates.publish_local(new_event.couple_id, "created", new_event.id, created_event)
     
     return Event(**created_event)
 
+def encode_cursor(event: Dict[str, Any]) -> str:
+    """Build an opaque pagination cursor from an event's (date, id) sort key"""
+    key = json.dumps([event["date"].isoformat(), event["id"]])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        date, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(event_id, str):
+            raise TypeError("cursor id must be a string")
+        # Compared with stored dates and occurrences, all naive UTC
+        return utc_naive(datetime.fromisoformat(date)), event_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_sync_token(value: datetime) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value.isoformat()]).encode()).decode()
+
+def decode_sync_token(token: str) -> datetime:
+    try:
+        value, = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+async def load_events(
+    couple_id: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    limit: Optional[int],
+    cursor: Optional[str],
+    projection: Optional[Dict[str, Any]] = None,
+    archived_until: Optional[datetime] = None,
+    expand: bool = True,
+    series_until: Optional[datetime] = None
+):
+    """
+    Fetch one page of a couple's events and the cursor of the next page.
+    Ranges starting before the couple's archive horizon include the archive.
+    Recurring series are expanded into their occurrences within the range,
+    and no further than series_until for ranges without an end, or
+    returned as stored (masters only) without expand.
+    """
+    # Compared with the archive horizon and series dates, all naive UTC
+    date_from = utc_naive(date_from) if date_from else None
+    date_to = utc_naive(date_to) if date_to else None
+    
+    # Events are ordered by (date, id), which the couple_id_date_id index
+    # serves directly; `to` is exclusive so months can be fetched back to back
+    query: Dict[str, Any] = {"couple_id": couple_id}
+    if expand:
+        query["recurrence"] = None
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from
+    if date_to:
+        date_range["$lt"] = date_to
+    if date_range:
+        query["date"] = date_range
+
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        query["$or"] = [
+            {"date": {"$gt": after[0]}},
+            {"date": after[0], "id": {"$gt": after[1]}},
+        ]
+
+    # Fetch one extra document to know whether another page exists
+    fetch = None if limit is None else limit + 1
+    find = db.events.find(query, projection).sort([("date", 1), ("id", 1)])
+    if fetch:
+        find = find.limit(fetch)
+    loads = [find.to_list(fetch)]
+    
+    range_start = after[0] if after else date_from
+    archived = archived_until and (range_start is None or range_start < archived_until)
+    if archived:
+        event_query = {key: value for key, value in query.items() if key != "couple_id"}
+        pipeline = cold_events_pipeline(
+            couple_id, event_query, archived_until, date_from, date_to, fetch, projection
+        )
+        loads.append(db.event_archive.aggregate(pipeline).to_list(fetch))
+    if expand:
+        loads.append(load_occurrences(db, couple_id, date_from, date_to or series_until, fetch, after, projection))
+    
+    results = await asyncio.gather(*loads)
+    events = results[0]
+    if archived:
+        events = merge_tiers(events, results[1])[:fetch]
+    if expand and results[-1]:
+        # Occurrences never share an id with a stored event
+        events = sorted(events + results[-1], key=lambda event: (event["date"], event["id"]))[:fetch]
+    
+    if limit is None:
+        # Unpaginated callers get the whole (ordered) history
+        return events, None
+    if len(events) > limit:
+        events = events[:limit]
+        return events, encode_cursor(events[-1])
+    return events, None
+
 @api_router.get("/events", response_model=List[Event])
-async def get_events(couple_id: str):
-    events = await db.events.find({"couple_id": couple_id}).to_list(1000)
+async def get_events(
+    response: Response,
+    couple_id: str,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=EVENTS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    names = parse_fields(fields, Event)
+    # Stored dates are naive UTC; `...Z` and offset bounds are compared to them
+    date_from = utc_naive(date_from) if date_from else None
+    date_to = utc_naive(date_to) if date_to else None
+    # Open-ended series would expand without end in an unbounded list, so it
+    # stops at a horizon that moves daily (and so belongs in the ETag)
+    series_until = None
+    if date_to is None and limit is None:
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        series_until = today + timedelta(days=SERIES_HORIZON_DAYS)
+    cache_key = ("events", date_from, date_to, limit, cursor, names, series_until)
+    
+    # The list only changes when the couple's events_version does, so a
+    # matching ETag is answered without touching the events collection.
+    # Read the version before the events: a write landing in between then
+    # only makes the ETag stale, never wrong.
+    etag = None
+    couple = await find_couple(couple_id)
+    if couple:
+        etag = make_etag(couple_id, couple.get("events_version", 0), *cache_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    # Paging needs each event's (date, id) for the next cursor
+    projection = field_projection(names, "date") if names else None
+    page = await cached_read(
+        couple_id,
+        cache_key,
+        lambda: load_events(
+            couple_id, date_from, date_to, limit, cursor, projection,
+            couple.get("archived_until") if couple else None,
+            series_until=series_until
+        )
+    )
+
+    events, next_cursor = page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if etag:
+        response.headers["ETag"] = etag
+
+    if names:
+        return partial_response(Event, names, events, response, many=True)
+    if FAST_SERIALIZATION:
+        return json_response(event_serializer.dumps_many(events), response)
     return [Event(**event) for event in events]
 
-@api_router.get("/events/{event_id}", response_model=Event)
-async def get_event(event_id: str):
-    event = await db.events.find_one({"id": event_id})
+@api_router.get("/events/changes", response_model=EventChanges)
+async def get_event_changes(couple_id: str, since: Optional[str] = None):
+    # The next token is taken before reading, so a write racing this request
+    # is sent again next time rather than missed; clients apply changes
+    # idempotently. Without a usable token the client resyncs in full.
+    now = datetime.utcnow()
+    sync_token = encode_sync_token(now - SYNC_CLOCK_SKEW)
+    since_time = decode_sync_token(since) if since else None
     
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
+    if since_time is None or since_time < now - TOMBSTONE_RETENTION:
+        couple = await find_couple(couple_id)
+        archived_until = couple.get("archived_until") if couple else None
+        events, _ = await load_events(couple_id, None, None, None, None, None, archived_until, expand=False)
+        return EventChanges(
+            events=[Event(**event) for event in events],
+            deleted=[],
+            sync_token=sync_token,
+            full=True
+        )
     
-    return Event(**event)
+    events, tombstones = await asyncio.gather(
+        db.events.find(
+            {"couple_id": couple_id, "updated_at": {"$gt": since_time}}
+        ).sort([("updated_at", 1), ("id", 1)]).to_list(None),
+        db.event_tombstones.find(
+            {"couple_id": couple_id, "deleted_at": {"$gt": since_time}},
+            {"id": 1}
+        ).to_list(None)
+    )
+    return EventChanges(
+        events=[Event(**event) for event in events],
+        deleted=list(dict.fromkeys(tombstone["id"] for tombstone in tombstones)),
+        sync_token=sync_token
+    )
 
-@api_router.put("/events/{event_id}", response_model=Event)
-async def update_event(event_id: str, event_update: EventUpdate):
-    # Get current event
-    event = await db.events.find_one({"id": event_id})
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([offset]).encode()).decode()
+
+def decode_search_cursor(cursor: str) -> int:
+    try:
+        offset, = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(offset)
+        return offset
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/events/search", response_model=List[Event])
+async def search_events(
+    response: Response,
+    couple_id: str,
+    q: str = Query(..., min_length=1, max_length=SEARCH_QUERY_MAX_LENGTH),
+    limit: int = Query(SEARCH_PAGE_DEFAULT, ge=1, le=SEARCH_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    # Results are ranked by relevance rather than (date, id), so the cursor
+    # holds an offset into the ranking
+    offset = decode_search_cursor(cursor) if cursor else 0
+    query = q.strip()
+    
+    async def load_page():
+        global search_backend
+        # Fetch one extra result to know whether another page exists
+        if search_backend == "text":
+            try:
+                return await text_search(db, couple_id, query, offset, limit + 1)
+            except TEXT_SEARCH_ERRORS as e:
+                if SEARCH_BACKEND != "auto":
+                    raise
+                logger.warning(f"Text search failed, searching with the trigram index: {e}")
+                search_backend = "trigram"
+        index = await cached_read(couple_id, "search_index", lambda: build_trigram_index(db, couple_id))
+        return index.search(query)[offset:offset + limit + 1]
+    
+    events = await cached_read(couple_id, ("search", query, limit, offset), load_page)
+    if len(events) > limit:
+        events = events[:limit]
+        response.headers["X-Next-Cursor"] = encode_search_cursor(offset + limit)
+    
+    if FAST_SERIALIZATION:
+        return json_response(event_serializer.dumps_many(events), response)
+    return [Event(**event) for event in events]
+
+@api_router.get("/events/{event_id}", response_model=Event)
+async def get_event(
+    event_id: str,
+    response: Response,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    names = parse_fields(fields, Event)
+    projection = field_projection(names, "updated_at") if names else None
+    event = await db.events.find_one({"id": event_id}, projection)
+    if not event:
+        event = await find_archived_event(db, event_id)
+    if not event:
+        event = await find_occurrence(db, event_id)
     
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    # Prepare update data
-    update_data = {
-        "updated_at": datetime.utcnow()
-    }
+    etag = make_etag(event_id, event["updated_at"].isoformat(), names)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
     
-    # Add only fields that are provided
-    for field, value in event_update.dict(exclude_unset=True).items():
-        if value is not None:
-            update_data[field] = value
-    
-    # Update the event
-    await db.events.update_one(
+    response.headers["ETag"] = etag
+    if names:
+        return partial_response(Event, names, event, response)
+    if FAST_SERIALIZATION:
+        return json_response(event_serializer.dumps(event), response)
+    return Event(**event)
+
+async def unarchive(*event_ids: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Restore archived events into events so they can be written to. Events
+    stay archived when archiving is turned off, so this doesn't depend on
+    ARCHIVE_ENABLED; routes by id don't know the couple's horizon, and only
+    reach the archive for ids that aren't in events.
+    """
+    return await restore_events(db, list(event_ids))
+
+async def override_occurrence(event_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Store an edited occurrence of a series as an override, or None if there is no such occurrence"""
+    occurrence = await find_occurrence(db, event_id)
+    if occurrence is None:
+        return None
+    if "recurrence" in update_data:
+        raise HTTPException(status_code=422, detail="Occurrences of a series can't recur themselves")
+    if "reminder_time" not in update_data and occurrence.get("reminder_time") and occurrence["reminder_time"] <= datetime.utcnow():
+        # The series already sent (or skipped) this reminder
+        occurrence["reminder_claim"] = "series"
+    # Upserted, so concurrent edits of the occurrence share one override
+    base = {key: value for key, value in occurrence.items() if key not in update_data}
+    return await db.events.find_one_and_update(
         {"id": event_id},
-        {"$set": update_data}
+        {"$setOnInsert": base, "$set": update_data},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+async def update_stored_event(event_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Update a stored event and get it back in the same round trip, or None
+    if there is no such event. A series' stored end depends on its date and
+    rule, so changing either reads the series first; a date change is tried
+    on events that aren't series before that, so it only costs the read
+    when the event turns out to be one.
+    """
+    if "date" in update_data and "recurrence" not in update_data:
+        updated_event = await db.events.find_one_and_update(
+            {"id": event_id, "recurrence": None}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+        )
+        if updated_event:
+            return updated_event
+    if "date" in update_data or "recurrence" in update_data:
+        current = await db.events.find_one({"id": event_id}, {"date": 1, "recurrence": 1, "recurrence_id": 1})
+        if not current:
+            return None
+        try:
+            update_data = {**update_data, **series_update_fields(current, update_data)}
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return await db.events.find_one_and_update(
+        {"id": event_id}, {"$set": update_data}, return_document=ReturnDocument.AFTER
     )
+
+@api_router.put("/events/{event_id}", response_model=Event)
+async def update_event(event_id: str, event_update: EventUpdate, request: Request):
+    rate_limit(request, "events:write")
+    
+    update_data = event_update_fields(event_update)
+    updated_event = await update_stored_event(event_id, update_data)
+    if not updated_event and await unarchive(event_id):
+        updated_event = await update_stored_event(event_id, update_data)
+    if not updated_event:
+        updated_event = await override_occurrence(event_id, update_data)
+    
+    if not updated_event:
+        raise HTTPException(status_code=404, detail="Event not found")
     
-    # Get updated event
-    updated_event = await db.events.find_one({"id": event_id})
+    await events_changed(updated_event["couple_id"])
+    if updated_event.get("recurrence"):
+        schedule_reminders(updated_event)
+    elif event_update.reminder_time is not None:
+        reminder_dispatcher.schedule(event_id, updated_event["reminder_time"])
+    live_updates.publish_local(updated_event["couple_id"], "updated", event_id, updated_event)
     return Event(**updated_event)
 
 @api_router.delete("/events/{event_id}")
-async def delete_event(event_id: str):
-    result = await db.events.delete_one({"id": event_id})
+async def delete_event(event_id: str, request: Request):
+    rate_limit(request, "events:write")
+    
+    # find_one_and_delete hands back the couple id to invalidate in the same round trip
+    projection = {"id": 1, "couple_id": 1, "recurrence": 1, "recurrence_id": 1, "original_date": 1}
+    deleted_event = await db.events.find_one_and_delete({"id": event_id}, projection=projection)
+    if not deleted_event and await unarchive(event_id):
+        deleted_event = await db.events.find_one_and_delete({"id": event_id}, projection=projection)
+    if not deleted_event:
+        # Deleting an occurrence that was never edited only cancels it
+        deleted_event = await find_occurrence(db, event_id)
     
-    if result.deleted_count == 0:
+    if not deleted_event:
         raise HTTPException(status_code=404, detail="Event not found")
     
+    couple_id = deleted_event["couple_id"]
+    deleted = {event_id: couple_id, **await series_deleted([deleted_event])}
+    await record_tombstones(db, deleted)
+    await events_changed(couple_id)
+    for deleted_id in deleted:
+        reminder_dispatcher.cancel(deleted_id)
+        live_updates.publish_local(couple_id, "deleted", deleted_id)
+    if deleted_event.get("recurrence_id"):
+        live_updates.publish_local(couple_id, "updated", deleted_event["recurrence_id"])
     return {"success": True}
 
-# Add API routes to app
-app.include_router(api_router)
+def skipped_item(index: int) -> BatchItemResult:
+    return BatchItemResult(
+        index=index,
+        status=424,
+        error="Not applied: an earlier item in the ordered batch failed"
+    )
 
-# Shutdown event handler
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
-    logger.info("Closed MongoDB connection")
+def validate_batch_items(items: List[Dict[str, Any]], model):
+    """Validate batch items one by one, returning (index, model) pairs and per-item failures"""
+    valid, failures = [], {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+            failures[index] = BatchItemResult(index=index, status=422, error=errors)
+    return valid, failures
+
+async def apply_batch(size: int, operations: List, failures: Dict[int, BatchItemResult], ordered: bool):
+    """
+    Apply (index, operation) pairs with a single bulk_write and record write
+    errors in failures by item index. An ordered batch stops at its first
+    failure, whether found while preparing the items or raised by the write.
+    """
+    if ordered and failures:
+        first_failure = min(failures)
+        operations = [(index, op) for index, op in operations if index < first_failure]
+        for index in range(first_failure + 1, size):
+            failures.setdefault(index, skipped_item(index))
+    
+    if not operations:
+        return
+    
+    try:
+        await db.events.bulk_write([op for _, op in operations], ordered=ordered)
+    except BulkWriteError as e:
+        write_errors = e.details["writeErrors"]
+        for error in write_errors:
+            index = operations[error["index"]][0]
+            status = 409 if error["code"] == 11000 else 500
+            failures[index] = BatchItemResult(index=index, status=status, error=error["errmsg"])
+        if ordered:
+            for index, _ in operations[write_errors[0]["index"] + 1:]:
+                failures[index] = skipped_item(index)
+
+async def find_batch_events(event_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    The given events that exist, by id, with their couple, date and series
+    fields, restoring archived ones
+    """
+    cursor = db.events.find(
+        {"id": {"$in": event_ids}},
+        {"id": 1, "couple_id": 1, "date": 1, "reminder_time": 1, "recurrence": 1,
+         "recurrence_id": 1, "original_date": 1, "reminders_sent_until": 1}
+    )
+    events = {event["id"]: event async for event in cursor}
+    events.update(await unarchive(*[event_id for event_id in event_ids if event_id not in events]))
+    return events
+
+@api_router.post("/events:batch", response_model=BatchResult)
+async def create_events_batch(batch: EventBatch, request: Request):
+    rate_limit(request, "events:write", cost=len(batch.events))
+    
+    valid, failures = validate_batch_items(batch.events, EventCreate)
+    new_events = []
+    for index, event in valid:
+        document = Event.model_validate(event.model_dump()).model_dump()
+        document.update(series_fields(document))
+        new_events.append((index, document))
+    
+    await apply_batch(
+        len(batch.events),
+        [(index, InsertOne(document)) for index, document in new_events],
+        failures,
+        batch.ordered
+    )
+    
+    results = dict(failures)
+    for index, document in new_events:
+        if index not in failures:
+            results[index] = BatchItemResult(index=index, id=document["id"], status=201)
+            schedule_reminders(as_stored(document))
+    await events_changed(*{
+        document["couple_id"] for index, document in new_events if index not in failures
+    })
+    for index, document in new_events:
+        if index not in failures:
+            live_updates.publish_local(document["couple_id"], "created", document["id"], document)
+    
+    return BatchResult(results=[results[index] for index in range(len(batch.events))])
+
+@api_router.post("/events:batchUpdate", response_model=BatchResult)
+async def update_events_batch(batch: EventBatch, request: Request):
+    rate_limit(request, "events:write", cost=len(batch.events))
+    
+    valid, failures = validate_batch_items(batch.events, EventBatchUpdate)
+    
+    # One read tells which events exist, which couples they belong to and
+    # what a series needs to recompute its end
+    events = await find_batch_events([event_update.id for _, event_update in valid])
+    operations = []
+    series = {}
+    for index, event_update in valid:
+        current = events.get(event_update.id)
+        if current is None:
+            failures[index] = BatchItemResult(
+                index=index, id=event_update.id, status=404, error="Event not found"
+            )
+            continue
+        update_data = event_update_fields(event_update)
+        if "date" in update_data or "recurrence" in update_data:
+            try:
+                update_data.update(series_update_fields(current, update_data))
+            except ValueError as e:
+                failures[index] = BatchItemResult(index=index, id=event_update.id, status=422, error=str(e))
+                continue
+        if "recurrence_end" in update_data or (current.get("recurrence") and "reminder_time" in update_data):
+            series[index] = as_stored({**current, **update_data})
+        operations.append((index, UpdateOne({"id": event_update.id}, {"$set": update_data})))
+    
+    await apply_batch(len(batch.events), operations, failures, batch.ordered)
+    
+    results = dict(failures)
+    for index, event_update in valid:
+        if index not in failures:
+            results[index] = BatchItemResult(index=index, id=event_update.id, status=200)
+            if index in series:
+                reminder_dispatcher.schedule_series(series[index])
+            elif event_update.reminder_time is not None:
+                reminder_dispatcher.schedule(event_update.id, event_update.reminder_time)
+    await events_changed(*{
+        events[event_update.id]["couple_id"] for index, event_update in valid if index not in failures
+    })
+    for index, event_update in valid:
+        if index not in failures:
+            # The bulk write doesn't return documents, so only the id is sent
+            live_updates.publish_local(events[event_update.id]["couple_id"], "updated", event_update.id)
+    
+    return BatchResult(results=[results[index] for index in range(len(batch.events))])
+
+@api_router.post("/events:batchDelete", response_model=BatchResult)
+async def delete_events_batch(batch: EventBatchDelete, request: Request):
+    rate_limit(request, "events:write", cost=len(batch.ids))
+    
+    events = await find_batch_events(batch.ids)
+    failures = {}
+    operations = []
+    for index, event_id in enumerate(batch.ids):
+        if event_id not in events:
+            failures[index] = BatchItemResult(index=index, id=event_id, status=404, error="Event not found")
+            continue
+        operations.append((index, DeleteOne({"id": event_id})))
+    
+    await apply_batch(len(batch.ids), operations, failures, batch.ordered)
+    
+    results = dict(failures)
+    deleted = {}
+    for index, event_id in enumerate(batch.ids):
+        if index not in failures:
+            results[index] = BatchItemResult(index=index, id=event_id, status=200)
+            deleted[event_id] = events[event_id]["couple_id"]
+    deleted.update(await series_deleted([events[event_id] for event_id in deleted]))
+    for event_id in deleted:
+        reminder_dispatcher.cancel(event_id)
+    await record_tombstones(db, deleted)
+    await events_changed(*set(deleted.values()))
+    for event_id, couple_id in deleted.items():
+        live_updates.publish_local(couple_id, "deleted", event_id)
+    
+    return BatchResult(results=[results[index] for index in range(len(batch.ids))])
+
+@ops_router.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@ops_router.get("/cache/stats")
+async def cache_stats():
+    return {**read_cache.stats(), "single_flight": read_flight.stats()}
+
+@ops_router.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and serving
+    return {"status": "ok"}
+
+@ops_router.get("/readyz")
+async def readyz(request: Request):
+    # Readiness: startup finished and MongoDB answers
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=READINESS_TIMEOUT)
+    except (PyMongoError, asyncio.TimeoutError):
+        return JSONResponse({"status": "unavailable"}, status_code=503)
+    return {"status": "ready"}
+
+def multi_worker_caveats(workers: int) -> Tuple[List[str], List[str]]:
+    """
+    (errors, warnings) about running this configuration in several worker
+    processes, each with its own in-process state
+    """
+    errors, warnings = [], []
+    if workers <= 1:
+        return errors, warnings
+    if LIVE_UPDATES_SOURCE == "local":
+        errors.append("LIVE_UPDATES_SOURCE=local only delivers writes made by the same worker; run one worker")
+    if read_cache.enabled:
+        warnings.append(
+            f"the read cache is per worker: after a write, other workers can serve stale reads and 304s "
+            f"for up to READ_CACHE_TTL={read_cache.ttl:g}s (set READ_CACHE_TTL=0 to disable it)"
+        )
+    if RATE_LIMITS_ENABLED:
+        warnings.append(f"rate limits are per worker, so clients get up to {workers}x the configured budgets")
+    if ARCHIVE_ENABLED:
+        warnings.append("every worker runs the event archiver; runs lease each couple so they don't overlap")
+    return errors, warnings
+
+def create_app() -> FastAPI:
+    """Build the application; MongoDB is connected by its lifespan"""
+    app = FastAPI(lifespan=lifespan)
+    app.state.ready = False
+    
+    # Shed load inside CORS, so browsers can read the 503s
+    app.add_middleware(
+        AdmissionMiddleware,
+        max_in_flight=MAX_IN_FLIGHT,
+        max_pool_wait=MAX_POOL_WAIT_MS / 1000,
+        pool_monitor=pool_wait_monitor,
+        exempt_suffixes=("/events/stream",),
+    )
+    
+    # Enable CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor", "Retry-After"],
+    )
+    
+    # Compress and transcode outside CORS, so its headers are in place
+    app.add_middleware(
+        ContentNegotiationMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=GZIP_LEVEL,
+        brotli_quality=BROTLI_QUALITY,
+    )
+    
+    # Record per-route latency, status codes and in-flight requests
+    app.add_middleware(MetricsMiddleware)
+    
+    app.include_router(api_router)
+    app.include_router(ops_router)
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    # A single worker unless WEB_CONCURRENCY asks for more. Each worker
+    # imports this module and connects on its own.
+    import sys
+    import tempfile
+    import uvicorn
+    
+    workers = WEB_CONCURRENCY
+    errors, warnings = multi_worker_caveats(workers)
+    for warning in warnings:
+        logger.warning(f"WEB_CONCURRENCY={workers}: {warning}")
+    if errors:
+        for error in errors:
+            logger.error(f"WEB_CONCURRENCY={workers}: {error}")
+        sys.exit(1)
+    if workers > 1 and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate /metrics across workers
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='lovetrack-metrics-')
+    
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8001')),
+        workers=workers
+    )
@@ -0,0 +1,65 @@
+"""
+Request coalescing (single-flight) for per-couple reads.
+
+When both partners open the app at once, or a client retries, identical
+reads for the same couple arrive together and all miss the read cache.
+SingleFlight.do() runs the first one's load and has the others await the
+same result, so MongoDB sees one query per (couple, key) at a time.
+
+Loads run as their own tasks: a caller that disconnects doesn't cancel
+the load for the callers sharing it. forget() detaches a couple's
+in-flight loads after a write, so reads arriving afterwards start a
+fresh query instead of joining one that may predate the write.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+
+from metrics import COALESCED_READS
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, Dict[Hashable, asyncio.Task]] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    async def do(self, couple_id: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Run load() for (couple_id, key), or join the identical load already running"""
+        flights = self._flights.setdefault(couple_id, {})
+        task = flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+            COALESCED_READS.labels(_kind(key)).inc()
+            return await asyncio.shield(task)
+
+        self.loads += 1
+        task = asyncio.ensure_future(load())
+        flights[key] = task
+        task.add_done_callback(lambda done: self._landed(couple_id, key, done))
+        return await asyncio.shield(task)
+
+    def _landed(self, couple_id: str, key: Hashable, task: asyncio.Task) -> None:
+        flights = self._flights.get(couple_id)
+        if flights is not None and flights.get(key) is task:
+            del flights[key]
+            if not flights:
+                del self._flights[couple_id]
+        # Every waiter may have gone; don't log an unretrieved exception
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, couple_id: str) -> None:
+        self._flights.pop(couple_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": sum(len(flights) for flights in self._flights.values()),
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+        }
+
+
+def _kind(key: Hashable) -> str:
+    # Keys are a name or a tuple starting with one ("events", ...), which
+    # keeps the metric's label set bounded
+    return key[0] if isinstance(key, tuple) else str(key)
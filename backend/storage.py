@@ -0,0 +1,412 @@
+"""
+Storage layouts for LoveTrack+ documents.
+
+The default `objectid` layout stores documents as the API models dump
+them: a server-generated ObjectId `_id` next to a 36-character string
+UUID `id`, each with its own unique index. The opt-in `compact` layout
+(STORAGE_LAYOUT=compact) stores the UUID itself as `_id`, as BSON binary
+subtype 4, and `couple_id` references as binary too. That drops a field
+and a unique index per document and shrinks the remaining keys.
+
+CompactDatabase wraps the Motor database and translates at the boundary:
+filters, updates, projections, sorts and documents going in use `_id`
+and binary UUIDs, and documents coming out are turned back into `id` and
+strings. The routes and the API contract are the same in both layouts.
+Only users, couples and events are translated; `members` and `auth_id`
+hold Firebase auth ids, not UUIDs, and are left alone.
+
+Switching an existing database over needs its data migrated, with the
+app stopped:
+
+    python storage.py --migrate              # convert to the compact layout
+    python storage.py --migrate --dry-run    # only count what would move
+
+Each collection is copied into a compact replacement, then swapped in by
+rename, keeping the original as <name>_objectid_backup. Indexes for the
+new layout are created by the next startup (ensure_indexes).
+"""
+from typing import Any, Dict, List, Optional
+import uuid
+
+from bson import Binary, ObjectId
+from bson.binary import UUID_SUBTYPE
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+LAYOUTS = ("objectid", "compact")
+COMPACT_COLLECTIONS = ("users", "couples", "events")
+
+# UUID reference fields stored as binary, besides `id` itself
+UUID_FIELDS = ("couple_id",)
+
+_COMPARISONS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+
+
+def to_binary(value: Any) -> Any:
+    """A canonical UUID string as BSON binary; anything else is left as is"""
+    if isinstance(value, str):
+        try:
+            parsed = uuid.UUID(value)
+        except ValueError:
+            return value
+        if str(parsed) == value:
+            return Binary.from_uuid(parsed)
+    return value
+
+
+def from_binary(value: Any) -> Any:
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return str(value.as_uuid())
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _encode_condition(condition: Any) -> Any:
+    if isinstance(condition, list):
+        return [to_binary(value) for value in condition]
+    if isinstance(condition, dict):
+        return {
+            operator: _encode_condition(value) if operator in _COMPARISONS else value
+            for operator, value in condition.items()
+        }
+    return to_binary(condition)
+
+
+def encode_filter(query: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    encoded = {}
+    for key, value in (query or {}).items():
+        if key in ("$or", "$and", "$nor"):
+            encoded[key] = [encode_filter(clause) for clause in value]
+        elif key == "id":
+            encoded["_id"] = _encode_condition(value)
+        elif key in UUID_FIELDS:
+            encoded[key] = _encode_condition(value)
+        else:
+            encoded[key] = value
+    return encoded
+
+
+def encode_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored form of a document or of the fields of a $set"""
+    encoded = {}
+    for key, value in document.items():
+        if key == "id":
+            encoded["_id"] = to_binary(value)
+        elif key == "_id" and "id" in document:
+            # A leftover ObjectId; the UUID takes its place
+            continue
+        elif key in UUID_FIELDS:
+            encoded[key] = to_binary(value)
+        else:
+            encoded[key] = value
+    return encoded
+
+
+def encode_update(update: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        operator: encode_document(fields) if operator in ("$set", "$setOnInsert") else fields
+        for operator, fields in update.items()
+    }
+
+
+def encode_projection(projection: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not projection:
+        return projection
+    encoded = dict(projection)
+    if "id" in encoded:
+        # Overrides the {"_id": 0} that hides the ObjectId in the other layout
+        encoded["_id"] = encoded.pop("id")
+    return encoded
+
+
+def encode_sort(key_or_list, direction=None) -> List:
+    keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction or 1)]
+    return [("_id" if key == "id" else key, order) for key, order in keys]
+
+
+def encode_pipeline(pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Translate $match and $sort stages; other stages must not refer to ids"""
+    encoded = []
+    for stage in pipeline:
+        if "$match" in stage:
+            stage = {"$match": encode_filter(stage["$match"])}
+        elif "$sort" in stage:
+            stage = {"$sort": dict(encode_sort(list(stage["$sort"].items())))}
+        encoded.append(stage)
+    return encoded
+
+
+def decode_document(document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if document is None:
+        return None
+    decoded = {}
+    # The _id is the id: a binary UUID, or a string for ids that aren't
+    # UUIDs (recurring event overrides). Only ObjectIds aren't.
+    if "_id" in document and not isinstance(document["_id"], ObjectId):
+        decoded["id"] = from_binary(document["_id"])
+    for key, value in document.items():
+        if key == "_id" and "id" in decoded:
+            continue
+        decoded[key] = from_binary(value) if key in UUID_FIELDS else value
+    return decoded
+
+
+def _encode_request(request):
+    # pymongo's write models keep their arguments in these attributes
+    if isinstance(request, InsertOne):
+        return InsertOne(encode_document(request._doc))
+    if isinstance(request, (UpdateOne, UpdateMany)):
+        return type(request)(encode_filter(request._filter), encode_update(request._doc), upsert=request._upsert)
+    if isinstance(request, ReplaceOne):
+        return ReplaceOne(encode_filter(request._filter), encode_document(request._doc), upsert=request._upsert)
+    if isinstance(request, (DeleteOne, DeleteMany)):
+        return type(request)(encode_filter(request._filter))
+    raise TypeError(f"Unsupported write model {type(request).__name__}")
+
+
+class CompactCursor:
+    """Find or aggregation cursor handing back decoded documents"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, key_or_list, direction=None) -> "CompactCursor":
+        self._cursor.sort(encode_sort(key_or_list, direction))
+        return self
+
+    def limit(self, limit: int) -> "CompactCursor":
+        self._cursor.limit(limit)
+        return self
+
+    def skip(self, skip: int) -> "CompactCursor":
+        self._cursor.skip(skip)
+        return self
+
+    def batch_size(self, batch_size: int) -> "CompactCursor":
+        self._cursor.batch_size(batch_size)
+        return self
+
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        return [decode_document(document) for document in await self._cursor.to_list(length)]
+
+    async def explain(self):
+        return await self._cursor.explain()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        return decode_document(await self._cursor.__anext__())
+
+
+class CompactChangeStream:
+    """Change stream handing back changes with decoded documents"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    @property
+    def resume_token(self):
+        return self._stream.resume_token
+
+    @staticmethod
+    def _decode(change: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if change is None:
+            return None
+        change = dict(change)
+        for key in ("fullDocument", "fullDocumentBeforeChange", "documentKey"):
+            if change.get(key) is not None:
+                change[key] = decode_document(change[key])
+        return change
+
+    async def try_next(self):
+        return self._decode(await self._stream.try_next())
+
+    async def close(self):
+        await self._stream.close()
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stream.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return self._decode(await self._stream.__anext__())
+
+
+class CompactCollection:
+    """Motor collection storing the compact layout; other methods pass through"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, filter=None, projection=None, **kwargs) -> CompactCursor:
+        if "sort" in kwargs:
+            kwargs["sort"] = encode_sort(kwargs["sort"])
+        return CompactCursor(self._collection.find(encode_filter(filter), encode_projection(projection), **kwargs))
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        document = await self._collection.find_one(encode_filter(filter), encode_projection(projection), **kwargs)
+        return decode_document(document)
+
+    async def find_one_and_update(self, filter, update, **kwargs):
+        self._encode_options(kwargs)
+        return decode_document(
+            await self._collection.find_one_and_update(encode_filter(filter), encode_update(update), **kwargs)
+        )
+
+    async def find_one_and_delete(self, filter, **kwargs):
+        self._encode_options(kwargs)
+        return decode_document(await self._collection.find_one_and_delete(encode_filter(filter), **kwargs))
+
+    @staticmethod
+    def _encode_options(kwargs: Dict[str, Any]) -> None:
+        if kwargs.get("projection"):
+            kwargs["projection"] = encode_projection(kwargs["projection"])
+        if kwargs.get("sort"):
+            kwargs["sort"] = encode_sort(kwargs["sort"])
+
+    async def insert_one(self, document, **kwargs):
+        return await self._collection.insert_one(encode_document(document), **kwargs)
+
+    async def insert_many(self, documents, **kwargs):
+        return await self._collection.insert_many([encode_document(document) for document in documents], **kwargs)
+
+    async def update_one(self, filter, update, **kwargs):
+        return await self._collection.update_one(encode_filter(filter), encode_update(update), **kwargs)
+
+    async def update_many(self, filter, update, **kwargs):
+        return await self._collection.update_many(encode_filter(filter), encode_update(update), **kwargs)
+
+    async def delete_one(self, filter, **kwargs):
+        return await self._collection.delete_one(encode_filter(filter), **kwargs)
+
+    async def delete_many(self, filter, **kwargs):
+        return await self._collection.delete_many(encode_filter(filter), **kwargs)
+
+    async def count_documents(self, filter, **kwargs):
+        return await self._collection.count_documents(encode_filter(filter), **kwargs)
+
+    async def bulk_write(self, requests, **kwargs):
+        return await self._collection.bulk_write([_encode_request(request) for request in requests], **kwargs)
+
+    def aggregate(self, pipeline, **kwargs) -> CompactCursor:
+        return CompactCursor(self._collection.aggregate(encode_pipeline(pipeline), **kwargs))
+
+    def watch(self, pipeline=None, **kwargs) -> CompactChangeStream:
+        return CompactChangeStream(self._collection.watch(pipeline, **kwargs))
+
+
+class CompactDatabase:
+    """Motor database whose users, couples and events use the compact layout"""
+
+    def __init__(self, database):
+        self._database = database
+        self._collections = {name: CompactCollection(database[name]) for name in COMPACT_COLLECTIONS}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._collections:
+            return self._collections[name]
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        return self._collections.get(name) or self._database[name]
+
+
+def storage_database(database, layout: str):
+    """The database as the routes should see it for the given storage layout"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown storage layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    return CompactDatabase(database) if layout == "compact" else database
+
+
+async def migrate_to_compact(database, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Rewrite users, couples and events in the compact layout. Safe to rerun:
+    collections without ObjectId documents left are skipped (the _id of
+    ids that aren't UUIDs stays a string), and a half-built replacement
+    from an interrupted run is rebuilt.
+    """
+    migrated = {}
+    existing = set(await database.list_collection_names())
+    for name in COMPACT_COLLECTIONS:
+        staging_name = f"{name}_compact_migration"
+        if name not in existing:
+            # Interrupted between the two renames
+            if staging_name in existing and not dry_run:
+                await database[staging_name].rename(name)
+            continue
+        source = database[name]
+        pending = {"_id": {"$type": "objectId"}}
+        if dry_run:
+            migrated[name] = await source.count_documents(pending)
+            continue
+        if not await source.find_one(pending, {"_id": 1}):
+            migrated[name] = 0
+            continue
+
+        await database.drop_collection(staging_name)
+        staging = database[staging_name]
+
+        count, batch = 0, []
+        async for document in source.find({}, batch_size=batch_size):
+            batch.append(encode_document(document))
+            if len(batch) >= batch_size:
+                await staging.insert_many(batch, ordered=False)
+                count += len(batch)
+                batch = []
+        if batch:
+            await staging.insert_many(batch, ordered=False)
+            count += len(batch)
+
+        backup_name = f"{name}_objectid_backup"
+        if count:
+            await source.rename(backup_name)
+            await staging.rename(name)
+        migrated[name] = count
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Migrate stored documents to the compact layout")
+    parser.add_argument("--migrate", action="store_true", help="Convert users, couples and events")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the documents to convert")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.error("nothing to do; pass --migrate")
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        try:
+            database = client[os.environ['DB_NAME']]
+            migrated = await migrate_to_compact(database, args.batch_size, args.dry_run)
+        finally:
+            client.close()
+        verb = "Would convert" if args.dry_run else "Converted"
+        for name, count in migrated.items():
+            print(f"{verb} {count} {name}")
+        if not args.dry_run:
+            print("Originals kept as <collection>_objectid_backup; start the app with STORAGE_LAYOUT=compact")
+
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Write-behind buffering of FCM token updates.
+
+Clients re-register their push token on every app start, so PUT
+/api/users/{auth_id}/token sees bursts of small writes, most of them
+repeating a token the user already has. TokenWriteBuffer collects the
+updates arriving within `window` seconds of the first one, keeping only
+the latest token per auth_id, and writes them with one unordered
+bulk_write.
+
+At most max_pending auth_ids are held; an update for another one waits
+until the pending batch is written. A failed or interrupted write puts
+its updates back unless newer ones arrived meanwhile, and stop() writes
+whatever is left, so a worker shutting down doesn't lose accepted
+updates. Updates for auth_ids without a user match nothing and are
+dropped when written.
+
+fcm_token_updates_total and fcm_token_writes_total count the updates
+accepted and written; their ratio is how well updates coalesce.
+"""
+from typing import Dict, Optional
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from metrics import TOKEN_BUFFER_PENDING, TOKEN_UPDATES, TOKEN_WRITES
+
+logger = logging.getLogger(__name__)
+
+
+class TokenWriteBuffer:
+    def __init__(self, db, window: float = 1.0, max_pending: int = 10000):
+        self.db = db
+        self.window = window
+        self.max_pending = max_pending
+        self._pending: Dict[str, str] = {}
+        self._flushing = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def put(self, auth_id: str, token: str) -> None:
+        """Accept a token update, to be written with the next batch"""
+        TOKEN_UPDATES.inc()
+        if auth_id not in self._pending and len(self._pending) >= self.max_pending:
+            await self.flush()
+        self._pending[auth_id] = token
+        TOKEN_BUFFER_PENDING.set(len(self._pending))
+        # The first update of a batch starts its window
+        self._wake.set()
+
+    async def flush(self) -> int:
+        """Write the pending updates, returning how many were written"""
+        async with self._flushing:
+            self._wake.clear()
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                await self.db.users.bulk_write(
+                    [UpdateOne({"auth_id": auth_id}, {"$set": {"fcm_token": token}}) for auth_id, token in batch.items()],
+                    ordered=False
+                )
+            except BaseException:
+                # Retried with the next batch, behind any newer update
+                for auth_id, token in batch.items():
+                    self._pending.setdefault(auth_id, token)
+                self._wake.set()
+                raise
+            finally:
+                TOKEN_BUFFER_PENDING.set(len(self._pending))
+            TOKEN_WRITES.inc(len(batch))
+            return len(batch)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception(f"Could not write {len(self._pending)} buffered token updates")
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Token update flush failed")
+                # Don't spin on a failing database
+                await asyncio.sleep(self.window)
@@ -0,0 +1,63 @@
+"""
+Tombstones for deleted events, used by delta sync.
+
+Deleting an event records {id, couple_id, deleted_at} in event_tombstones
+so GET /api/events/changes can tell clients which events to drop. Clients
+only need tombstones newer than their sync token, so they are kept for
+TOMBSTONE_RETENTION; a sync token older than that gets a full resync
+instead. TombstoneCompactor is the background task deleting expired ones.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def record_tombstones(db, deleted: Dict[str, str]) -> None:
+    """Record deleted events, given as a map of event id to couple id"""
+    if not deleted:
+        return
+    deleted_at = datetime.utcnow()
+    await db.event_tombstones.insert_many([
+        {"id": event_id, "couple_id": couple_id, "deleted_at": deleted_at}
+        for event_id, couple_id in deleted.items()
+    ])
+
+
+class TombstoneCompactor:
+    def __init__(self, db, retention: timedelta, interval: timedelta = timedelta(hours=1)):
+        self.db = db
+        self.retention = retention
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def compact(self) -> int:
+        """Delete tombstones past the retention window"""
+        result = await self.db.event_tombstones.delete_many(
+            {"deleted_at": {"$lt": datetime.utcnow() - self.retention}}
+        )
+        if result.deleted_count:
+            logger.info(f"Compacted {result.deleted_count} event tombstones")
+        return result.deleted_count
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.compact()
+            except Exception:
+                logger.exception("Tombstone compaction failed")
+            await asyncio.sleep(self.interval.total_seconds())
@@ -5,8 +5,8 @@ set -e
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# Start Uvicorn (a single worker unless WEB_CONCURRENCY is set)
+HOST=0.0.0.0 PORT=8001 python server.py &
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
@@ -0,0 +1,79 @@
+"""
+Shared fixtures for the backend tests.
+
+Tests run against the modules in backend/ and are async through anyio's
+pytest plugin (`pytestmark = pytest.mark.anyio`). Two databases are
+available:
+
+    mongo_db  a real MongoDB at MONGO_URL (default localhost), for what
+              only the server can answer, like query plans. The tests
+              using it are skipped when no mongod is reachable.
+    api       an httpx client for the app over an in-memory mongomock
+              database, for route behaviour, in the storage layout given
+              by the storage_layout fixture (parametrize it to change it)
+
+Neither ever touches the database named by DB_NAME: mongo_db always uses
+TEST_DB_NAME and drops it afterwards.
+"""
+from pathlib import Path
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+TEST_DB_NAME = "lovetrack_test"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def mongo_db():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncIOMotorClient(
+        os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        serverSelectionTimeoutMS=1000
+    )
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"No MongoDB reachable: {e}")
+    await client.drop_database(TEST_DB_NAME)
+    yield client[TEST_DB_NAME]
+    await client.drop_database(TEST_DB_NAME)
+    client.close()
+
+
+@pytest.fixture
+def storage_layout():
+    return "objectid"
+
+
+@pytest.fixture
+async def api(monkeypatch, storage_layout):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    database = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(server, "AsyncIOMotorClient", lambda *args, **kwargs: database)
+    monkeypatch.setattr(server, "db_name", TEST_DB_NAME)
+    monkeypatch.setattr(server, "STORAGE_LAYOUT", storage_layout)
+    monkeypatch.setattr(server, "LIVE_UPDATES_SOURCE", "local")
+    monkeypatch.setattr(server, "RATE_LIMITS_ENABLED", False)
+    monkeypatch.setattr(server, "REMINDERS_ENABLED", False)
+    monkeypatch.setattr(server, "ARCHIVE_ENABLED", False)
+    server.read_cache.clear()
+
+    app = server.create_app()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import RateBudget, RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+def test_token_bucket_spends_from_every_key_or_none():
+    limiter = RateLimiter({"writes": RateBudget(rate=1, burst=2)})
+    assert limiter.acquire("writes", ["ip:1"]) == 0
+    assert limiter.acquire("writes", ["ip:1", "auth:a"]) == 0
+    # ip:1 is dry, so auth:a isn't charged either
+    assert limiter.acquire("writes", ["ip:1", "auth:a"]) == pytest.approx(1, abs=0.01)
+    assert limiter.acquire("writes", ["auth:a"]) == 0
+    # Costs above the burst are capped to it
+    assert limiter.acquire("writes", ["ip:2"], cost=5) == 0
+
+
+async def test_rate_limited_route_answers_429(api, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "RATE_LIMITS_ENABLED", True)
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter({"couples:create": RateBudget(rate=0.05, burst=2)}))
+    couple = {"created_by": "a", "start_date": "2024-01-01T00:00:00"}
+    for _ in range(2):
+        assert (await api.post("/api/couples", json=couple)).status_code == 200
+
+    response = await api.post("/api/couples", json=couple)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "20"
+
+
+async def test_long_pool_waits_shed_api_requests(api, monkeypatch):
+    import server
+
+    clock = SimpleNamespace(monotonic=lambda: 100.0)
+    monkeypatch.setattr(admission, "time", clock)
+    monitor = server.pool_wait_monitor
+    monitor.connection_check_out_started(None)
+    try:
+        clock.monotonic = lambda: 100.0 + server.MAX_POOL_WAIT_MS / 1000 + 0.1
+        response = await api.get("/api/")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        # Ops endpoints aren't shed
+        assert (await api.get("/healthz")).status_code == 200
+    finally:
+        monitor.connection_checked_out(None)
+    assert (await api.get("/api/")).status_code == 200
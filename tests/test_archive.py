@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+DATES = ["2020-01-05T10:00:00", "2020-03-01T10:00:00", "2030-01-01T00:00:00"]
+
+
+async def archived_couple(api) -> str:
+    import server
+
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": "2019-01-01T00:00:00"})).json()
+    for i, date in enumerate(DATES):
+        await api.post("/api/events", json={"couple_id": couple["id"], "title": f"m{i}", "date": date})
+    # The first run sets the couple's horizon, the second archives behind it
+    await server.event_archiver.archive()
+    assert await server.event_archiver.archive() == 2
+    server.read_cache.clear()
+    return couple["id"]
+
+
+async def test_offset_bounds_across_the_archive(api):
+    import server
+
+    couple_id = await archived_couple(api)
+    couple = await server.db.couples.find_one({"id": couple_id})
+    events, _ = await server.load_events(
+        couple_id,
+        datetime(2020, 2, 1, tzinfo=timezone.utc),
+        datetime(2031, 1, 1, tzinfo=timezone.utc),
+        None, None, None, couple["archived_until"]
+    )
+    assert [event["title"] for event in events] == ["m1", "m2"]
+
+    response = await api.get("/api/events", params={"couple_id": couple_id, "from": "2020-02-01T00:00:00Z"})
+    assert response.status_code == 200
+    assert [event["title"] for event in response.json()] == ["m1", "m2"]
+
+
+async def test_concurrent_archivers_archive_each_event_once(api):
+    import anyio
+    import server
+    from archive import EventArchiver
+
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": "2019-01-01T00:00:00"})).json()
+    for i, date in enumerate(DATES):
+        await api.post("/api/events", json={"couple_id": couple["id"], "title": f"m{i}", "date": date})
+    await server.event_archiver.archive()
+
+    # Let the other archiver run between each archive write
+    event_archive = type(server.db.event_archive)
+    update_one = event_archive.update_one
+
+    async def interleaved_update_one(self, *args, **kwargs):
+        await anyio.sleep(0)
+        return await update_one(self, *args, **kwargs)
+
+    archivers = [EventArchiver(server.db, server.ARCHIVE_AFTER) for _ in range(2)]
+    try:
+        event_archive.update_one = interleaved_update_one
+        async with anyio.create_task_group() as tasks:
+            for archiver in archivers:
+                tasks.start_soon(archiver.archive)
+    finally:
+        event_archive.update_one = update_one
+
+    server.read_cache.clear()
+    response = await api.get("/api/events", params={"couple_id": couple["id"]})
+    assert [event["title"] for event in response.json()] == ["m0", "m1", "m2"]
+    assert (await server.db.couples.find_one({"id": couple["id"]})).get("archive_lease") is None
+
+
+async def test_archived_events_by_id_with_archiving_turned_off(api):
+    import server
+
+    assert not server.ARCHIVE_ENABLED
+    couple_id = await archived_couple(api)
+    events = (await api.get("/api/events", params={"couple_id": couple_id})).json()
+    first, second = events[0]["id"], events[1]["id"]
+
+    assert (await api.get(f"/api/events/{first}")).json()["title"] == "m0"
+    response = await api.put(f"/api/events/{first}", json={"title": "m0 edited"})
+    assert response.status_code == 200
+    assert (await api.delete(f"/api/events/{second}")).status_code == 200
+
+    response = await api.get("/api/events", params={"couple_id": couple_id})
+    assert [event["title"] for event in response.json()] == ["m0 edited", "m2"]
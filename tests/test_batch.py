@@ -0,0 +1,78 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_couple(api) -> str:
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+async def titles(api, couple_id: str) -> list:
+    response = await api.get("/api/events", params={"couple_id": couple_id})
+    return [event["title"] for event in response.json()]
+
+
+def statuses(response) -> list:
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == list(range(len(results)))
+    return [result["status"] for result in results]
+
+
+@pytest.mark.parametrize("ordered, expected", [(False, [201, 422, 201]), (True, [201, 422, 424])])
+async def test_batch_create(api, ordered, expected):
+    couple_id = await create_couple(api)
+    response = await api.post("/api/events:batch", json={"ordered": ordered, "events": [
+        {"couple_id": couple_id, "title": "one", "date": "2024-01-01T19:00:00"},
+        {"couple_id": couple_id, "date": "2024-01-02T19:00:00"},
+        {"couple_id": couple_id, "title": "three", "date": "2024-01-03T19:00:00"},
+    ]})
+    assert statuses(response) == expected
+    results = response.json()["results"]
+    assert "title" in results[1]["error"]
+    if ordered:
+        assert results[2]["error"].startswith("Not applied")
+    assert await titles(api, couple_id) == ["one", "three"][:expected.count(201)]
+
+
+async def test_batch_create_rejects_a_bad_series_item(api):
+    couple_id = await create_couple(api)
+    response = await api.post("/api/events:batch", json={"events": [
+        {"couple_id": couple_id, "title": "one", "date": "2024-01-01T19:00:00"},
+        {"couple_id": couple_id, "title": "series", "date": "2024-01-02T19:00:00",
+         "recurrence": {"freq": "weekly", "until": "2023-01-01T00:00:00"}},
+    ]})
+    assert statuses(response) == [201, 422]
+    assert await titles(api, couple_id) == ["one"]
+
+
+async def create_events(api, couple_id: str, *names: str) -> list:
+    response = await api.post("/api/events:batch", json={"events": [
+        {"couple_id": couple_id, "title": name, "date": f"2024-01-0{day}T19:00:00"}
+        for day, name in enumerate(names, start=1)
+    ]})
+    return [result["id"] for result in response.json()["results"]]
+
+
+@pytest.mark.parametrize("ordered, expected", [(False, [200, 404, 200]), (True, [200, 404, 424])])
+async def test_batch_update(api, ordered, expected):
+    couple_id = await create_couple(api)
+    first, second = await create_events(api, couple_id, "one", "two")
+    response = await api.post("/api/events:batchUpdate", json={"ordered": ordered, "events": [
+        {"id": first, "title": "one edited"},
+        {"id": "missing", "title": "nothing"},
+        {"id": second, "title": "two edited"},
+    ]})
+    assert statuses(response) == expected
+    assert [result["id"] for result in response.json()["results"]][:2] == [first, "missing"]
+    assert await titles(api, couple_id) == ["one edited", "two edited" if not ordered else "two"]
+
+
+@pytest.mark.parametrize("ordered, expected", [(False, [200, 404, 200]), (True, [200, 404, 424])])
+async def test_batch_delete(api, ordered, expected):
+    couple_id = await create_couple(api)
+    first, second, third = await create_events(api, couple_id, "one", "two", "three")
+    response = await api.post("/api/events:batchDelete", json={"ordered": ordered, "ids": [first, "missing", third]})
+    assert statuses(response) == expected
+    assert await titles(api, couple_id) == (["two", "three"] if ordered else ["two"])
@@ -0,0 +1,71 @@
+from functools import partial
+
+import anyio
+import pytest
+
+from cache import CoupleCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_set_after_invalidation_is_dropped():
+    cache = CoupleCache()
+    generation = cache.generation()
+    cache.invalidate("c1")
+    cache.set("c1", "events", ["stale"], generation)
+    assert cache.get("c1", "events") is None
+
+    # Other couples' writes don't hold back a load
+    cache.set("c2", "events", ["fresh"], generation)
+    assert cache.get("c2", "events") == ["fresh"]
+
+    generation = cache.generation()
+    cache.set("c1", "events", ["fresh"], generation)
+    assert cache.get("c1", "events") == ["fresh"]
+
+
+def test_forgotten_invalidations_still_drop_older_loads():
+    cache = CoupleCache(max_couples=1)
+    generation = cache.generation()
+    cache.invalidate("c1")
+    cache.invalidate("c2")
+    cache.set("c1", "events", ["stale"], generation)
+    assert cache.get("c1", "events") is None
+
+
+async def test_read_overtaken_by_write_is_not_cached(api, monkeypatch):
+    import server
+
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})).json()
+    params = {"couple_id": couple["id"]}
+    loaded, release = anyio.Event(), anyio.Event()
+    load_events = server.load_events
+
+    async def slow_load_events(*args, **kwargs):
+        result = await load_events(*args, **kwargs)
+        loaded.set()
+        await release.wait()
+        return result
+
+    monkeypatch.setattr(server, "load_events", slow_load_events)
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(partial(api.get, "/api/events", params=params))
+        await loaded.wait()
+        created = await api.post(
+            "/api/events", json={"couple_id": couple["id"], "title": "Dinner", "date": "2024-02-01T19:00:00"}
+        )
+        assert created.status_code == 200
+        release.set()
+    monkeypatch.setattr(server, "load_events", load_events)
+
+    response = await api.get("/api/events", params=params)
+    assert [event["title"] for event in response.json()] == ["Dinner"]
+    again = await api.get("/api/events", params=params, headers={"If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304
+
+
+async def test_cache_stats_are_not_published_under_api(api):
+    assert (await api.get("/api/cache/stats")).status_code == 404
+    response = await api.get("/cache/stats")
+    assert response.status_code == 200
+    assert "single_flight" in response.json()
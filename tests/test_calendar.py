@@ -0,0 +1,102 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_couple(api) -> str:
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+@pytest.mark.parametrize("recurrence", [None, {"freq": "yearly"}])
+async def test_last_month_there_is(api, recurrence):
+    couple_id = await create_couple(api)
+    await api.post("/api/events", json={
+        "couple_id": couple_id, "title": "Anniversary", "date": "2024-12-31T12:00:00", "recurrence": recurrence,
+    })
+
+    response = await api.get(f"/api/couples/{couple_id}/calendar", params={"year": 9999, "month": 12})
+    assert response.status_code == 200
+    days = response.json()["days"]
+    assert days == ([{"date": "9999-12-31", "count": 1, "titles": ["Anniversary"]}] if recurrence else [])
+
+
+@pytest.fixture
+def grouped_in_python(monkeypatch):
+    """
+    Mongomock can't run the month aggregation ($dateToString with a
+    timezone), so have every month grouped in Python, as months with
+    series or archived events are
+    """
+    import server
+
+    async def has_series(*args):
+        return True
+
+    monkeypatch.setattr(server, "has_series", has_series)
+
+
+async def create_events(api, couple_id: str, *events) -> None:
+    response = await api.post("/api/events:batch", json={"events": [
+        {"couple_id": couple_id, "title": title, "date": date, **fields} for title, date, fields in events
+    ]})
+    assert all(result["status"] == 201 for result in response.json()["results"])
+
+
+async def month(api, couple_id: str, **params):
+    return await api.get(f"/api/couples/{couple_id}/calendar", params={"year": 2024, "month": 2, **params})
+
+
+@pytest.mark.parametrize("with_series", [False, True])
+async def test_month_days_in_the_calendars_zone(api, grouped_in_python, with_series):
+    couple_id = await create_couple(api)
+    await create_events(
+        api, couple_id,
+        # 00:30 on Feb 1st in Berlin
+        ("Late", "2024-01-31T23:30:00", {}),
+        ("Breakfast", "2024-02-10T08:00:00", {}),
+        ("Lunch", "2024-02-10T12:00:00", {}),
+        ("Dinner", "2024-02-10T19:00:00", {}),
+        ("Drinks", "2024-02-10T21:00:00", {}),
+        ("March", "2024-03-01T12:00:00", {}),
+    )
+    if with_series:
+        # Weekly on Thursdays
+        await create_events(api, couple_id, ("Yoga", "2024-01-04T17:00:00", {"recurrence": {"freq": "weekly"}}))
+
+    response = await month(api, couple_id, tz="Europe/Berlin")
+    assert response.status_code == 200
+    days = {day["date"]: (day["count"], day["titles"]) for day in response.json()["days"]}
+    expected = {
+        "2024-02-01": (1, ["Late"]),
+        "2024-02-10": (4, ["Breakfast", "Lunch", "Dinner"]),
+    }
+    if with_series:
+        expected["2024-02-01"] = (2, ["Late", "Yoga"])
+        for day in ("08", "15", "22", "29"):
+            expected[f"2024-02-{day}"] = (1, ["Yoga"])
+    assert days == expected
+
+    assert (await month(api, couple_id, tz="Not/AZone")).status_code == 400
+
+
+async def test_month_etag(api, grouped_in_python):
+    couple_id = await create_couple(api)
+    await create_events(api, couple_id, ("Dinner", "2024-02-10T19:00:00", {}))
+
+    response = await month(api, couple_id)
+    etag = response.headers["etag"]
+    assert (await month(api, couple_id, tz="UTC")).headers["etag"] == etag
+    response = await api.get(
+        f"/api/couples/{couple_id}/calendar", params={"year": 2024, "month": 2}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert (await month(api, couple_id, tz="Europe/Berlin")).headers["etag"] != etag
+
+    # Any event write changes the tag
+    await create_events(api, couple_id, ("Lunch", "2024-02-11T12:00:00", {}))
+    response = await api.get(
+        f"/api/couples/{couple_id}/calendar", params={"year": 2024, "month": 2}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert [day["date"] for day in response.json()["days"]] == ["2024-02-10", "2024-02-11"]
@@ -0,0 +1,26 @@
+import pytest
+
+from indexes import ensure_indexes, explain_route_queries
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_route_queries_use_indexes(mongo_db):
+    reports = await ensure_indexes(mongo_db)
+    assert not [report.errors for report in reports if report.errors]
+
+    results = await explain_route_queries(mongo_db)
+    unindexed = [
+        f"{result['collection']} {result['filter']}: {' -> '.join(result['stages'])}"
+        for result in results if not result["uses_index"]
+    ]
+    assert not unindexed, "Route queries without an index:\n" + "\n".join(unindexed)
+
+
+async def test_compact_layout_route_queries_use_indexes(mongo_db):
+    from storage import storage_database
+
+    db = storage_database(mongo_db, "compact")
+    await ensure_indexes(db, layout="compact")
+    results = await explain_route_queries(db)
+    assert all(result["uses_index"] for result in results), results
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from live import LiveUpdates
+
+pytestmark = pytest.mark.anyio
+
+
+async def local_updates(**settings) -> LiveUpdates:
+    updates = LiveUpdates(json.dumps, **settings)
+    await updates.start(None, "local")
+    return updates
+
+
+def drain(subscription) -> list:
+    messages = []
+    while not subscription.queue.empty():
+        messages.append(subscription.queue.get_nowait())
+    return [(message.event, message.data) for message in messages]
+
+
+async def test_local_fan_out_to_a_couples_subscribers():
+    updates = await local_updates()
+    first, second, other = updates.subscribe("c"), updates.subscribe("c"), updates.subscribe("d")
+
+    updates.publish_local("c", "created", "e1", {"id": "e1"})
+    updates.publish_local("c", "deleted", "e2")
+    expected = [("created", '{"id": "e1"}'), ("deleted", '{"id": "e2"}')]
+    assert drain(first) == expected
+    assert drain(second) == expected
+    assert drain(other) == []
+
+    updates.unsubscribe(first)
+    updates.publish_local("c", "deleted", "e3")
+    assert drain(first) == []
+    assert updates.subscriber_count == 2
+
+
+async def test_overflowing_subscriber_gets_reset():
+    updates = await local_updates(queue_size=2)
+    slow = updates.subscribe("c")
+    stream = updates.stream("c")
+    assert (await stream.__anext__()).startswith("retry:")
+
+    for index in range(4):
+        updates.publish_local("c", "deleted", f"e{index}")
+    assert drain(slow) == [("reset", "{}")]
+    updates.publish_local("c", "deleted", "e4")
+    assert drain(slow) == []
+
+    # The stream's own queue overflowed too: it sends the reset and ends
+    assert (await stream.__anext__()).startswith("id: \nevent: reset\n")
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert updates.subscriber_count == 1
+
+
+async def test_reconnect_replays_missed_messages():
+    updates = await local_updates(history_size=2)
+    for index in range(3):
+        updates.publish_local("c", "deleted", f"e{index}")
+    history = list(updates._channels["c"].history)
+
+    replayed = updates.subscribe("c", last_event_id=history[0].id)
+    assert drain(replayed) == [("deleted", '{"id": "e2"}')]
+    # e0 fell out of the history, so its id can't be resumed from
+    assert drain(updates.subscribe("c", last_event_id="gone")) == [("reset", "{}")]
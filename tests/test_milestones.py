@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from milestones import add_months, relationship_stats
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("value, months, expected", [
+    (datetime(2024, 1, 31), 1, datetime(2024, 2, 29)),
+    (datetime(2023, 1, 31), 1, datetime(2023, 2, 28)),
+    (datetime(2024, 11, 15, 8), 3, datetime(2025, 2, 15, 8)),
+    (datetime(2024, 2, 29), 12, datetime(2025, 2, 28)),
+])
+def test_add_months(value, months, expected):
+    assert add_months(value, months) == expected
+
+
+def test_relationship_stats():
+    stats = relationship_stats(datetime(2023, 1, 31), datetime(2024, 3, 15))
+    # 13 calendar months reach Feb 29th, then 15 days remain
+    assert (stats["days_together"], stats["years"], stats["months"], stats["days"]) == (409, 1, 1, 15)
+    assert stats["next_milestones"] == [
+        {"label": "500 days", "date": datetime(2024, 6, 14), "days_until": 91},
+        {"label": "2 years", "date": datetime(2025, 1, 31), "days_until": 322},
+    ]
+
+
+def test_relationship_stats_before_the_start():
+    start = datetime(2024, 6, 1)
+    stats = relationship_stats(start, start - timedelta(days=10))
+    assert (stats["days_together"], stats["years"], stats["months"], stats["days"]) == (0, 0, 0, 0)
+    assert stats["next_milestones"] == [
+        {"label": "100 days", "date": datetime(2024, 9, 9), "days_until": 110},
+        {"label": "1 year", "date": datetime(2025, 6, 1), "days_until": 375},
+    ]
+
+
+async def test_dashboard(api):
+    start = (datetime.utcnow() - timedelta(days=99, hours=1)).replace(microsecond=0)
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": start.isoformat()})).json()
+    soon = (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0)
+    for offset, title in ((-1, "past"), (1, "soon"), (2, "later")):
+        await api.post("/api/events", json={
+            "couple_id": couple["id"], "title": title, "date": (soon + timedelta(days=offset - 1)).isoformat(),
+        })
+
+    response = await api.get(f"/api/couples/{couple['id']}/dashboard", params={"upcoming": 1})
+    assert response.status_code == 200
+    dashboard = response.json()
+    assert [event["title"] for event in dashboard["upcoming_events"]] == ["soon"]
+    assert dashboard["stats"]["days_together"] == 99
+    assert dashboard["stats"]["next_milestones"][0]["label"] == "100 days"
+    assert dashboard["stats"]["next_milestones"][0]["days_until"] == 0
+
+    assert (await api.get("/api/couples/missing/dashboard")).status_code == 404
@@ -0,0 +1,101 @@
+import msgpack
+from prometheus_client import REGISTRY
+import pytest
+
+from negotiation import choose_encoding, prefers_msgpack
+
+pytestmark = pytest.mark.anyio
+
+
+def requests_total(method: str, route: str, status: str) -> float:
+    labels = {"method": method, "route": route, "status": status}
+    return REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+
+async def test_msgpack_requests_are_counted_by_route(api):
+    before = requests_total("POST", "/api/couples", "200")
+    response = await api.post(
+        "/api/couples",
+        content=msgpack.packb({"created_by": "a", "start_date": "2024-01-01T00:00:00"}),
+        headers={"Content-Type": "application/msgpack"},
+    )
+    assert response.status_code == 200
+    assert requests_total("POST", "/api/couples", "200") == before + 1
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+    ("gzip;q=0", None),
+])
+def test_choose_encoding(accept_encoding, expected):
+    pytest.importorskip("brotli")
+    assert choose_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("application/msgpack", True),
+    ("application/json, application/msgpack", True),
+    ("application/msgpack;q=0.5, application/json", False),
+    ("*/*", False),
+])
+def test_prefers_msgpack(accept, expected):
+    assert prefers_msgpack(accept) is expected
+
+
+async def create_couple(api) -> str:
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+async def test_msgpack_round_trip(api):
+    couple_id = await create_couple(api)
+    response = await api.post(
+        "/api/events",
+        content=msgpack.packb({"couple_id": couple_id, "title": "Dinner", "date": "2024-01-01T19:00:00"}),
+        headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    event = msgpack.unpackb(response.content)
+    assert (event["title"], event["date"]) == ("Dinner", "2024-01-01T19:00:00")
+
+    response = await api.get("/api/events", params={"couple_id": couple_id}, headers={"Accept": "application/msgpack"})
+    assert [event["id"] for event in msgpack.unpackb(response.content)] == [event["id"]]
+    assert "Accept" in response.headers["vary"]
+
+
+async def test_invalid_msgpack_body(api):
+    response = await api.post("/api/events", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("coding", ["gzip", "br"])
+async def test_compression_and_weak_etags(api, coding):
+    if coding == "br":
+        pytest.importorskip("brotli")
+    couple_id = await create_couple(api)
+    await api.post("/api/events:batch", json={"events": [
+        {"couple_id": couple_id, "title": f"Event {day}", "date": f"2024-01-{day:02d}T19:00:00"}
+        for day in range(1, 29)
+    ]})
+
+    params = {"couple_id": couple_id}
+    response = await api.get("/api/events", params=params, headers={"Accept-Encoding": coding})
+    assert response.headers["content-encoding"] == coding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 28
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    # The compressed representation's weak tag and the identity one both match
+    for tag in (etag, etag[2:]):
+        response = await api.get("/api/events", params=params, headers={"Accept-Encoding": coding, "If-None-Match": tag})
+        assert response.status_code == 304
+
+    response = await api.get("/api/events", params=params, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == etag[2:]
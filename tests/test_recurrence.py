@@ -0,0 +1,276 @@
+from datetime import datetime, timedelta
+import base64
+import json
+
+import pytest
+
+from recurrence import due_reminders, expand_series, is_occurrence, occurrence_dates, occurrence_id, series_end
+
+pytestmark = pytest.mark.anyio
+
+
+def dates(*stamps: str):
+    return [datetime.fromisoformat(stamp) for stamp in stamps]
+
+
+def test_occurrences_keep_wall_clock_time_across_dst():
+    # 19:00 in Berlin is 18:00 UTC in winter and 17:00 UTC in summer
+    recurrence = {"freq": "weekly", "count": 3, "tz": "Europe/Berlin"}
+    assert list(occurrence_dates(datetime(2024, 3, 18, 18), recurrence)) == dates(
+        "2024-03-18T18:00", "2024-03-25T18:00", "2024-04-01T17:00"
+    )
+
+
+@pytest.mark.parametrize("start, freq, expected", [
+    ("2024-01-31T12:00", "monthly", ["2024-01-31T12:00", "2024-03-31T12:00", "2024-05-31T12:00"]),
+    ("2024-02-29T12:00", "yearly", ["2024-02-29T12:00", "2028-02-29T12:00", "2032-02-29T12:00"]),
+])
+def test_occurrences_skip_missing_days(start, freq, expected):
+    recurrence = {"freq": freq, "count": 3}
+    assert list(occurrence_dates(datetime.fromisoformat(start), recurrence)) == dates(*expected)
+
+
+def test_occurrences_end_at_until_inclusive():
+    recurrence = {"freq": "daily", "interval": 2, "until": datetime(2024, 1, 5, 12)}
+    assert list(occurrence_dates(datetime(2024, 1, 1, 12), recurrence)) == dates(
+        "2024-01-01T12:00", "2024-01-03T12:00", "2024-01-05T12:00"
+    )
+
+
+@pytest.mark.parametrize("recurrence", [
+    {"freq": "daily", "interval": 3},
+    {"freq": "weekly", "interval": 2, "tz": "Europe/Berlin"},
+    {"freq": "monthly"},
+    {"freq": "yearly"},
+    {"freq": "weekly", "count": 200},
+])
+def test_occurrences_in_window_match_the_full_series(recurrence):
+    start = datetime(2020, 1, 31, 19)
+    window_start, window_end = datetime(2022, 3, 27), datetime(2024, 3, 1)
+    walked = [
+        date for date in occurrence_dates(start, recurrence, window_end=window_end)
+        if date >= window_start
+    ]
+    assert walked
+    assert list(occurrence_dates(start, recurrence, window_start, window_end)) == walked
+
+
+@pytest.mark.parametrize("recurrence, expected", [
+    ({"freq": "weekly"}, None),
+    ({"freq": "weekly", "count": 3}, datetime(2024, 2, 14, 19)),
+    ({"freq": "weekly", "until": datetime(2024, 3, 1)}, datetime(2024, 2, 28, 19)),
+    ({"freq": "monthly", "until": datetime(2024, 4, 30)}, datetime(2024, 3, 31, 19)),
+    ({"freq": "yearly", "until": datetime(2031, 12, 31)}, datetime(2028, 2, 29, 19)),
+])
+def test_series_end(recurrence, expected):
+    start = datetime(2024, 2, 29, 19) if recurrence["freq"] == "yearly" else datetime(2024, 1, 31, 19)
+    assert series_end(start, recurrence) == expected
+
+
+def test_series_end_at_the_last_representable_year():
+    # Walks that run past year 9999 end there rather than skipping ahead
+    assert series_end(datetime(2024, 1, 1), {"freq": "yearly", "count": 10000}) == datetime(9999, 1, 1)
+    assert list(occurrence_dates(datetime(2024, 1, 1), {"freq": "yearly", "interval": 1000})) == [
+        datetime(2024 + 1000 * n, 1, 1) for n in range(8)
+    ]
+
+
+@pytest.mark.parametrize("tz, expected", [("UTC", True), ("America/New_York", True), ("Asia/Tokyo", False)])
+def test_occurrence_in_year_9999(tz, expected):
+    series = {"id": "m", "date": datetime(2024, 12, 31, 23), "recurrence": {"freq": "yearly", "tz": tz}}
+    assert is_occurrence(series, datetime(9999, 12, 31, 23)) is expected
+
+def master(**fields) -> dict:
+    return {
+        "id": "m", "couple_id": "c", "title": "Date night", "date": datetime(2024, 1, 1, 19),
+        "recurrence": {"freq": "weekly"}, **fields,
+    }
+
+
+def test_expand_series_leaves_out_cancelled_and_overridden():
+    series = master(recurrence={"freq": "weekly", "exdates": [datetime(2024, 1, 8, 19)]})
+    overridden = {occurrence_id("m", datetime(2024, 1, 15, 19))}
+    occurrences = expand_series([series], overridden, None, datetime(2024, 1, 30), None)
+    assert [event["date"] for event in occurrences] == dates("2024-01-01T19:00", "2024-01-22T19:00", "2024-01-29T19:00")
+    assert occurrences[0]["id"] == "m_20240101T190000"
+    assert occurrences[0]["recurrence_id"] == "m" and occurrences[0]["recurrence"] is None
+
+
+def test_expand_series_pages_in_date_and_id_order():
+    series = [master(), master(id="n", date=datetime(2024, 1, 2, 19))]
+    first = expand_series(series, set(), None, None, 3)
+    assert [event["id"] for event in first] == ["m_20240101T190000", "n_20240102T190000", "m_20240108T190000"]
+    after = (first[-1]["date"], first[-1]["id"])
+    following = expand_series(series, set(), after[0], None, 3, after)
+    assert [event["id"] for event in following] == ["n_20240109T190000", "m_20240115T190000", "n_20240116T190000"]
+
+
+def test_expand_series_caps_open_ended_reads():
+    from recurrence import RECURRENCE_EXPANSION_MAX
+
+    assert len(expand_series([master()], set(), None, None, None)) == RECURRENCE_EXPANSION_MAX
+
+
+def test_due_reminders():
+    series = master(
+        reminder_time=datetime(2024, 1, 1, 18),
+        recurrence={"freq": "weekly", "exdates": [datetime(2024, 1, 15, 19)]},
+        reminders_sent_until=datetime(2024, 1, 1, 19),
+    )
+    assert due_reminders(series, datetime(2024, 1, 1), datetime(2024, 1, 23)) == [
+        ("m_20240108T190000", datetime(2024, 1, 8, 18)),
+        ("m_20240122T190000", datetime(2024, 1, 22, 18)),
+    ]
+    assert due_reminders(master(), datetime(2024, 1, 1), datetime(2024, 1, 23)) == []
+
+
+async def create_couple(api) -> str:
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+async def create_series(api, couple_id: str, **recurrence) -> dict:
+    response = await api.post("/api/events", json={
+        "couple_id": couple_id, "title": "Date night", "date": "2024-01-01T19:00:00",
+        "recurrence": {"freq": "weekly", **recurrence},
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_offset_range_bounds(api):
+    couple_id = await create_couple(api)
+    await create_series(api, couple_id, count=4)
+
+    response = await api.get("/api/events", params={
+        "couple_id": couple_id, "from": "2024-01-08T00:00:00Z", "to": "2024-01-15T21:00:00+01:00",
+    })
+    assert response.status_code == 200
+    assert [event["date"] for event in response.json()] == ["2024-01-08T19:00:00", "2024-01-15T19:00:00"]
+
+
+async def test_date_change_reads_only_series(api, monkeypatch):
+    import server
+
+    couple_id = await create_couple(api)
+    event = (await api.post("/api/events", json={
+        "couple_id": couple_id, "title": "Dinner", "date": "2024-01-01T19:00:00",
+    })).json()
+    series = await create_series(api, couple_id, count=2)
+
+    events = type(server.db.events)
+    find_one = events.find_one
+    reads = []
+
+    async def counting_find_one(self, *args, **kwargs):
+        reads.append(args)
+        return await find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(events, "find_one", counting_find_one)
+    response = await api.put(f"/api/events/{event['id']}", json={"date": "2024-01-02T19:00:00"})
+    assert response.status_code == 200
+    assert response.json()["date"] == "2024-01-02T19:00:00"
+    assert reads == []
+
+    # Moving a series moves its stored end along
+    response = await api.put(f"/api/events/{series['id']}", json={"date": "2024-02-01T19:00:00"})
+    assert response.status_code == 200
+    assert len(reads) == 1
+    response = await api.get("/api/events", params={"couple_id": couple_id, "from": "2024-02-05T00:00:00"})
+    assert [event["date"] for event in response.json()] == ["2024-02-08T19:00:00"]
+
+
+async def test_edited_occurrence_is_moved(api):
+    couple_id = await create_couple(api)
+    series = await create_series(api, couple_id, count=3)
+    occurrence = f"{series['id']}_20240108T190000"
+
+    response = await api.put(f"/api/events/{occurrence}", json={"date": "2024-01-09T20:00:00"})
+    assert response.status_code == 200
+    assert response.json()["recurrence_id"] == series["id"]
+
+    response = await api.get("/api/events", params={"couple_id": couple_id})
+    assert [(event["id"], event["date"]) for event in response.json()] == [
+        (f"{series['id']}_20240101T190000", "2024-01-01T19:00:00"),
+        (occurrence, "2024-01-09T20:00:00"),
+        (f"{series['id']}_20240115T190000", "2024-01-15T19:00:00"),
+    ]
+
+
+async def test_deleted_occurrence_is_cancelled(api):
+    couple_id = await create_couple(api)
+    series = await create_series(api, couple_id, count=3)
+    occurrence = f"{series['id']}_20240108T190000"
+
+    assert (await api.delete(f"/api/events/{occurrence}")).status_code == 200
+    assert (await api.get(f"/api/events/{occurrence}")).status_code == 404
+    response = await api.get("/api/events", params={"couple_id": couple_id})
+    assert [event["date"] for event in response.json()] == ["2024-01-01T19:00:00", "2024-01-15T19:00:00"]
+
+
+async def test_paging_across_occurrences(api):
+    couple_id = await create_couple(api)
+    await create_series(api, couple_id, count=4)
+    await api.post("/api/events", json={"couple_id": couple_id, "title": "Dinner", "date": "2024-01-10T19:00:00"})
+
+    pages, cursor = [], None
+    while True:
+        params = {"couple_id": couple_id, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await api.get("/api/events", params=params)
+        assert response.status_code == 200
+        pages.append([event["date"][:10] for event in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [date for page in pages for date in page] == [
+        "2024-01-01", "2024-01-08", "2024-01-10", "2024-01-15", "2024-01-22"
+    ]
+    assert all(len(page) <= 2 for page in pages)
+
+
+async def test_occurrence_routes_in_year_9999(api):
+    couple_id = await create_couple(api)
+    series = (await api.post("/api/events", json={
+        "couple_id": couple_id, "title": "Anniversary", "date": "2024-12-31T23:00:00",
+        "recurrence": {"freq": "yearly", "interval": 1000},
+    })).json()
+    occurrence = f"{series['id']}_99991231T230000"
+
+    response = await api.get(f"/api/events/{occurrence}")
+    assert response.status_code == 404
+    response = await api.get(f"/api/events/{series['id']}_90241231T230000")
+    assert response.status_code == 200
+    assert response.json()["date"] == "9024-12-31T23:00:00"
+    response = await api.put(f"/api/events/{occurrence}", json={"title": "Later"})
+    assert response.status_code == 404
+
+
+async def test_unbounded_list_expands_series_up_to_the_horizon(api):
+    import server
+
+    couple_id = await create_couple(api)
+    await create_series(api, couple_id)
+
+    response = await api.get("/api/events", params={"couple_id": couple_id})
+    assert response.status_code == 200
+    last = datetime.fromisoformat(response.json()[-1]["date"])
+    horizon = datetime.utcnow() + timedelta(days=server.SERIES_HORIZON_DAYS)
+    assert horizon - timedelta(days=8) < last < horizon
+
+
+@pytest.mark.parametrize("key, status", [
+    (["2024-01-10T00:00:00+00:00", "a"], 200),
+    (["2024-01-10T00:00:00", 1], 400),
+    (["2024-01-10T00:00:00", None], 400),
+    (["not a date", "a"], 400),
+    ({"date": "2024-01-10T00:00:00"}, 400),
+])
+async def test_malformed_cursors(api, key, status):
+    couple_id = await create_couple(api)
+    await create_series(api, couple_id, count=4)
+    cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    response = await api.get("/api/events", params={"couple_id": couple_id, "limit": 2, "cursor": cursor})
+    assert response.status_code == status
+    if status == 200:
+        assert [event["date"] for event in response.json()] == ["2024-01-15T19:00:00", "2024-01-22T19:00:00"]
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from reminders import FakePushSender, ReminderDispatcher
+
+pytestmark = pytest.mark.anyio
+
+
+def seconds(value: datetime) -> datetime:
+    # Stored dates keep millisecond precision, occurrence ids whole seconds
+    return value.replace(microsecond=0)
+
+
+async def couple_with_tokens(api) -> str:
+    import server
+
+    for auth_id in ("a", "b"):
+        await api.post("/api/users", json={"auth_id": auth_id})
+        await api.put(f"/api/users/{auth_id}/token", json={"token": f"token-{auth_id}"})
+    await server.token_buffer.flush()
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})).json()
+    await api.post("/api/couples/join", json={"auth_id": "b", "code": couple["pairing_code"]})
+    return couple["id"]
+
+
+async def create_event(api, couple_id: str, date: datetime, reminder_time: datetime, **fields) -> dict:
+    response = await api.post("/api/events", json={
+        "couple_id": couple_id, "title": "Dinner", "date": date.isoformat(),
+        "reminder_time": reminder_time.isoformat(), **fields,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def dispatcher(server) -> ReminderDispatcher:
+    return ReminderDispatcher(server.db, FakePushSender())
+
+
+async def test_claimed_reminder_is_sent_once(api):
+    import server
+
+    couple_id = await couple_with_tokens(api)
+    now = seconds(datetime.utcnow())
+    event = await create_event(api, couple_id, now + timedelta(hours=1), now - timedelta(minutes=1))
+
+    first, second = dispatcher(server), dispatcher(server)
+    assert await first.dispatch([event["id"]]) == 1
+    assert await second.dispatch([event["id"]]) == 0
+    assert first.sender.sent == [{
+        "tokens": ["token-a", "token-b"],
+        "title": "Dinner",
+        "body": f'Your event "Dinner" is coming up at {(now + timedelta(hours=1)).strftime("%H:%M")} UTC.',
+        "data": {"eventId": event["id"], "coupleId": couple_id, "url": f"/calendar/{event['id']}"},
+    }]
+
+    # A sent reminder isn't queued again
+    await second.refill()
+    assert len(second.queue) == 0
+
+
+@pytest.mark.parametrize("expires_in, retaken", [(timedelta(minutes=-1), True), (timedelta(minutes=1), False)])
+async def test_expired_claim_is_retaken(api, expires_in, retaken):
+    import server
+
+    couple_id = await couple_with_tokens(api)
+    now = seconds(datetime.utcnow())
+    event = await create_event(api, couple_id, now + timedelta(hours=1), now - timedelta(minutes=1))
+    # Claimed by a worker that died before sending
+    await server.db.events.update_one(
+        {"id": event["id"]},
+        {"$set": {"reminder_claim": "dead", "reminder_claim_expires": now + expires_in}}
+    )
+
+    retaking = dispatcher(server)
+    await retaking.refill()
+    assert len(retaking.queue) == int(retaken)
+    assert await retaking.dispatch([event["id"]]) == int(retaken)
+
+
+async def test_series_reminder_advances_reminders_sent_until(api):
+    import server
+
+    couple_id = await couple_with_tokens(api)
+    now = seconds(datetime.utcnow())
+    occurrence_date = now + timedelta(minutes=10)
+    series = await create_event(
+        api, couple_id, occurrence_date - timedelta(weeks=1), occurrence_date - timedelta(weeks=1, minutes=15),
+        recurrence={"freq": "weekly"},
+    )
+
+    sending = dispatcher(server)
+    await sending.refill()
+    due = sending.queue.pop_due(datetime.utcnow())
+    assert due == [f"{series['id']}_{occurrence_date.strftime('%Y%m%dT%H%M%S')}"]
+    assert await sending.dispatch(due) == 1
+    master = await server.db.events.find_one({"id": series["id"]})
+    assert master["reminders_sent_until"] == occurrence_date
+
+    assert await dispatcher(server).dispatch(due) == 0
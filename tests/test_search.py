@@ -0,0 +1,68 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def couple_id(api, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "search_backend", "trigram")
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+async def create_event(api, couple_id: str, title: str, day: int, **fields) -> str:
+    response = await api.post("/api/events", json={
+        "couple_id": couple_id, "title": title, "date": f"2024-01-{day:02d}T19:00:00", **fields,
+    })
+    return response.json()["id"]
+
+
+async def search(api, couple_id: str, q: str, **params):
+    return await api.get("/api/events/search", params={"couple_id": couple_id, "q": q, **params})
+
+
+async def test_trigram_ranking(api, couple_id):
+    await create_event(api, couple_id, "Walk", 1, description="then dinner")
+    await create_event(api, couple_id, "Movie", 2, location="Dinner theatre")
+    await create_event(api, couple_id, "Dinner at the Café", 3)
+    await create_event(api, couple_id, "Dinner with friends", 4)
+    await create_event(api, couple_id, "Groceries", 5)
+
+    response = await search(api, couple_id, "dinner")
+    assert response.status_code == 200
+    # Title over location over description, newest first on ties
+    assert [event["title"] for event in response.json()] == [
+        "Dinner with friends", "Dinner at the Café", "Movie", "Walk"
+    ]
+    # Accents and case don't matter
+    assert [event["title"] for event in (await search(api, couple_id, "CAFE")).json()] == ["Dinner at the Café"]
+
+
+async def test_trigram_pagination(api, couple_id):
+    for day in range(1, 6):
+        await create_event(api, couple_id, f"Date night {day}", day)
+
+    titles, cursor = [], None
+    while True:
+        response = await search(api, couple_id, "date night", limit=2, **({"cursor": cursor} if cursor else {}))
+        assert len(response.json()) <= 2
+        titles += [event["title"] for event in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert titles == [f"Date night {day}" for day in range(5, 0, -1)]
+    assert (await search(api, couple_id, "date", cursor="bad")).status_code == 400
+
+
+async def test_search_sees_event_writes(api, couple_id):
+    event_id = await create_event(api, couple_id, "Museum", 1)
+    assert (await search(api, couple_id, "picnic")).json() == []
+
+    await create_event(api, couple_id, "Picnic", 2)
+    assert [event["title"] for event in (await search(api, couple_id, "picnic")).json()] == ["Picnic"]
+    await api.put(f"/api/events/{event_id}", json={"title": "Picnic by the lake"})
+    assert len((await search(api, couple_id, "picnic")).json()) == 2
+    await api.delete(f"/api/events/{event_id}")
+    assert [event["title"] for event in (await search(api, couple_id, "picnic")).json()] == ["Picnic"]
@@ -0,0 +1,64 @@
+from bson import Binary, ObjectId
+import pytest
+
+from storage import decode_document, encode_document, migrate_to_compact
+
+pytestmark = pytest.mark.anyio
+
+MASTER_ID = "0b6f6cbe-8f5e-4c44-9d4c-3c1a2f5d7e01"
+OVERRIDE_ID = f"{MASTER_ID}_20240108T190000"
+
+
+def test_ids_round_trip():
+    stored = encode_document({"id": MASTER_ID, "couple_id": MASTER_ID})
+    assert isinstance(stored["_id"], Binary) and isinstance(stored["couple_id"], Binary)
+    assert decode_document(stored) == {"id": MASTER_ID, "couple_id": MASTER_ID}
+
+    # Overrides of recurring events have ids that aren't UUIDs
+    stored = encode_document({"id": OVERRIDE_ID, "recurrence_id": MASTER_ID})
+    assert stored["_id"] == OVERRIDE_ID
+    assert decode_document(stored) == {"id": OVERRIDE_ID, "recurrence_id": MASTER_ID}
+
+
+def test_objectid_documents_keep_their_id():
+    object_id = ObjectId()
+    assert decode_document({"_id": object_id, "id": MASTER_ID}) == {"_id": object_id, "id": MASTER_ID}
+
+
+@pytest.mark.parametrize("storage_layout", ["compact"])
+async def test_compact_layout_overrides(api):
+    couple = (await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})).json()
+    master = (await api.post("/api/events", json={
+        "couple_id": couple["id"], "title": "Date night", "date": "2024-01-01T19:00:00",
+        "recurrence": {"freq": "weekly", "count": 3},
+    })).json()
+    occurrence_id = f"{master['id']}_20240108T190000"
+
+    updated = await api.put(f"/api/events/{occurrence_id}", json={"title": "Moved date night"})
+    assert updated.status_code == 200
+    assert updated.json()["id"] == occurrence_id
+
+    response = await api.get("/api/events", params={"couple_id": couple["id"]})
+    assert response.status_code == 200
+    assert [(event["id"], event["title"]) for event in response.json()] == [
+        (f"{master['id']}_20240101T190000", "Date night"),
+        (occurrence_id, "Moved date night"),
+        (f"{master['id']}_20240115T190000", "Date night"),
+    ]
+    assert (await api.get(f"/api/events/{occurrence_id}")).json()["title"] == "Moved date night"
+
+
+async def test_migration_is_rerunnable():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["lovetrack_test"]
+    await database.events.insert_many([
+        {"id": MASTER_ID, "couple_id": MASTER_ID, "recurrence": {"freq": "weekly"}},
+        {"id": OVERRIDE_ID, "couple_id": MASTER_ID, "recurrence_id": MASTER_ID},
+    ])
+
+    assert (await migrate_to_compact(database))["events"] == 2
+    assert (await migrate_to_compact(database))["events"] == 0
+    assert sorted(document["_id"] == OVERRIDE_ID for document in await database.events.find().to_list(None)) == [
+        False, True
+    ]
+    assert await database.events_objectid_backup.count_documents({}) == 2
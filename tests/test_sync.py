@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tombstones import TombstoneCompactor
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_couple(api) -> str:
+    response = await api.post("/api/couples", json={"created_by": "a", "start_date": "2024-01-01T00:00:00"})
+    return response.json()["id"]
+
+
+async def create_event(api, couple_id: str, title: str) -> str:
+    response = await api.post("/api/events", json={"couple_id": couple_id, "title": title, "date": "2024-01-01T19:00:00"})
+    return response.json()["id"]
+
+
+async def changes(api, couple_id: str, since=None) -> dict:
+    params = {"couple_id": couple_id, **({"since": since} if since else {})}
+    response = await api.get("/api/events/changes", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_delta_sync_sends_edits_and_tombstones(api):
+    couple_id = await create_couple(api)
+    kept, deleted = await create_event(api, couple_id, "kept"), await create_event(api, couple_id, "deleted")
+
+    initial = await changes(api, couple_id)
+    assert initial["full"]
+    assert sorted(event["title"] for event in initial["events"]) == ["deleted", "kept"]
+
+    await api.put(f"/api/events/{kept}", json={"title": "edited"})
+    await api.delete(f"/api/events/{deleted}")
+    delta = await changes(api, couple_id, initial["sync_token"])
+    assert not delta["full"]
+    assert [event["title"] for event in delta["events"]] == ["edited"]
+    assert delta["deleted"] == [deleted]
+
+
+async def test_invalid_sync_token(api):
+    couple_id = await create_couple(api)
+    response = await api.get("/api/events/changes", params={"couple_id": couple_id, "since": "not a token"})
+    assert response.status_code == 400
+
+
+async def test_tokens_past_retention_resync_in_full(api):
+    import server
+
+    couple_id = await create_couple(api)
+    deleted = await create_event(api, couple_id, "deleted")
+    await create_event(api, couple_id, "kept")
+    await api.delete(f"/api/events/{deleted}")
+
+    # Tombstones past the retention window are compacted away, so tokens
+    # that old can't be answered with a delta
+    now = datetime.utcnow()
+    await server.db.event_tombstones.update_one(
+        {"id": deleted}, {"$set": {"deleted_at": now - server.TOMBSTONE_RETENTION - timedelta(hours=1)}}
+    )
+    assert await TombstoneCompactor(server.db, server.TOMBSTONE_RETENTION).compact() == 1
+    assert await server.db.event_tombstones.count_documents({}) == 0
+
+    stale = server.encode_sync_token(now - server.TOMBSTONE_RETENTION - timedelta(minutes=1))
+    resync = await changes(api, couple_id, stale)
+    assert resync["full"]
+    assert [event["title"] for event in resync["events"]] == ["kept"]
+    assert resync["deleted"] == []
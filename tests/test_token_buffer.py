@@ -0,0 +1,63 @@
+import pytest
+
+from token_buffer import TokenWriteBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def database():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["lovetrack_test"]
+    await database.users.insert_many([{"auth_id": "a"}, {"auth_id": "b"}])
+    return database
+
+
+async def tokens(database) -> dict:
+    return {user["auth_id"]: user.get("fcm_token") async for user in database.users.find()}
+
+
+async def test_updates_coalesce_per_user(database):
+    buffer = TokenWriteBuffer(database)
+    await buffer.put("a", "first")
+    await buffer.put("a", "second")
+    await buffer.put("b", "only")
+    assert len(buffer) == 2
+
+    assert await buffer.flush() == 2
+    assert await tokens(database) == {"a": "second", "b": "only"}
+    assert await buffer.flush() == 0
+
+
+async def test_failed_write_is_retried_behind_newer_updates(database, monkeypatch):
+    buffer = TokenWriteBuffer(database)
+    await buffer.put("a", "old")
+    await buffer.put("b", "kept")
+
+    class Unavailable(Exception):
+        pass
+
+    async def failing_bulk_write(*args, **kwargs):
+        await buffer.put("a", "new")
+        raise Unavailable()
+
+    users = type(database.users)
+    bulk_write = users.bulk_write
+    monkeypatch.setattr(users, "bulk_write", failing_bulk_write)
+    with pytest.raises(Unavailable):
+        await buffer.flush()
+    monkeypatch.setattr(users, "bulk_write", bulk_write)
+
+    assert await buffer.flush() == 2
+    assert await tokens(database) == {"a": "new", "b": "kept"}
+
+
+async def test_stop_writes_pending_updates(database):
+    buffer = TokenWriteBuffer(database, window=60)
+    await buffer.start()
+    await buffer.put("a", "token")
+    assert await tokens(database) == {"a": None, "b": None}
+
+    await buffer.stop()
+    assert not buffer.running
+    assert await tokens(database) == {"a": "token", "b": None}